@@ -35,6 +35,7 @@ from accounts.serializers import (RequestOTPSerializer, VerifyOTPSerializer, Res
                                   AppVersionSerializer)
 from agency.models import SuperAgency, FieldAgent, Agency, Investment
 from p2pmb.models import MLMTree
+from payment_app.helpers import post_wallet
 from payment_app.models import UserWallet, Transaction
 from real_estate import settings
 
@@ -526,21 +527,22 @@ class VerifyAndUpdateProfile(APIView):
 
     def update_wallet_and_transaction_(self, user, verify_by, amount, remarks, commission_amount, is_not_super_agency=False):
         wallet, _ = UserWallet.objects.get_or_create(user=user)
-        wallet.main_wallet_balance += amount
-        if is_not_super_agency:
-            wallet.in_app_wallet += commission_amount
-            Transaction.objects.create(
-                created_by=user,
-                sender=user,
-                amount=commission_amount,
-                transaction_type='commission',
-                transaction_status='approved',
-                verified_by=verify_by,
-                verified_on=datetime.datetime.now(),
-                remarks=remarks,
-                payment_method='wallet'
-            )
-        wallet.save()
+        with transaction.atomic():
+            if is_not_super_agency:
+                commission_transaction = Transaction.objects.create(
+                    created_by=user,
+                    sender=user,
+                    amount=commission_amount,
+                    transaction_type='commission',
+                    transaction_status='approved',
+                    verified_by=verify_by,
+                    verified_on=datetime.datetime.now(),
+                    remarks=remarks,
+                    payment_method='wallet'
+                )
+                post_wallet(wallet, {'app_wallet_balance': commission_amount}, 'commission',
+                            source_id=commission_transaction.id, remarks=remarks)
+            post_wallet(wallet, {'main_wallet_balance': amount}, 'deposit', remarks=remarks)
 
     def update_transaction_of_user_(self, transaction_instance, request_user):
         if transaction_instance and transaction_instance.transaction_id:
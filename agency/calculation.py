@@ -1,12 +1,22 @@
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models import Sum
 
 from agency.models import SuperAgency, Agency, FieldAgent, PPDAccount, RewardEarned, AgencyPackagePurchase, Commission
+from master.helpers import background_job
 from master.models import RewardMaster
+from p2pmb.helpers import credit_wallets, get_or_create_wallet_ids, record_earnings
 from p2pmb.models import MLMTree
+from payment_app.helpers import post_wallet
 from payment_app.models import UserWallet, Transaction
+from utils.payout import BASIS_POINTS, PAISE_PER_RUPEE, apply_rates, paise_array, to_rupees
+
+RENT_RATE_BASIS_POINTS = 100  # 1% of the package amount every month
+PPD_RATE_BASIS_POINTS = {True: 100, False: 200}  # 1% once a property is purchased, 2% otherwise
+PPD_CHUNK_SIZE = 200
 
 
 class CommissionP2pmbCalculator:
@@ -58,121 +68,116 @@ class WithdrawalHandler:
         return amount * Decimal(0.05)  # 5% TDS deduction
 
 
-def distribute_monthly_rent_for_super_agency():
+def pay_monthly_rent(user_ids, applicable_for, description, remarks):
+    """
+    Pay the monthly 1% office rent of the given users' first completed `applicable_for` package for ten years,
+    once per month. Purchases, already paid users and wallets are preloaded, amounts are computed in paise for
+    all users at once and the rows are written in bulk. Returns the number of users paid.
+    """
     today = datetime.today().date()
     first_of_month = today.replace(day=1)
-
-    # if today != first_of_month:
-    #     return "Today is not the first of the month. No distribution performed."
-
-    super_agencies = SuperAgency.objects.filter(status='active')
-
-    for agency in super_agencies:
-        user = agency.profile.user
-
-        first_transaction = AgencyPackagePurchase.objects.filter(
-            user=user, package__isnull=False, buy_for='super_agency', status='completed', super_agency__isnull=False
-        ).last()
-
-        paid_amount = first_transaction.amount_paid
-        one_percent = paid_amount * Decimal('0.01')
-
-        if one_percent < 1:
+    now = datetime.now()
+    user_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+
+    first_transactions = {}
+    for user_id, amount_paid, purchased_at in AgencyPackagePurchase.objects.filter(
+            user_id__in=user_ids, package__isnull=False, buy_for=applicable_for, status='completed',
+            **{f'{applicable_for}__isnull': False}
+    ).values_list('user_id', 'amount_paid', 'purchased_at'):
+        first_transactions[user_id] = (amount_paid, purchased_at)  # ordered newest first, the oldest wins
+
+    already_paid = set(Commission.objects.filter(
+        commission_to_id__in=user_ids, commission_type='rent', earned_at__date=first_of_month,
+        applicable_for=applicable_for
+    ).values_list('commission_to_id', flat=True))
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+
+    payable = [user_id for user_id in user_ids if user_id in first_transactions]
+    paid = paise_array(first_transactions[user_id][0] for user_id in payable)
+    rents = dict(zip(payable, apply_rates(paid, [RENT_RATE_BASIS_POINTS] * len(payable))))
+    # Compared before rounding, a rent just under one rupee is not paid.
+    below_minimum = {
+        user_id for user_id, amount_paid in zip(payable, paid)
+        if amount_paid * RENT_RATE_BASIS_POINTS < PAISE_PER_RUPEE * BASIS_POINTS
+    }
+
+    credits = {}
+    for user_id in payable:
+        if user_id in below_minimum:
             continue
 
-        start_date = first_transaction.purchased_at.date() if first_transaction else today
+        start_date = first_transactions[user_id][1].date()
         end_date = start_date + timedelta(days=365 * 10)
 
         if not (start_date <= today <= end_date):
-            print(f"Rent payment period has ended for {user.username}. No distribution performed.")
+            print(f"Rent payment period has ended for {usernames.get(user_id)}. No distribution performed.")
             continue
 
-        rent_sent_this_month = Commission.objects.filter(
-            commission_to=user, commission_type='rent', earned_at__date=first_of_month,
-            applicable_for='super_agency'
-        ).exists()
-
-        if rent_sent_this_month:
-            print(f"Rent already sent this month for {user.username}.")
+        if user_id in already_paid:
+            print(f"Rent already sent this month for {usernames.get(user_id)}.")
             continue
 
-        wallet, _ = UserWallet.objects.get_or_create(user=user)
-        wallet.app_wallet_balance += one_percent
-        wallet.save()
-
-        Commission.objects.create(
-            commission_by=user, commission_to=user, commission_amount=one_percent, commission_type='rent',
-            description='Super Agency Rent Payment sent by CLICKNPAY REAL ESTATE.', earned_at=first_of_month,
-            applicable_for='super_agency', created_by=user, is_paid=True
-        )
-
-        Transaction.objects.create(
-            verified_on=today, receiver=user,
-            amount=one_percent, transaction_type='rent', transaction_status='approved',
-            remarks='Super Agency Rent Payment sent by CLICKNPAY REAL ESTATE.',
-            payment_method='wallet'
-        )
-
-    return "Monthly Super Agency rent distributed successfully."
-
-
-def distribute_monthly_rent_for_agency():
-    today = datetime.today().date()
-    first_of_month = today.replace(day=1)
+        credits[user_id] = to_rupees(rents[user_id])
 
-    if today != first_of_month:
-        return "Today is not the first of the month. No distribution performed."
+    with transaction.atomic():
+        Commission.objects.bulk_create([
+            Commission(
+                commission_by_id=user_id, commission_to_id=user_id, commission_amount=amount, commission_type='rent',
+                description=description, earned_at=first_of_month, applicable_for=applicable_for,
+                created_by_id=user_id, is_paid=True
+            )
+            for user_id, amount in credits.items()
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(
+                verified_on=now, receiver_id=user_id, amount=amount, transaction_type='rent',
+                transaction_status='approved', remarks=remarks, payment_method='wallet'
+            )
+            for user_id, amount in credits.items()
+        ])
+        credit_wallets(credits, wallet_ids=get_or_create_wallet_ids(credits), source_type='rent')
 
-    agencies = Agency.objects.filter(status='active')
+    return len(credits)
 
-    for agency in agencies:
-        user = agency.created_by
 
-        first_transaction = AgencyPackagePurchase.objects.filter(
-            user=user, package__isnull=False, buy_for='agency', status='completed', agency__isnull=False
-        ).last()
+def get_super_agency_rent_user_ids():
+    return SuperAgency.objects.filter(status='active').values_list('profile__user_id', flat=True)
 
-        paid_amount = first_transaction.amount_paid
-        one_percent = paid_amount * Decimal('0.01')
 
-        if one_percent < 1:
-            continue
+def get_agency_rent_user_ids():
+    return Agency.objects.filter(status='active').values_list('created_by_id', flat=True)
 
-        start_date = first_transaction.purchased_at.date() if first_transaction else today
-        end_date = start_date + timedelta(days=365 * 10)
 
-        if not (start_date <= today <= end_date):
-            print(f"Rent payment period has ended for {user.username}. No distribution performed.")
-            continue
-
-        rent_sent_this_month = Commission.objects.filter(
-            commission_to=user, commission_type='rent', earned_at__date=first_of_month,
-            applicable_for='agency'
-        ).exists()
-
-        if rent_sent_this_month:
-            print(f"Rent already sent this month for {user.username}.")
-            continue
+@background_job
+def distribute_monthly_rent_for_super_agency(user_ids=None):
+    """
+    Pay this month's super agency rent, to `user_ids` only when given (a chunk of the month-end close).
+    """
+    # if datetime.today().day != 1:
+    #     return "Today is not the first of the month. No distribution performed."
 
-        wallet, _ = UserWallet.objects.get_or_create(user=user)
-        wallet.app_wallet_balance += one_percent
-        wallet.save()
+    pay_monthly_rent(
+        get_super_agency_rent_user_ids() if user_ids is None else user_ids, 'super_agency',
+        description='Super Agency Rent Payment sent by CLICKNPAY REAL ESTATE.',
+        remarks='Super Agency Rent Payment sent by CLICKNPAY REAL ESTATE.'
+    )
+    return "Monthly Super Agency rent distributed successfully."
 
-        Commission.objects.create(
-            commission_by=user, commission_to=user, commission_amount=one_percent, commission_type='rent',
-            description='Agency Rent Payment sent by CLICKNPAY REAL ESTATE.', earned_at=first_of_month,
-            applicable_for='agency', created_by=user, is_paid=True
-        )
 
-        Transaction.objects.create(
-            verified_on=today, receiver=user,
-            amount=one_percent,
-            transaction_type='rent',
-            transaction_status='approved',
-            remarks='Agency Rent Payment sent by CLICKNPAY REAL ESTATE',
-            payment_method='wallet'
-        )
+@background_job
+def distribute_monthly_rent_for_agency(user_ids=None):
+    """
+    Pay this month's agency rent on the first of the month. A chunk of the month-end close (`user_ids` given) is
+    paid on any day, the close is keyed by its month and the rent is paid once per month anyway.
+    """
+    if user_ids is None and datetime.today().day != 1:
+        return "Today is not the first of the month. No distribution performed."
 
+    pay_monthly_rent(
+        get_agency_rent_user_ids() if user_ids is None else user_ids, 'agency',
+        description='Agency Rent Payment sent by CLICKNPAY REAL ESTATE.',
+        remarks='Agency Rent Payment sent by CLICKNPAY REAL ESTATE'
+    )
     return "Monthly rent distributed successfully."
 
 
@@ -180,6 +185,7 @@ def process_monthly_rentals_for_ppd_interest():
     """
     Process monthly rentals for all active PPD accounts.
     The rental will be sent only once per month until the account is withdrawn or inactive.
+    Rentals (1% once a property is purchased, 2% otherwise) are computed in paise for all accounts at once.
     """
     today = datetime.today().date()
     # first_of_month = today.replace(day=19)
@@ -190,48 +196,73 @@ def process_monthly_rentals_for_ppd_interest():
     active_accounts = PPDAccount.objects.filter(
         is_active=True, user__is_active=True,
         user__profile__is_kyc=True, user__profile__is_kyc_verified=True
-    )
+    ).values_list('id', 'user_id', 'user__username', 'deposit_amount', 'deposit_date', 'has_purchased_property',
+                  'last_interest_pay')
 
     results = []
+    payable = []
+    for account_id, user_id, username, deposit_amount, deposit_date, has_purchased_property, last_pay in \
+            active_accounts:
+        if last_pay and last_pay.year == today.year and last_pay.month == today.month:
+            results.append(f"Skipping {username}: Interest already paid this month.")
+            continue
 
-    for account in active_accounts:
-        try:
-            if (account.last_interest_pay and account.last_interest_pay.year == today.year and
-                    account.last_interest_pay.month == today.month):
-                results.append(f"Skipping {account.user.username}: Interest already paid this month.")
-                continue
-
-            deposit_date = account.deposit_date
-            months_since_deposit = (today.year - deposit_date.year) * 12 + (today.month - deposit_date.month)
-
-            if months_since_deposit >= 0:
-                interest_rate = Decimal('0.01') if account.has_purchased_property else Decimal('0.02')
-                monthly_rental = Decimal(account.deposit_amount) * interest_rate
-
-                wallet, created = UserWallet.objects.get_or_create(user=account.user)
-                wallet.app_wallet_balance += monthly_rental
-                wallet.save()
-
-                Transaction.objects.create(
-                    receiver=account.user,
-                    amount=monthly_rental,
-                    transaction_type='interest',
-                    transaction_status='approved',
-                    remarks='Property Payment Deposit Interest Sent by CNP',
-                    payment_method='wallet',
-                    verified_on=datetime.today()
-                )
-
-                account.last_interest_pay = today
-                account.save(update_fields=['last_interest_pay'])
-
-                results.append(f"Monthly rental of ₹{monthly_rental} processed for {account.user.username}.")
-        except Exception as e:
-            results.append(f"Failed for {account.user.username}: {str(e)}")
+        months_since_deposit = (today.year - deposit_date.year) * 12 + (today.month - deposit_date.month)
+        if months_since_deposit >= 0:
+            payable.append((account_id, user_id, username, deposit_amount, has_purchased_property))
 
+    rentals = apply_rates(
+        paise_array(account[3] for account in payable),
+        [PPD_RATE_BASIS_POINTS[account[4]] for account in payable]
+    )
+
+    rows = list(zip(payable, rentals))
+    for index in range(0, len(rows), PPD_CHUNK_SIZE):
+        chunk = rows[index:index + PPD_CHUNK_SIZE]
+        try:
+            pay_ppd_rentals(chunk, today)
+        except Exception:
+            # One failing account must not hold back the rest of the chunk, pay them one by one.
+            for row in chunk:
+                try:
+                    pay_ppd_rentals([row], today)
+                except Exception as e:
+                    print(f"🔴 PPD rental failed for {row[0][2]}: {e}")
+                    results.append(f"Failed for {row[0][2]}: {str(e)}")
+                else:
+                    results.append(f"Monthly rental of ₹{to_rupees(row[1])} processed for {row[0][2]}.")
+        else:
+            results.extend(
+                f"Monthly rental of ₹{to_rupees(paise)} processed for {account[2]}." for account, paise in chunk
+            )
     return results
 
 
+def pay_ppd_rentals(rows, today):
+    """
+    Pay (account, rental paise) rows in one savepoint: bulk transactions, one wallet credit per user and the
+    accounts' last_interest_pay.
+    """
+    transactions, credits = [], {}
+    for (account_id, user_id, username, _, _), paise in rows:
+        monthly_rental = to_rupees(paise)
+        transactions.append(Transaction(
+            receiver_id=user_id,
+            amount=monthly_rental,
+            transaction_type='interest',
+            transaction_status='approved',
+            remarks='Property Payment Deposit Interest Sent by CNP',
+            payment_method='wallet',
+            verified_on=datetime.today()
+        ))
+        credits[user_id] = credits.get(user_id, Decimal('0')) + monthly_rental
+
+    with transaction.atomic():
+        Transaction.objects.bulk_create(transactions)
+        credit_wallets(credits, wallet_ids=get_or_create_wallet_ids(credits), source_type='interest')
+        PPDAccount.objects.filter(id__in=[account[0] for account, _ in rows]).update(last_interest_pay=today)
+
+
 def get_reward_based_on_turnover(turnover, role):
     """
     Fetches the reward for a given turnover based on the RewardMaster table.
@@ -249,16 +280,63 @@ def get_reward_based_on_turnover(turnover, role):
     return reward
 
 
-def calculate_super_agency_rewards():
-    """Calculate and return the rewards for each SuperAgency."""
-    super_agencies = SuperAgency.objects.prefetch_related(
-        'profile', 'profile__user', 'agencies', 'agencies__field_agents'
-    ).filter(
+def pay_reward(user, reward, turnover):
+    """
+    Pay a turnover reward once: the Transaction, RewardEarned row and wallet credit are written together.
+    """
+    with transaction.atomic():
+        if RewardEarned.objects.filter(user=user, reward=reward).exists():
+            return False
+        Transaction.objects.create(
+            verified_on=datetime.today(),
+            receiver=user,
+            amount=reward.gift_amount,
+            transaction_type='reward',
+            transaction_status='approved',
+            remarks='Reward Gift Pay by CLICKNPAY REAL ESTATE.',
+            payment_method='wallet'
+        )
+        reward_earned = RewardEarned.objects.create(
+            user=user,
+            created_by=user,
+            reward=reward,
+            turnover_at_earning=turnover,
+            is_paid=True
+        )
+        record_earnings([reward_earned])
+        wallet, created = UserWallet.objects.get_or_create(user=user)
+        post_wallet(wallet, {'app_wallet_balance': reward.gift_amount}, 'reward')
+    return True
+
+
+def get_reward_super_agencies():
+    return SuperAgency.objects.filter(
         profile__is_kyc=True, profile__is_kyc_verified=True, profile__user__is_active=True,
         status='active', agencies__status='active',
         agencies__field_agents__status='active', created_by__is_active=True
     ).distinct()
 
+
+def get_reward_agencies():
+    return Agency.objects.filter(
+        status='active', created_by__profile__is_kyc=True, created_by__profile__is_kyc_verified=True,
+        created_by__is_active=True).distinct()
+
+
+def get_reward_field_agents():
+    return FieldAgent.objects.filter(
+        status='active', profile__is_kyc=True, profile__is_kyc_verified=True, profile__user__is_active=True
+    )
+
+
+def calculate_super_agency_rewards(super_agency_ids=None):
+    """Calculate and return the rewards for each SuperAgency, only for `super_agency_ids` when given."""
+    super_agencies = get_reward_super_agencies().prefetch_related(
+        'profile', 'profile__user', 'agencies', 'agencies__field_agents'
+    )
+    if super_agency_ids is not None:
+        super_agencies = super_agencies.filter(id__in=super_agency_ids)
+
     results = []
 
     for super_agency in super_agencies:
@@ -278,39 +356,20 @@ def calculate_super_agency_rewards():
         reward = get_reward_based_on_turnover(total_turnover, role)
 
         if reward:
-            if not RewardEarned.objects.filter(user=super_agency.profile.user, reward=reward).exists():
-                Transaction.objects.create(
-                    verified_on=datetime.today(),
-                    receiver=super_agency.profile.user,
-                    amount=reward.gift_amount,
-                    transaction_type='reward',
-                    transaction_status='approved',
-                    remarks='Reward Gift Pay by CLICKNPAY REAL ESTATE.',
-                    payment_method='wallet'
-                )
-                RewardEarned.objects.create(
-                    user=super_agency.profile.user,
-                    created_by=super_agency.profile.user,
-                    reward=reward,
-                    turnover_at_earning=total_turnover,
-                    is_paid=True
-                )
-                wallet, created = UserWallet.objects.get_or_create(user=super_agency.profile.user)
-                wallet.app_wallet_balance += reward.gift_amount
-                wallet.save()
+            pay_reward(super_agency.profile.user, reward, total_turnover)
 
     return results
 
 
-def calculate_agency_rewards():
-    """Calculate and return the rewards for each SuperAgency."""
-    agencies = Agency.objects.prefetch_related(
+def calculate_agency_rewards(agency_ids=None):
+    """Calculate and return the rewards for each Agency, only for `agency_ids` when given."""
+    agencies = get_reward_agencies().prefetch_related(
         'created_by',
         'created_by__profile',
         'field_agents'
-    ).filter(
-        status='active', created_by__profile__is_kyc=True, created_by__profile__is_kyc_verified=True,
-        created_by__is_active=True).distinct()
+    )
+    if agency_ids is not None:
+        agencies = agencies.filter(id__in=agency_ids)
     results = []
 
     for agency in agencies:
@@ -322,37 +381,18 @@ def calculate_agency_rewards():
         role = agency.created_by.profile.role
         reward = get_reward_based_on_turnover(total_field_agent_turnover, role)
         if reward:
-            if not RewardEarned.objects.filter(user=agency.created_by, reward=reward).exists():
-                Transaction.objects.create(
-                    verified_on=datetime.today(),
-                    receiver=agency.created_by,
-                    amount=reward.gift_amount,
-                    transaction_type='reward',
-                    transaction_status='approved',
-                    remarks='Reward Gift Pay by CLICKNPAY REAL ESTATE.',
-                    payment_method='wallet'
-                )
-                RewardEarned.objects.create(
-                    user=agency.created_by,
-                    created_by=agency.created_by,
-                    reward=reward,
-                    turnover_at_earning=total_field_agent_turnover,
-                    is_paid=True
-                )
-                wallet, created = UserWallet.objects.get_or_create(user=agency.created_by)
-                wallet.app_wallet_balance += reward.gift_amount
-                wallet.save()
+            pay_reward(agency.created_by, reward, total_field_agent_turnover)
     return results
 
 
-def calculate_field_agent_rewards():
-    """Calculate and return the rewards for each SuperAgency."""
-    field_agent = FieldAgent.objects.filter(
-        status='active', profile__is_kyc=True, profile__is_kyc_verified=True, profile__user__is_active=True
-    ).prefetch_related(
+def calculate_field_agent_rewards(field_agent_ids=None):
+    """Calculate and return the rewards for each FieldAgent, only for `field_agent_ids` when given."""
+    field_agent = get_reward_field_agents().prefetch_related(
         'profile',
         'profile__user'
     )
+    if field_agent_ids is not None:
+        field_agent = field_agent.filter(id__in=field_agent_ids)
     results = []
 
     for agent in field_agent:
@@ -360,27 +400,7 @@ def calculate_field_agent_rewards():
         role = agent.profile.role
         reward = get_reward_based_on_turnover(total_turnover, role)
         if reward:
-            if not RewardEarned.objects.filter(user=agent.profile.user, reward=reward).exists():
-
-                Transaction.objects.create(
-                    verified_on=datetime.today(),
-                    receiver=agent.profile.user,
-                    amount=reward.gift_amount,
-                    transaction_type='reward',
-                    transaction_status='approved',
-                    remarks='Reward Gift Pay by CLICKNPAY REAL ESTATE.',
-                    payment_method='wallet'
-                )
-                RewardEarned.objects.create(
-                    user=agent.profile.user,
-                    created_by=agent.profile.user,
-                    reward=reward,
-                    turnover_at_earning=total_turnover,
-                    is_paid=True
-                )
-                wallet, created = UserWallet.objects.get_or_create(user=agent.profile.user)
-                wallet.app_wallet_balance += reward.gift_amount
-                wallet.save()
+            pay_reward(agent.profile.user, reward, total_turnover)
     return results
 
 
@@ -395,12 +415,14 @@ def calculate_p2pmb_rewards():
         reward = get_reward_based_on_turnover(total_turnover, role)
         if reward:
             if not RewardEarned.objects.filter(user=data.child, reward=reward).exists():
-                RewardEarned.objects.create(
-                    user=data.child,
-                    created_by=data.child,
-                    reward=reward,
-                    turnover_at_earning=total_turnover
-                )
+                with transaction.atomic():
+                    reward_earned = RewardEarned.objects.create(
+                        user=data.child,
+                        created_by=data.child,
+                        reward=reward,
+                        turnover_at_earning=total_turnover
+                    )
+                    record_earnings([reward_earned])
     return results
 
 
@@ -412,8 +434,7 @@ def calculate_and_send_super_agency_commission(super_agency_id, purchase, compan
 
     commission_amount = purchase.amount_paid * Decimal('0.25')
     wallet, created = UserWallet.objects.get_or_create(user=super_agency.profile.user)
-    wallet.app_wallet_balance += commission_amount
-    wallet.save()
+    post_wallet(wallet, {'app_wallet_balance': commission_amount}, 'commission')
 
     Commission.objects.create(
         commission_by=purchase.user, commission_to=super_agency.profile.user, commission_amount=commission_amount,
@@ -435,8 +456,7 @@ def calculate_and_send_agency_commission(super_agency_id, purchase):
 
     commission_amount = purchase.amount_paid * Decimal('0.25')
     wallet, created = UserWallet.objects.get_or_create(user=agency.created_by)
-    wallet.app_wallet_balance += commission_amount
-    wallet.save()
+    post_wallet(wallet, {'app_wallet_balance': commission_amount}, 'commission')
 
     Commission.objects.create(
         commission_by=purchase.user, commission_to=agency.created_by, commission_amount=commission_amount,
@@ -455,8 +475,7 @@ def calculate_and_send_agency_commission(super_agency_id, purchase):
 def calculate_and_send_field_agent_commission_to_super_agency(agency, purchase):
     commission_amount = purchase.amount_paid * Decimal('0.05')
     wallet, created = UserWallet.objects.get_or_create(user=agency.company.profile.user)
-    wallet.app_wallet_balance += commission_amount
-    wallet.save()
+    post_wallet(wallet, {'app_wallet_balance': commission_amount}, 'commission')
 
     Commission.objects.create(
         commission_by=purchase.user, commission_to=agency.company.profile.user, commission_amount=commission_amount,
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agency', '0036_agency_is_default_superagency_is_default'),
+        ('master', '0011_coregroupphase_coregroupincome'),
+        ('p2pmb', '0042_alter_lapsedamount_earned_type'),
+        ('payment_app', '0012_transaction_idempotency_key_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['date_created'], name='investment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investmentinterest',
+            index=models.Index(fields=['date_created'], name='interest_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investmentinterest',
+            index=models.Index(fields=['interest_send_date'], name='interest_send_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rewardearned',
+            index=models.Index(fields=['date_created'], name='reward_earned_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rewardearned',
+            index=models.Index(fields=['earned_at'], name='reward_earned_at_idx'),
+        ),
+    ]
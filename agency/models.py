@@ -87,6 +87,9 @@ class Investment(ModelMixin):
     is_interest_send = models.BooleanField(default=False)
     is_royalty_calculate = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=['date_created'], name='investment_created_idx')]
+
     def total_investment(self):
         return self.amount + self.gst
 
@@ -101,6 +104,12 @@ class InvestmentInterest(ModelMixin):
     is_sent = models.BooleanField(default=False)
     end_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created'], name='interest_created_idx'),
+            models.Index(fields=['interest_send_date'], name='interest_send_date_idx'),
+        ]
+
     def __str__(self):
         return f"Interest for {self.investment.user.username} on {self.interest_send_date}: {self.interest_amount}"
 
@@ -228,6 +237,12 @@ class RewardEarned(ModelMixin):
     last_payment_send = models.DateTimeField(null=True, blank=True)
     total_installment_paid = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created'], name='reward_earned_created_idx'),
+            models.Index(fields=['earned_at'], name='reward_earned_at_idx'),
+        ]
+
     def __str__(self):
         return f"Reward for {self.user.username} Earned at {self.earned_at}"
 
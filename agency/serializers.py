@@ -7,6 +7,7 @@ from accounts.models import Profile, UserPersonalDocument
 from master.models import RewardMaster, City
 from p2pmb.models import Package
 from payment_app.choices import PAYMENT_METHOD
+from payment_app.helpers import post_wallet, InsufficientBalance
 from payment_app.models import Transaction, UserWallet
 from .calculation import calculate_and_send_super_agency_commission, calculate_and_send_agency_commission
 from .choices import INVESTMENT_GUARANTEED_TYPE
@@ -72,8 +73,10 @@ class CreateInvestmentSerializer(serializers.ModelSerializer):
 
             if user_wallet.main_wallet_balance < amount:
                 raise serializers.ValidationError("Insufficient balance in main wallet.")
-            user_wallet.main_wallet_balance -= amount
-            user_wallet.save()
+            try:
+                post_wallet(user_wallet, {'main_wallet_balance': -amount}, 'investment', check_funds=True)
+            except InsufficientBalance:
+                raise serializers.ValidationError("Insufficient balance in main wallet.")
 
         if pay_method == 'app_wallet':
             user_wallet = UserWallet.objects.filter(user=user, status='active').first()
@@ -83,8 +86,10 @@ class CreateInvestmentSerializer(serializers.ModelSerializer):
 
             if user_wallet.app_wallet_balance < amount:
                 raise serializers.ValidationError("Insufficient balance in app wallet.")
-            user_wallet.app_wallet_balance -= amount
-            user_wallet.save()
+            try:
+                post_wallet(user_wallet, {'app_wallet_balance': -amount}, 'investment', check_funds=True)
+            except InsufficientBalance:
+                raise serializers.ValidationError("Insufficient balance in app wallet.")
         attrs['user'] = user
         return attrs
 
@@ -1,3 +1,115 @@
+import datetime
+import random
+from decimal import Decimal, ROUND_HALF_EVEN
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from accounts.models import Profile
+from agency import calculation, views
+from agency.calculation import process_monthly_rentals_for_ppd_interest
+from agency.models import PPDAccount, Investment
+from p2pmb.models import Package
+from payment_app.models import UserWallet, Transaction, WalletLedgerEntry
+from utils.payout import apply_rates, paise_array, to_rupees, to_basis_points
+
+
+class PayoutMathTest(TestCase):
+
+    def test_matches_decimal_arithmetic(self):
+        rng = random.Random(7)
+        amounts = [Decimal(rng.randint(0, 10 ** 9)) / 100 for _ in range(2000)] + [Decimal('0.50'), Decimal('1.50')]
+        rates = [Decimal(rng.randint(0, 500)) / 10000 for _ in amounts[:-2]] + [Decimal('0.01'), Decimal('0.01')]
+        days = [rng.randint(1, 31) for _ in amounts]
+        month_days = [max(day, rng.choice((28, 30, 31))) for day in days]
+
+        paid = apply_rates(paise_array(amounts), [to_basis_points(rate) for rate in rates], days, month_days)
+        for amount, rate, day, month_day, paise in zip(amounts, rates, days, month_days, paid):
+            expected = (amount * rate * day / month_day).quantize(Decimal('0.01'), ROUND_HALF_EVEN)
+            self.assertEqual(to_rupees(paise), expected, (amount, rate, day, month_day))
+
+    def test_half_paisa_rounds_to_even_and_negative_rates_pay_nothing(self):
+        self.assertEqual(apply_rates([50, 150], [100, 100]), [0, 2])
+        self.assertEqual(apply_rates([10000], [-50]), [0])
+        self.assertEqual(apply_rates([], []), [])
+
+
+class PPDRentalTest(TestCase):
+
+    def setUp(self):
+        self.accounts = []
+        for index, (deposit, purchased) in enumerate(
+                [(Decimal('10000'), False), (Decimal('2500.55'), True), (Decimal('777.77'), False)]):
+            user = User.objects.create(username=f'ppd-{index}')
+            Profile.objects.create(user=user, is_kyc=True, is_kyc_verified=True)
+            self.accounts.append(PPDAccount.objects.create(
+                user=user, deposit_amount=deposit, has_purchased_property=purchased))
+
+    def baseline_rental(self, account):
+        """ The per-row Decimal arithmetic the job did before paise. """
+        return Decimal(account.deposit_amount) * (Decimal('0.01') if account.has_purchased_property else Decimal('0.02'))
+
+    def test_pays_the_baseline_amounts_once_a_month(self):
+        process_monthly_rentals_for_ppd_interest()
+        for account in self.accounts:
+            wallet = UserWallet.objects.get(user=account.user)
+            self.assertEqual(wallet.app_wallet_balance,
+                             self.baseline_rental(account).quantize(Decimal('0.01'), ROUND_HALF_EVEN))
+            account.refresh_from_db()
+            self.assertEqual(account.last_interest_pay, datetime.date.today())
+
+        results = process_monthly_rentals_for_ppd_interest()
+        self.assertTrue(all(result.startswith('Skipping') for result in results))
+        self.assertEqual(Transaction.objects.filter(transaction_type='interest').count(), 3)
+
+    def test_failing_account_does_not_roll_back_the_others(self):
+        failing = self.accounts[1].user_id
+        credit_wallets = calculation.credit_wallets
+
+        def credit_or_fail(credits, **kwargs):
+            if failing in credits:
+                raise RuntimeError('wallet locked')
+            return credit_wallets(credits, **kwargs)
+
+        with mock.patch.object(calculation, 'credit_wallets', side_effect=credit_or_fail):
+            results = process_monthly_rentals_for_ppd_interest()
+
+        self.assertEqual(results.count('Failed for ppd-1: wallet locked'), 1)
+        self.assertEqual(Transaction.objects.filter(transaction_type='interest').count(), 2)
+        self.assertFalse(Transaction.objects.filter(receiver_id=failing).exists())
+        self.assertIsNone(PPDAccount.objects.get(id=self.accounts[1].id).last_interest_pay)
+        for account in (self.accounts[0], self.accounts[2]):
+            self.assertEqual(PPDAccount.objects.get(id=account.id).last_interest_pay, datetime.date.today())
+
+
+class InvestmentPurchaseTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer')
+        Profile.objects.create(user=self.user, is_kyc=True, is_kyc_verified=True)
+        self.wallet = UserWallet.objects.create(user=self.user, app_wallet_balance=Decimal('1500'))
+        self.package = Package.objects.create(name='p2pmb', amount=Decimal('1000'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def buy(self):
+        return self.client.post('/api/agency/investment/get-balance/', {
+            'amount': '1000', 'wallet_type': 'app_wallet', 'package': [self.package.id]}, format='json')
+
+    def test_purchase_debits_the_wallet_with_the_investment(self):
+        self.assertEqual(self.buy().status_code, 200)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.app_wallet_balance, Decimal('500'))
+        self.assertEqual(Investment.objects.get(user=self.user).transaction_id.amount, Decimal('1000'))
 
-# Create your tests here.
+    def test_failed_purchase_keeps_the_money(self):
+        with mock.patch.object(views, 'roll_up_investment_turnover', side_effect=RuntimeError('tree locked')):
+            with self.assertRaises(RuntimeError):
+                self.buy()
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.app_wallet_balance, Decimal('1500'))
+        self.assertFalse(Investment.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(WalletLedgerEntry.objects.exists())
@@ -7,6 +7,7 @@ from decimal import Decimal
 
 import requests
 from dateutil.relativedelta import relativedelta
+from django.db import transaction as db_transaction
 from django.db.models import Q, Sum
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -17,9 +18,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import Profile
+from master.helpers import publish_event
 from master.models import RewardMaster
 from p2pmb.calculation import DistributeDirectCommission
-from p2pmb.models import MLMTree
+from p2pmb.helpers import roll_up_investment_turnover, record_investment
+from payment_app.helpers import post_wallet, transfer_funds, idempotency_key_from, InsufficientBalance
 from payment_app.models import UserWallet, Transaction
 from real_estate import settings
 from .calculation import distribute_monthly_rent_for_super_agency, calculate_super_agency_rewards, \
@@ -118,15 +121,14 @@ class InvestmentViewSet(viewsets.ModelViewSet):
         check_wallet_balance = UserWallet.objects.filter(filter_condition)
         if check_wallet_balance:
             user_wallet = UserWallet.objects.filter(user=self.request.user, status='active').first()
+            debit = None
             if wallet_type == 'app_wallet':
                 if not user_wallet:
                     return Response({'status': False}, status=status.HTTP_400_BAD_REQUEST)
 
                 if user_wallet.app_wallet_balance < amount:
                     return Response({'status': False}, status=status.HTTP_400_BAD_REQUEST)
-
-                user_wallet.app_wallet_balance -= amount
-                user_wallet.save()
+                debit = {'app_wallet_balance': -amount}
             elif wallet_type == 'main_wallet':
                 user_wallet = UserWallet.objects.filter(user=self.request.user, status='active').first()
 
@@ -135,8 +137,7 @@ class InvestmentViewSet(viewsets.ModelViewSet):
 
                 if user_wallet.main_wallet_balance < amount:
                     return Response({'status': False}, status=status.HTTP_400_BAD_REQUEST)
-                user_wallet.main_wallet_balance -= amount
-                user_wallet.save()
+                debit = {'main_wallet_balance': -amount}
 
             transaction_data = {
                 'created_by': self.request.user,
@@ -149,30 +150,35 @@ class InvestmentViewSet(viewsets.ModelViewSet):
                 'remarks': "Payment Initiated for P2PMB Model.",
             }
 
-            transaction = Transaction.objects.create(**transaction_data)
-            investment_data = {
-                'created_by': self.request.user,
-                'user': self.request.user,
-                'status': 'active',
-                'amount': amount,
-                'investment_type': investment_type,
-                'gst': 0,
-                'transaction_id': transaction,
-                'pay_method': wallet_type,
-                'is_approved': True,
-                'approved_by': self.request.user,
-                'approved_on': datetime.datetime.now(),
-                'investment_guaranteed_type': investment_guaranteed_type,
-                'referral_by': referral_by if referral_by else None
-            }
-
-            investment = Investment.objects.create(**investment_data)
-            if package:
-                investment.package.set(package)
-            get_mlm = MLMTree.objects.filter(child=self.request.user).last()
-            if get_mlm:
-                get_mlm.turnover += amount
-                get_mlm.save()
+            # The debit, the transaction and the investment commit together or not at all.
+            try:
+                with db_transaction.atomic():
+                    if debit:
+                        post_wallet(user_wallet, debit, 'investment', check_funds=True)
+                    transaction = Transaction.objects.create(**transaction_data)
+                    investment_data = {
+                        'created_by': self.request.user,
+                        'user': self.request.user,
+                        'status': 'active',
+                        'amount': amount,
+                        'investment_type': investment_type,
+                        'gst': 0,
+                        'transaction_id': transaction,
+                        'pay_method': wallet_type,
+                        'is_approved': True,
+                        'approved_by': self.request.user,
+                        'approved_on': datetime.datetime.now(),
+                        'investment_guaranteed_type': investment_guaranteed_type,
+                        'referral_by': referral_by if referral_by else None
+                    }
+                    investment = Investment.objects.create(**investment_data)
+                    if package:
+                        investment.package.set(package)
+                    roll_up_investment_turnover(investment)
+                    record_investment(investment)
+                    publish_event('investment.approved', investment_id=investment.id)
+            except InsufficientBalance:
+                return Response({'status': False}, status=status.HTTP_400_BAD_REQUEST)
             return Response({"status": True}, status=status.HTTP_200_OK)
         else:
             return Response({"status": False}, status=status.HTTP_200_OK)
@@ -248,10 +254,6 @@ class InvestmentViewSet(viewsets.ModelViewSet):
         investment = Investment.objects.create(**investment_data)
         if package:
             investment.package.set(package)
-        get_mlm = MLMTree.objects.filter(child=self.request.user).last()
-        if get_mlm:
-            get_mlm.turnover += amount
-            get_mlm.save()
 
         profile = getattr(request.user, 'profile', None)
         mobile_number = getattr(profile, 'mobile_number', '') if profile else ''
@@ -369,10 +371,15 @@ class CashfreeWebhookView(APIView):
                 transaction.transaction_status = 'approved'
                 transaction.save()
 
-            if investment.status != 'active' or not investment.is_approved:
-                investment.status = 'active'
-                investment.is_approved = True
-                investment.save()
+            with db_transaction.atomic():
+                investment = Investment.objects.select_for_update().get(id=investment.id)
+                if investment.status != 'active' or not investment.is_approved:
+                    investment.status = 'active'
+                    investment.is_approved = True
+                    investment.save()
+                    roll_up_investment_turnover(investment)
+                    record_investment(investment)
+                    publish_event('investment.approved', investment_id=investment.id)
 
             return Response({'status': True, 'message': 'Payment successfully processed'}, status=status.HTTP_200_OK)
         return Response({'status': True, 'message': f'Status received: {transaction_status}'}, status=status.HTTP_200_OK)
@@ -457,26 +464,26 @@ class RefundViewSet(viewsets.ModelViewSet):
                 {"error": f"This refund request is already {refund}."}, status=status.HTTP_400_BAD_REQUEST,
             )
 
-        refund.refund_status = refund_status
-        refund.refund_process_date = datetime.datetime.today()
-        refund.refund_process_by = self.request.user
-        refund.save()
-
-        Transaction.objects.create(
-            created_by=request.user,
-            sender=request.user,
-            receiver=refund.user,
-            amount=refund.amount_refunded,
-            transaction_type='refund',
-            transaction_status='approved',
-            verified_by=self.request.user,
-            verified_on=datetime.datetime.today(),
-            payment_method='wallet'
-        )
+        with db_transaction.atomic():
+            refund.refund_status = refund_status
+            refund.refund_process_date = datetime.datetime.today()
+            refund.refund_process_by = self.request.user
+            refund.save()
+
+            Transaction.objects.create(
+                created_by=request.user,
+                sender=request.user,
+                receiver=refund.user,
+                amount=refund.amount_refunded,
+                transaction_type='refund',
+                transaction_status='approved',
+                verified_by=self.request.user,
+                verified_on=datetime.datetime.today(),
+                payment_method='wallet'
+            )
 
-        user_wallet = UserWallet.objects.filter(user=refund.user).last()
-        user_wallet.app_wallet_balance += refund.amount_refunded
-        user_wallet.save()
+            user_wallet = UserWallet.objects.filter(user=refund.user).last()
+            post_wallet(user_wallet, {'app_wallet_balance': refund.amount_refunded}, 'refund', source_id=refund.id)
         response_serializer = RefundPolicySerializer(refund)
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
@@ -506,25 +513,30 @@ class PPDAccountViewSet(viewsets.ModelViewSet):
         if deposit_amount < 100 or deposit_amount > 4999:
             return Response({"error": "Deposit amount must be between ₹100 and ₹4999."},
                             status=status.HTTP_400_BAD_REQUEST)
-        if wallet_type == 'app_wallet':
-            sender_wallet.app_wallet_balance -= deposit_amount
-        if wallet_type == 'main_wallet':
-            sender_wallet.main_wallet_balance -= deposit_amount
-        sender_wallet.save()
-
-        Transaction.objects.create(
-            created_by=request.user,
-            sender=request.user,
-            amount=deposit_amount,
-            transaction_status='approved',
-            transaction_type='investment',
-            status='active',
-            payment_method='wallet'
-        )
-        ppd_account = PPDAccount.objects.create(created_by=request.user, user=request.user,
-                                                deposit_amount=deposit_amount,
-                                                deposit_date=datetime.datetime.now().date(), remarks=remarks)
-        return Response({"message": "PPD account created successfully.", "account_id": ppd_account.id},
+        bucket = {'app_wallet': 'app_wallet_balance', 'main_wallet': 'main_wallet_balance'}.get(wallet_type)
+        ppd_accounts = []
+
+        def create_account(transaction):
+            ppd_accounts.append(PPDAccount.objects.create(created_by=request.user, user=request.user,
+                                                          deposit_amount=deposit_amount,
+                                                          deposit_date=datetime.datetime.now().date(),
+                                                          remarks=remarks))
+
+        try:
+            transfer_funds([(sender_wallet.id, bucket, -deposit_amount)] if bucket else [], {
+                'created_by': request.user,
+                'sender': request.user,
+                'amount': deposit_amount,
+                'transaction_status': 'approved',
+                'transaction_type': 'investment',
+                'status': 'active',
+                'payment_method': 'wallet'
+            }, idempotency_key=idempotency_key_from(request), on_posted=create_account)
+        except InsufficientBalance:
+            return Response({"error": "Insufficient balance in your wallet."}, status=status.HTTP_400_BAD_REQUEST)
+        if not ppd_accounts:
+            return Response({"message": "PPD account already created for this request."}, status=status.HTTP_200_OK)
+        return Response({"message": "PPD account created successfully.", "account_id": ppd_accounts[0].id},
                         status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], url_path='withdraw-ppd-amount')
@@ -800,16 +812,18 @@ class DistributeSuperAgencyRent(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        distribute_monthly_rent_for_super_agency()
-        return Response({'message': 'Super Agency Rent Distributed successfully'})
+        job = distribute_monthly_rent_for_super_agency.enqueue()
+        return Response({'message': 'Super Agency Rent distribution queued.', 'job_id': job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class DistributeAgencyRent(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        distribute_monthly_rent_for_agency()
-        return Response({'message': 'Agency Rent Distributed successfully'})
+        job = distribute_monthly_rent_for_agency.enqueue()
+        return Response({'message': 'Agency Rent distribution queued.', 'job_id': job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class SuperAgencyAppCommission(APIView):
@@ -1,3 +1,5 @@
+import datetime
+
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 
@@ -75,4 +77,55 @@ class CoreGroupPhaseAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
 class CoreGroupIncomeAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     resource_class = CoreGroupIncomeResource
     raw_id_fields = ('created_by', 'updated_by', 'phase')
-    list_filter = ('status', )
\ No newline at end of file
+    list_filter = ('status', )
+
+@admin.register(JobLease)
+class JobLeaseAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = JobLeaseResource
+    search_fields = ('name', 'holder')
+
+
+@admin.register(Job)
+class JobAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = JobResource
+    list_filter = ('state', 'name')
+    search_fields = ('name', 'locked_by')
+    actions = ['requeue_jobs']
+
+    @admin.action(description='Queue the selected jobs again')
+    def requeue_jobs(self, request, queryset):
+        updated = queryset.exclude(state='running').update(
+            state='queued', attempts=0, locked_by='', finished_at=None, run_after=datetime.datetime.now())
+        self.message_user(request, f'{updated} jobs queued again.')
+
+
+@admin.register(ScheduledJobRun)
+class ScheduledJobRunAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = ScheduledJobRunResource
+    list_filter = ('state', 'name', 'host')
+    search_fields = ('name',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = OutboxEventResource
+    list_filter = ('state', 'topic')
+    actions = ['redeliver_events']
+
+    @admin.action(description='Deliver the selected events again')
+    def redeliver_events(self, request, queryset):
+        updated = queryset.update(state='pending', attempts=0, processed_at=None)
+        self.message_user(request, f'{updated} events will be delivered again.')
+
+
+@admin.register(PipelineCheckpoint)
+class PipelineCheckpointAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = PipelineCheckpointResource
+    list_filter = ('state', 'job', 'period')
+    search_fields = ('step',)
+
+
+@admin.register(PipelineChunk)
+class PipelineChunkAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = PipelineChunkResource
+    raw_id_fields = ('checkpoint',)
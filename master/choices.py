@@ -33,3 +33,30 @@ CORE_GROUP_TYPE = (
     ('core_income', 'core_income')
 )
 
+
+JOB_STATE = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('dead', 'Dead'),
+)
+
+JOB_RUN_STATE = (
+    ('running', 'Running'),
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+    ('skipped', 'Skipped'),
+)
+
+OUTBOX_STATE = (
+    ('pending', 'Pending'),
+    ('done', 'Done'),
+    ('dead', 'Dead'),
+)
+
+PIPELINE_STEP_STATE = (
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
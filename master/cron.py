@@ -0,0 +1,34 @@
+import datetime
+
+from master.helpers import job_lease, heartbeat_job_lease, dispatch_outbox, OUTBOX_BATCH_SIZE
+from master.models import OutboxEvent
+
+OUTBOX_RETENTION = datetime.timedelta(days=7)
+
+
+@job_lease(ttl=datetime.timedelta(minutes=5))
+def dispatch_outbox_events():
+    """
+    Hand the committed outbox events to their handlers, batch by batch until none is pending. Runs every few
+    seconds from the scheduler, so it only reports when there was something to do.
+    """
+    handled = 0
+    while True:
+        heartbeat_job_lease()
+        batch = dispatch_outbox()
+        handled += batch
+        if batch < OUTBOX_BATCH_SIZE:
+            break
+    if handled:
+        print(f"✅ {handled} outbox events dispatched.")
+
+
+@job_lease(ttl=datetime.timedelta(hours=1))
+def prune_outbox_events():
+    """
+    Delete dispatched outbox events older than a week; dead ones stay for an admin to look at.
+    """
+    print("🚀 Starting Outbox Pruning...")
+    deleted, _ = OutboxEvent.objects.filter(
+        state='done', processed_at__lt=datetime.datetime.now() - OUTBOX_RETENTION).delete()
+    print(f"🔄 Outbox Pruned, {deleted} events deleted.")
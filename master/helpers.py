@@ -0,0 +1,266 @@
+"""
+Database backed leases for the cron jobs and the background job queue.
+
+A job runs only while its process holds the JobLease row of the job's name. The lease is taken with a conditional
+UPDATE that only matches a free or expired row, so exactly one process across all cron hosts wins it; long jobs
+renew it between chunks and a crashed holder's lease simply expires. Host clocks must agree to well within the TTL.
+
+Work too slow for a request is queued as a Job row with `some_job.enqueue(**payload)` and run by the worker
+processes of `manage.py run_workers`, which claim jobs with SELECT ... FOR UPDATE SKIP LOCKED where the database
+has it and a conditional UPDATE otherwise.
+
+Changes other code must react to are announced with publish_event inside the changing transaction; the outbox
+dispatcher hands the events to their handlers in order once they committed.
+"""
+import datetime
+import functools
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import F, Q, DateTimeField, ExpressionWrapper
+from django.utils.module_loading import import_string
+
+from master.models import JobLease, Job, OutboxEvent
+
+JOB_LEASE_TTL = datetime.timedelta(minutes=10)
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF = datetime.timedelta(seconds=30)
+JOB_MAX_BACKOFF = datetime.timedelta(hours=1)
+# A running job whose worker has not finished it in its timeout, by default this one, is assumed lost with its worker
+# and queued again.
+JOB_TIMEOUT = datetime.timedelta(hours=2)
+OUTBOX_HANDLERS = {
+    'investment.approved': 'p2pmb.jobs.distribute_investment_income',
+    'mlm.node_placed': 'p2pmb.jobs.distribute_investment_income',
+}
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+_held = threading.local()
+
+
+class LeaseLost(Exception):
+    """
+    The lease of a running job expired and another holder took it over; the job must stop.
+    """
+
+
+def lease_holder():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def acquire_job_lease(name, holder, ttl=JOB_LEASE_TTL):
+    """
+    Take the lease `name` for `holder` if nobody holds it or the current holder's lease has expired.
+    """
+    now = datetime.datetime.now()
+    JobLease.objects.get_or_create(name=name)
+    return bool(JobLease.objects.filter(name=name).filter(
+        Q(expires_at__isnull=True) | Q(expires_at__lte=now)
+    ).update(holder=holder, acquired_at=now, expires_at=now + ttl))
+
+
+def renew_job_lease(name, holder, ttl=JOB_LEASE_TTL):
+    """
+    Push the expiry of a held lease forward, raising LeaseLost if it now belongs to someone else.
+    """
+    if not JobLease.objects.filter(name=name, holder=holder).update(
+            expires_at=datetime.datetime.now() + ttl):
+        raise LeaseLost(f'Lease {name} was taken over while {holder} was running.')
+
+
+def release_job_lease(name, holder):
+    JobLease.objects.filter(name=name, holder=holder).update(holder='', expires_at=None)
+
+
+def heartbeat_job_lease():
+    """
+    Renew every lease held by the running job. Call it between chunks, outside of any transaction, so the new
+    expiry is visible to the other hosts straight away.
+    """
+    for name, holder, ttl in getattr(_held, 'leases', []):
+        renew_job_lease(name, holder, ttl)
+
+
+def job_lease(name=None, ttl=JOB_LEASE_TTL):
+    """
+    Run the decorated cron job only if its lease can be taken, skipping the execution otherwise. The lease is named
+    after the job's dotted path unless `name` is given and is released when the job returns or fails.
+    """
+    def decorator(func):
+        lease_name = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            holder = lease_holder()
+            if not acquire_job_lease(lease_name, holder, ttl):
+                print(f"🔴 {lease_name} is still running on another worker. Skipping this execution.")
+                return None
+
+            leases = _held.__dict__.setdefault('leases', [])
+            leases.append((lease_name, holder, ttl))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                leases.remove((lease_name, holder, ttl))
+                release_job_lease(lease_name, holder)
+
+        wrapper.lease_ttl = ttl
+        return wrapper
+
+    return decorator
+
+
+def background_job(func=None, *, priority=0, max_attempts=JOB_MAX_ATTEMPTS, timeout=JOB_TIMEOUT):
+    """
+    Mark a module level function as runnable by the job workers and give it an `enqueue(run_after=None, **payload)`
+    that queues a call with the payload as keyword arguments. The payload must be JSON serialisable. A job running
+    under a job_lease gets at least the lease's TTL as its timeout, so it is never queued again while it may still
+    hold the lease.
+    """
+    def decorator(func):
+        func.job_name = f'{func.__module__}.{func.__name__}'
+        job_timeout = max(timeout, getattr(func, 'lease_ttl', timeout))
+
+        def enqueue(run_after=None, **payload):
+            return enqueue_job(func.job_name, payload, priority=priority, max_attempts=max_attempts,
+                               run_after=run_after, timeout=job_timeout)
+
+        func.enqueue = enqueue
+        return func
+
+    return decorator(func) if func else decorator
+
+
+def enqueue_job(name, payload=None, priority=0, max_attempts=JOB_MAX_ATTEMPTS, run_after=None, timeout=JOB_TIMEOUT):
+    """
+    Queue a job. Inside a transaction the job becomes visible to the workers only when that transaction commits.
+    """
+    return Job.objects.create(name=name, payload=payload or {}, priority=priority, max_attempts=max_attempts,
+                              run_after=run_after or datetime.datetime.now(), timeout=timeout)
+
+
+def _mark_running(job_id, worker):
+    return Job.objects.filter(id=job_id, state='queued').update(
+        state='running', locked_by=worker, locked_at=datetime.datetime.now(), attempts=F('attempts') + 1)
+
+
+def claim_job(worker):
+    """
+    Claim the next due job for `worker`, highest priority first, and return it or None when nothing is due.
+    """
+    candidates = Job.objects.filter(state='queued', run_after__lte=datetime.datetime.now()).order_by(
+        '-priority', 'run_after', 'id').values_list('id', flat=True)
+    if not connection.features.has_select_for_update_skip_locked:
+        # SQLite serialises writers, the conditional UPDATE is the claim and a lost race moves on to the next job.
+        for job_id in candidates[:10]:
+            if _mark_running(job_id, worker):
+                return Job.objects.get(id=job_id)
+        return None
+
+    with transaction.atomic():
+        job_id = candidates.select_for_update(skip_locked=True).first()
+        if job_id is None:
+            return None
+        _mark_running(job_id, worker)
+    return Job.objects.get(id=job_id)
+
+
+def job_backoff(attempts):
+    """
+    Delay before attempt `attempts + 1`: doubling from JOB_BACKOFF up to JOB_MAX_BACKOFF, with jitter.
+    """
+    delay = min(JOB_BACKOFF * 2 ** (attempts - 1), JOB_MAX_BACKOFF)
+    return delay * (1 + random.random() / 2)
+
+
+def execute_job(job):
+    """
+    Run a claimed job. A failure queues it again after job_backoff, or marks it dead once it used max_attempts.
+    Returns True when the job succeeded.
+    """
+    try:
+        func = import_string(job.name)
+        if not hasattr(func, 'enqueue'):
+            raise ValueError(f'{job.name} is not a background job.')
+        func(**job.payload)
+    except Exception:
+        now = datetime.datetime.now()
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(id=job.id).update(state='dead', locked_by='', finished_at=now, last_error=error)
+        else:
+            Job.objects.filter(id=job.id).update(state='queued', locked_by='', last_error=error,
+                                                 run_after=now + job_backoff(job.attempts))
+        return False
+
+    Job.objects.filter(id=job.id).update(state='done', locked_by='', finished_at=datetime.datetime.now())
+    return True
+
+
+def requeue_stalled_jobs():
+    """
+    Queue again the running jobs whose worker went away without finishing them within the job's timeout, or mark
+    them dead if that was their last attempt. Returns how many were queued.
+    """
+    now = datetime.datetime.now()
+    stalled = Job.objects.filter(id__in=Job.objects.annotate(
+        deadline=ExpressionWrapper(F('locked_at') + F('timeout'), output_field=DateTimeField())
+    ).filter(state='running', deadline__lt=now).values('id'))
+    stalled.filter(attempts__gte=F('max_attempts')).update(
+        state='dead', locked_by='', finished_at=now, last_error='Worker stopped responding within the job timeout.')
+    return stalled.update(state='queued', locked_by='', run_after=now)
+
+
+def run_pending_jobs(worker=None, limit=None):
+    """
+    Run due jobs in this process until none is left or `limit` were run. Returns the number of jobs run.
+    """
+    worker = worker or lease_holder()
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim_job(worker)
+        if not job:
+            break
+        execute_job(job)
+        ran += 1
+    return ran
+
+
+def publish_event(topic, **payload):
+    """
+    Write an outbox event. Call it inside the transaction making the change, so the event exists exactly when the
+    change committed.
+    """
+    if topic not in OUTBOX_HANDLERS:
+        raise ValueError(f'No outbox handler for {topic}.')
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def dispatch_outbox(limit=OUTBOX_BATCH_SIZE):
+    """
+    Hand up to `limit` pending events to their handlers in id order. Delivery is at least once, so handlers must be
+    idempotent: a failed event stays pending and holds back the events after it until it succeeds or used
+    OUTBOX_MAX_ATTEMPTS, then it is marked dead and skipped. Run it from a single process at a time.
+    Returns the number of events handled.
+    """
+    handled = 0
+    for event in OutboxEvent.objects.filter(state='pending').order_by('id')[:limit]:
+        try:
+            import_string(OUTBOX_HANDLERS[event.topic])(**event.payload)
+        except Exception:
+            attempts = event.attempts + 1
+            dead = attempts >= OUTBOX_MAX_ATTEMPTS
+            OutboxEvent.objects.filter(id=event.id).update(
+                attempts=attempts, last_error=traceback.format_exc(), state='dead' if dead else 'pending')
+            if dead:
+                continue
+            break
+        OutboxEvent.objects.filter(id=event.id).update(
+            state='done', attempts=F('attempts') + 1, processed_at=datetime.datetime.now())
+        handled += 1
+    return handled
@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from master.models import PipelineCheckpoint
+from master.pipeline import format_pipeline_report, PIPELINE_PROCESSES
+from real_estate.cron import monthly_task, MONTH_CLOSE_JOB
+
+
+class Command(BaseCommand):
+    help = 'Run or resume a month\'s checkpointed close: rent, rewards, p2pmb interest and finance facts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=PIPELINE_PROCESSES,
+                            help='Steps run at the same time, 0 runs them one by one in this process.')
+        parser.add_argument('--status', action='store_true', help='Only show the progress of a close.')
+        parser.add_argument('--period', default=None, help='YYYY-MM to run, resume or show, this month by default.')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            period = options['period'] or datetime.date.today().strftime('%Y-%m')
+            checkpoints = PipelineCheckpoint.objects.filter(job=MONTH_CLOSE_JOB, period=period).order_by('id')
+            self.stdout.write(format_pipeline_report(checkpoints))
+            return
+
+        checkpoints = monthly_task(processes=options['processes'], period=options['period'])
+        if checkpoints and all(checkpoint.state == 'done' for checkpoint in checkpoints):
+            self.stdout.write(self.style.SUCCESS('Month close finished.'))
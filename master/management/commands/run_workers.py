@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from master.helpers import lease_holder, run_pending_jobs, requeue_stalled_jobs
+
+STALLED_CHECK_INTERVAL = 60
+
+
+def work(stop, poll, burst):
+    # Ctrl+C reaches the whole process group, the parent decides when the workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    worker = lease_holder()
+    try:
+        while not stop.is_set():
+            if not run_pending_jobs(worker, limit=1):
+                if burst:
+                    break
+                stop.wait(poll)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs of the Job table with a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds an idle worker waits between polls.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due instead of waiting.')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        signal.signal(signal.SIGINT, lambda *args: stop.set())
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+        requeued = requeue_stalled_jobs()
+        if requeued:
+            self.stdout.write(f'{requeued} stalled jobs queued again.')
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+
+        def start():
+            process = context.Process(target=work, args=(stop, options['poll'], options['burst']))
+            process.start()
+            return process
+
+        processes = [start() for _ in range(options['processes'])]
+        self.stdout.write(self.style.SUCCESS(f"Started {len(processes)} job workers."))
+        checked = time.monotonic()
+        while processes:
+            time.sleep(1)
+            for index, process in enumerate(processes):
+                if process.is_alive():
+                    continue
+                if not stop.is_set() and not options['burst'] and process.exitcode:
+                    self.stderr.write(f'Worker {process.pid} exited with {process.exitcode}, restarting it.')
+                    processes[index] = start()
+                else:
+                    processes[index] = None
+            processes = [process for process in processes if process]
+            if time.monotonic() - checked > STALLED_CHECK_INTERVAL:
+                requeue_stalled_jobs()
+                connections.close_all()
+                checked = time.monotonic()
+
+        self.stdout.write(self.style.SUCCESS('Job workers stopped.'))
@@ -0,0 +1,28 @@
+import datetime
+import signal
+
+from django.core.management.base import BaseCommand
+
+from master.scheduler import Scheduler, get_scheduled_entries, SCHEDULER_WORKERS
+
+
+class Command(BaseCommand):
+    help = 'Run the SCHEDULER_JOBS (or CRONJOBS) entries from one long running process instead of the crontab.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=SCHEDULER_WORKERS, help='Jobs that can run at once.')
+        parser.add_argument('--list', action='store_true', help='Print the entries and their next run and exit.')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(get_scheduled_entries(), workers=options['workers'])
+        if options['list']:
+            now = datetime.datetime.now()
+            for entry in scheduler.entries:
+                self.stdout.write(f'{entry.schedule.next_after(now):%Y-%m-%d %H:%M:%S}  {entry}')
+            return
+
+        signal.signal(signal.SIGINT, lambda *args: scheduler.stop.set())
+        signal.signal(signal.SIGTERM, lambda *args: scheduler.stop.set())
+        self.stdout.write(self.style.SUCCESS(f'Scheduler started with {len(scheduler.entries)} entries.'))
+        scheduler.run()
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped, running jobs finished.'))
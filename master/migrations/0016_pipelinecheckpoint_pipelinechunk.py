@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0015_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('period', models.CharField(max_length=20)),
+                ('step', models.CharField(max_length=100)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('last_id', models.BigIntegerField(blank=True, null=True)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('items_done', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('job', 'period', 'step'), name='unique_pipeline_checkpoint')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PipelineChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('first_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(blank=True, null=True)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='master.pipelinecheckpoint')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('checkpoint', 'number'), name='unique_pipeline_chunk')],
+            },
+        ),
+    ]
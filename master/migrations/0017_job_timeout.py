@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:01
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0016_pipelinecheckpoint_pipelinechunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='timeout',
+            field=models.DurationField(default=datetime.timedelta(seconds=7200)),
+        ),
+    ]
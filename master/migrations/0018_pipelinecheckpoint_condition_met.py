@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0017_job_timeout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinecheckpoint',
+            name='condition_met',
+            field=models.BooleanField(default=False),
+        ),
+    ]
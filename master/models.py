@@ -1,9 +1,11 @@
+import datetime
 from decimal import Decimal
 
 from django.db import models
 
 from accounts.choices import USER_ROLE
-from master.choices import GST_METHOD, BANNER_PAGE_CHOICE, CAROUSEL_NUMBER, ROYALTY_CLUB_TYPE, CORE_GROUP_TYPE
+from master.choices import GST_METHOD, BANNER_PAGE_CHOICE, CAROUSEL_NUMBER, ROYALTY_CLUB_TYPE, CORE_GROUP_TYPE, \
+    JOB_STATE, JOB_RUN_STATE, OUTBOX_STATE, PIPELINE_STEP_STATE
 from real_estate.model_mixin import ModelMixin
 
 
@@ -126,3 +128,141 @@ class CoreGroupIncome(ModelMixin):
 
     def __str__(self):
         return f"{self.id}"
+
+
+class JobLease(models.Model):
+    """
+    Lease that lets a single process across all cron hosts run a job at a time. A lease whose holder stopped
+    renewing it expires on its own, so a crashed run never blocks the next one.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255, blank=True, default='')
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """
+    Background job run by `manage.py run_workers`. `name` is the dotted path of a @background_job function that
+    is called with `payload` as keyword arguments. Failed jobs are queued again with backoff until max_attempts,
+    then left as dead for an admin to look at. A job still running `timeout` after it was claimed counts as lost.
+    """
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=20, choices=JOB_STATE, default='queued')
+    priority = models.IntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    timeout = models.DurationField(default=datetime.timedelta(hours=2))
+    run_after = models.DateTimeField(default=datetime.datetime.now)
+    locked_by = models.CharField(max_length=255, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after', 'priority'], name='job_dequeue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.state})"
+
+
+class ScheduledJobRun(models.Model):
+    """
+    One firing of a `manage.py scheduler` entry. Skipped runs were due while the previous run was still going.
+    """
+    name = models.CharField(max_length=255)
+    schedule = models.CharField(max_length=100)
+    scheduled_for = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    state = models.CharField(max_length=20, choices=JOB_RUN_STATE, default='running')
+    host = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'scheduled_for'], name='job_run_name_idx'),
+            models.Index(fields=['scheduled_for'], name='job_run_scheduled_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} at {self.scheduled_for} ({self.state})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Event written in the same transaction as the change it announces and handed to its OUTBOX_HANDLERS handler
+    by the outbox dispatcher, in id order and at least once.
+    """
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=20, choices=OUTBOX_STATE, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='outbox_event_state_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.state})"
+
+
+class PipelineCheckpoint(models.Model):
+    """
+    Progress of one step of a checkpointed pipeline run, keyed by (job, period, step). `last_id` is the last id of
+    the last committed chunk; a rerun continues after it. `condition_met` records that the step's `when()` held
+    once, so a resumed run does not evaluate it again.
+    """
+    job = models.CharField(max_length=100)
+    period = models.CharField(max_length=20)
+    step = models.CharField(max_length=100)
+    state = models.CharField(max_length=20, choices=PIPELINE_STEP_STATE, default='pending')
+    last_id = models.BigIntegerField(null=True, blank=True)
+    chunks_done = models.PositiveIntegerField(default=0)
+    items_done = models.PositiveIntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    condition_met = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'period', 'step'], name='unique_pipeline_checkpoint')
+        ]
+
+    def __str__(self):
+        return f"{self.job} {self.period} {self.step} ({self.state})"
+
+
+class PipelineChunk(models.Model):
+    """
+    A committed chunk of a pipeline step, written in the same transaction as the chunk's own writes.
+    """
+    checkpoint = models.ForeignKey(PipelineCheckpoint, on_delete=models.CASCADE, related_name='chunks')
+    number = models.PositiveIntegerField()
+    first_id = models.BigIntegerField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True)
+    items = models.PositiveIntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['checkpoint', 'number'], name='unique_pipeline_chunk')
+        ]
+
+    def __str__(self):
+        return f"{self.checkpoint} chunk {self.number}"
@@ -0,0 +1,181 @@
+"""
+Checkpointed pipelines of chunked steps, used by the month-end close.
+
+A pipeline is a list of Step objects forming a DAG; a step starts once every step it depends on is done and
+independent steps run side by side in spawned worker processes, which rebuild the steps from the function that
+built them (see master.pipeline_worker). A step with `ids` works through the sorted ids
+chunk by chunk, and each chunk's writes commit together with its PipelineChunk row and the step's cursor, so a
+rerun of the same (job, period) continues after the last committed chunk and never repeats one. Steps that are
+already done are skipped, and a step whose `when()` is false is left pending for a later run. Once `when()` has
+held it is recorded on the checkpoint, and resumed runs of the step no longer check it.
+"""
+import datetime
+import multiprocessing
+import multiprocessing.connection
+import time
+import traceback
+
+from django.db import transaction
+from django.db.models import F
+
+from master.models import PipelineCheckpoint, PipelineChunk
+from master.pipeline_worker import run_step_process
+
+PIPELINE_PROCESSES = 3
+
+
+class Step:
+    """
+    `run(ids)` handles one chunk of the ids returned by `ids()`; without `ids` the step is a single `run()`.
+    With `when` the step only runs while `when()` is true.
+    """
+
+    def __init__(self, name, run, ids=None, depends=(), chunk_size=500, when=None):
+        self.name = name
+        self.run = run
+        self.ids = ids
+        self.depends = tuple(depends)
+        self.chunk_size = chunk_size
+        self.when = when
+
+
+def sort_steps(steps):
+    """
+    Steps in dependency order, refusing unknown dependencies and cycles.
+    """
+    by_name = {step.name: step for step in steps}
+    ordered, visiting, visited = [], set(), set()
+
+    def visit(step):
+        if step.name in visited:
+            return
+        if step.name in visiting:
+            raise ValueError(f'Pipeline step {step.name} depends on itself.')
+        visiting.add(step.name)
+        for name in step.depends:
+            if name not in by_name:
+                raise ValueError(f'Pipeline step {step.name} depends on unknown step {name}.')
+            visit(by_name[name])
+        visiting.discard(step.name)
+        visited.add(step.name)
+        ordered.append(step)
+
+    for step in steps:
+        visit(step)
+    return ordered
+
+
+def run_step(job, period, step):
+    """
+    Run the chunks of a step not committed yet. A failure marks the step failed and is raised.
+    """
+    checkpoint = PipelineCheckpoint.objects.get(job=job, period=period, step=step.name)
+    PipelineCheckpoint.objects.filter(id=checkpoint.id).update(
+        state='running', started_at=checkpoint.started_at or datetime.datetime.now(), error='')
+    try:
+        if step.ids is None:
+            chunks = [None] if not checkpoint.chunks_done else []
+        else:
+            ids = sorted(set(step.ids()))
+            if checkpoint.last_id is not None:
+                ids = [item_id for item_id in ids if item_id > checkpoint.last_id]
+            chunks = [ids[index:index + step.chunk_size] for index in range(0, len(ids), step.chunk_size)]
+
+        for number, chunk in enumerate(chunks, start=checkpoint.chunks_done + 1):
+            started = time.perf_counter()
+            with transaction.atomic():
+                if chunk is None:
+                    step.run()
+                else:
+                    step.run(chunk)
+                seconds = time.perf_counter() - started
+                PipelineChunk.objects.create(
+                    checkpoint=checkpoint, number=number, first_id=chunk[0] if chunk else None,
+                    last_id=chunk[-1] if chunk else None, items=len(chunk or ()), seconds=seconds)
+                PipelineCheckpoint.objects.filter(id=checkpoint.id).update(
+                    chunks_done=number, items_done=F('items_done') + len(chunk or ()),
+                    last_id=chunk[-1] if chunk else checkpoint.last_id, seconds=F('seconds') + seconds)
+    except Exception:
+        PipelineCheckpoint.objects.filter(id=checkpoint.id).update(state='failed', error=traceback.format_exc())
+        raise
+    PipelineCheckpoint.objects.filter(id=checkpoint.id).update(state='done', finished_at=datetime.datetime.now())
+
+
+def run_pipeline(job, period, steps, processes=PIPELINE_PROCESSES, factory=None):
+    """
+    Run the steps of (job, period) that are not done yet, up to `processes` at a time. With processes=0 the steps
+    run one after another in this process. Worker processes need `factory`, the dotted path of the function that
+    built `steps` and its arguments, (path, args), to build them again. A failed step, or one whose `when()` is
+    false, leaves the steps depending on it pending; rerunning the pipeline retries it from its last committed
+    chunk. Returns the checkpoints in step order.
+    """
+    if processes and factory is None:
+        raise ValueError('Pipeline steps run in worker processes need the factory that builds them.')
+    steps = sort_steps(steps)
+    checkpoints = {
+        step.name: PipelineCheckpoint.objects.get_or_create(job=job, period=period, step=step.name)[0]
+        for step in steps
+    }
+    done = {step.name for step in steps if checkpoints[step.name].state == 'done'}
+    failed, running, waiting = set(), {}, set()
+    for step in steps:
+        checkpoint = checkpoints[step.name]
+        if step.name in done or not step.when or checkpoint.condition_met:
+            continue
+        if step.when():
+            PipelineCheckpoint.objects.filter(id=checkpoint.id).update(condition_met=True)
+        else:
+            waiting.add(step.name)
+
+    def ready():
+        return [step for step in steps if step.name not in done | failed | waiting | running.keys()
+                and all(name in done for name in step.depends)]
+
+    if not processes:
+        while ready():
+            step = ready()[0]
+            try:
+                run_step(job, period, step)
+                done.add(step.name)
+            except Exception:
+                traceback.print_exc()
+                failed.add(step.name)
+        return get_pipeline_checkpoints(job, period, steps)
+
+    context = multiprocessing.get_context('spawn')
+    path, args = factory
+    while True:
+        for step in ready()[:processes - len(running)]:
+            process = context.Process(target=run_step_process, args=(job, period, path, tuple(args), step.name),
+                                      name=step.name)
+            process.start()
+            running[step.name] = process
+        if not running:
+            break
+        multiprocessing.connection.wait([process.sentinel for process in running.values()])
+        for name, process in list(running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del running[name]
+            (done if process.exitcode == 0 else failed).add(name)
+    return get_pipeline_checkpoints(job, period, steps)
+
+
+def get_pipeline_checkpoints(job, period, steps):
+    checkpoints = {checkpoint.step: checkpoint for checkpoint in
+                   PipelineCheckpoint.objects.filter(job=job, period=period)}
+    return [checkpoints[step.name] for step in sort_steps(steps) if step.name in checkpoints]
+
+
+def format_pipeline_report(checkpoints, elapsed=None):
+    """
+    Per-step timing table of a pipeline run.
+    """
+    lines = [f"{'Step':<28} {'State':<8} {'Chunks':>6} {'Items':>7} {'Seconds':>9}"]
+    for checkpoint in checkpoints:
+        lines.append(f"{checkpoint.step:<28} {checkpoint.state:<8} {checkpoint.chunks_done:>6} "
+                     f"{checkpoint.items_done:>7} {checkpoint.seconds:>9.2f}")
+    if elapsed is not None:
+        lines.append(f"Wall time {elapsed:.2f}s, step time {sum(c.seconds for c in checkpoints):.2f}s")
+    return '\n'.join(lines)
@@ -0,0 +1,26 @@
+"""
+Entry point of the pipeline worker processes. Workers are spawned, not forked: the scheduler and the job workers
+run jobs in threads, and a fork copies only the calling thread along with locks other threads may hold. A spawned
+interpreter starts empty, so this module sets Django up before importing anything that touches the models, then
+rebuilds the steps from their factory, since the steps themselves hold closures and cannot be pickled.
+"""
+import importlib
+import traceback
+
+
+def run_step_process(job, period, factory, args, name):
+    import django
+
+    django.setup()
+    from django.db import connections
+    from master.pipeline import run_step
+
+    module, _, attribute = factory.rpartition('.')
+    steps = getattr(importlib.import_module(module), attribute)(*args)
+    try:
+        run_step(job, period, next(step for step in steps if step.name == name))
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
+    finally:
+        connections.close_all()
@@ -1,7 +1,7 @@
 from import_export import resources
 
 from master.models import Country, State, City, BannerImage, GST, RewardMaster, CompanyBankDetailsMaster, RoyaltyMaster, \
-    CoreGroupIncome, CoreGroupPhase
+    CoreGroupIncome, CoreGroupPhase, JobLease, Job, ScheduledJobRun, OutboxEvent, PipelineCheckpoint, PipelineChunk
 
 
 class CountryResource(resources.ModelResource):
@@ -71,4 +71,40 @@ class CoreGroupIncomeResource(resources.ModelResource):
     class Meta:
         model = CoreGroupIncome
         import_id_fields = ('id',)
-        exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
\ No newline at end of file
+        exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
+
+
+class JobLeaseResource(resources.ModelResource):
+    class Meta:
+        model = JobLease
+        import_id_fields = ('id',)
+
+
+class JobResource(resources.ModelResource):
+    class Meta:
+        model = Job
+        import_id_fields = ('id',)
+
+
+class ScheduledJobRunResource(resources.ModelResource):
+    class Meta:
+        model = ScheduledJobRun
+        import_id_fields = ('id',)
+
+
+class OutboxEventResource(resources.ModelResource):
+    class Meta:
+        model = OutboxEvent
+        import_id_fields = ('id',)
+
+
+class PipelineCheckpointResource(resources.ModelResource):
+    class Meta:
+        model = PipelineCheckpoint
+        import_id_fields = ('id',)
+
+
+class PipelineChunkResource(resources.ModelResource):
+    class Meta:
+        model = PipelineChunk
+        import_id_fields = ('id',)
@@ -0,0 +1,182 @@
+"""
+In-process replacement for the crontab entries django_crontab installs.
+
+`manage.py scheduler` keeps one warm process: every job function is imported once at start up, the entries of
+SCHEDULER_JOBS (CRONJOBS when unset) fire on their schedule in a thread pool and every run is recorded as a
+ScheduledJobRun. Schedules use the crontab syntax; a six field schedule starts with the seconds, so the income
+pipelines can run more often than once a minute.
+"""
+import datetime
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from master.models import ScheduledJobRun
+
+SCHEDULER_WORKERS = 4
+SCHEDULER_HISTORY = datetime.timedelta(days=30)
+# The loop wakes at least this often, so a changed system clock is noticed.
+MAX_SLEEP = 30
+
+
+class CronSchedule:
+    """
+    Parsed `[second] minute hour day month weekday` crontab schedule with numbers, `*`, lists, ranges and steps.
+    """
+    FIELDS = (('second', 0, 59), ('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12),
+              ('weekday', 0, 7))
+
+    def __init__(self, expression):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) == 5:
+            parts = ['0'] + parts
+        if len(parts) != 6:
+            raise ValueError(f'Schedule {expression!r} needs five or six fields.')
+        values = {name: self.parse_field(part, low, high) for part, (name, low, high) in zip(parts, self.FIELDS)}
+        self.seconds, self.minutes, self.hours = values['second'], values['minute'], values['hour']
+        self.days, self.months = values['day'], values['month']
+        # Sunday is both 0 and 7.
+        self.weekdays = {day % 7 for day in values['weekday']}
+        # As in cron, a restricted day and weekday match when either of them does.
+        self.any_day = parts[3] == '*'
+        self.any_weekday = parts[5] == '*'
+
+    @staticmethod
+    def parse_field(part, low, high):
+        values = set()
+        for item in part.split(','):
+            item, _, step = item.partition('/')
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-'))
+            else:
+                start = end = int(item)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f'{part!r} is outside {low}-{high}.')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """
+        First time strictly after `moment` the schedule fires.
+        """
+        moment = moment.replace(microsecond=0) + datetime.timedelta(seconds=1)
+        limit = moment + datetime.timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + datetime.timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0, second=0)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0, second=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0, second=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment = moment.replace(second=0) + datetime.timedelta(minutes=1)
+            elif moment.second not in self.seconds:
+                later = [second for second in self.seconds if second > moment.second]
+                if later:
+                    moment = moment.replace(second=min(later))
+                else:
+                    moment = moment.replace(second=0) + datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f'Schedule {self.expression!r} never fires.')
+
+
+class ScheduledEntry:
+    """
+    One `(schedule, 'dotted.path', args, kwargs)` entry in the CRONJOBS format; a trailing django_crontab command
+    suffix is ignored.
+    """
+
+    def __init__(self, schedule, path, args=(), kwargs=None, *rest):
+        self.schedule = CronSchedule(schedule)
+        self.path = path
+        self.func = import_string(path)
+        self.args = tuple(args or ())
+        self.kwargs = dict(kwargs or {})
+        self.next_run = None
+        self.future = None
+
+    def __str__(self):
+        return f'{self.schedule.expression} {self.path}'
+
+
+def get_scheduled_entries():
+    jobs = getattr(settings, 'SCHEDULER_JOBS', None)
+    return [ScheduledEntry(*job) for job in (settings.CRONJOBS if jobs is None else jobs)]
+
+
+def run_entry(entry, scheduled_for):
+    """
+    Run one firing of an entry in a pool thread and record it. The thread's connection is kept between runs within
+    CONN_MAX_AGE, like a request thread's.
+    """
+    close_old_connections()
+    run = ScheduledJobRun.objects.create(
+        name=entry.path, schedule=entry.schedule.expression, scheduled_for=scheduled_for,
+        started_at=datetime.datetime.now(), host=socket.gethostname())
+    try:
+        entry.func(*entry.args, **entry.kwargs)
+    except Exception:
+        ScheduledJobRun.objects.filter(id=run.id).update(
+            state='failed', finished_at=datetime.datetime.now(), error=traceback.format_exc())
+    else:
+        ScheduledJobRun.objects.filter(id=run.id).update(state='succeeded', finished_at=datetime.datetime.now())
+    finally:
+        close_old_connections()
+
+
+class Scheduler:
+
+    def __init__(self, entries, workers=SCHEDULER_WORKERS):
+        self.entries = entries
+        self.workers = workers
+        self.stop = threading.Event()
+
+    def fire(self, pool, entry, scheduled_for):
+        if entry.future and not entry.future.done():
+            ScheduledJobRun.objects.create(
+                name=entry.path, schedule=entry.schedule.expression, scheduled_for=scheduled_for, state='skipped',
+                host=socket.gethostname(), error='The previous run was still going.')
+            return
+        entry.future = pool.submit(run_entry, entry, scheduled_for)
+
+    def run(self):
+        now = datetime.datetime.now()
+        for entry in self.entries:
+            entry.next_run = entry.schedule.next_after(now)
+        pruned = None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler') as pool:
+            while not self.stop.is_set():
+                now = datetime.datetime.now()
+                for entry in self.entries:
+                    if entry.next_run <= now:
+                        self.fire(pool, entry, entry.next_run)
+                        # Runs missed while the process was paused are not caught up, the next one is in the future.
+                        entry.next_run = entry.schedule.next_after(now)
+
+                if pruned is None or now - pruned > datetime.timedelta(hours=1):
+                    ScheduledJobRun.objects.filter(scheduled_for__lt=now - SCHEDULER_HISTORY).delete()
+                    pruned = now
+
+                wake = min((entry.next_run for entry in self.entries), default=now + datetime.timedelta(
+                    seconds=MAX_SLEEP))
+                self.stop.wait(min(max((wake - datetime.datetime.now()).total_seconds(), 0), MAX_SLEEP))
@@ -86,4 +86,9 @@ class CoreGroupIncomeListSerializer(serializers.ModelSerializer):
 class CoreGroupPhaseSerializer(serializers.ModelSerializer):
     class Meta:
         model = CoreGroupPhase
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'state', 'attempts', 'max_attempts', 'run_after', 'finished_at', 'date_created')
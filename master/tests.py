@@ -1,3 +1,268 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from master.helpers import acquire_job_lease, renew_job_lease, release_job_lease, job_lease, LeaseLost, \
+    background_job, run_pending_jobs, requeue_stalled_jobs, publish_event, dispatch_outbox, OUTBOX_HANDLERS, \
+    OUTBOX_MAX_ATTEMPTS, JOB_TIMEOUT
+from master.models import JobLease, Job, OutboxEvent, PipelineCheckpoint
+from master.pipeline import Step, run_pipeline
+from master.scheduler import CronSchedule
+from p2pmb.cron import process_p2pmb_monthly_interest
+
+calls = []
+
+
+@background_job
+def record_call(value):
+    calls.append(value)
+
+
+@background_job(max_attempts=2)
+def always_fail():
+    raise RuntimeError('boom')
+
+
+def handle_event(value):
+    if value == 'fail':
+        raise RuntimeError('boom')
+    calls.append(value)
+
+
+class JobLeaseTest(TestCase):
+
+    def test_only_one_holder_at_a_time(self):
+        self.assertTrue(acquire_job_lease('job', 'host-a'))
+        self.assertFalse(acquire_job_lease('job', 'host-b'))
+        release_job_lease('job', 'host-a')
+        self.assertTrue(acquire_job_lease('job', 'host-b'))
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(acquire_job_lease('job', 'host-a'))
+        JobLease.objects.filter(name='job').update(expires_at=datetime.datetime.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(acquire_job_lease('job', 'host-b'))
+        with self.assertRaises(LeaseLost):
+            renew_job_lease('job', 'host-a')
+        renew_job_lease('job', 'host-b')
+
+    def test_decorated_job_skips_while_leased(self):
+        calls = []
+
+        @job_lease(name='job')
+        def job():
+            calls.append(1)
+            job()
+            return 'done'
+
+        self.assertEqual(job(), 'done')
+        self.assertEqual(calls, [1])
+        self.assertEqual(JobLease.objects.get(name='job').holder, '')
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_by_priority(self):
+        record_call.enqueue(value='low')
+        Job.objects.filter(id=record_call.enqueue(value='high').id).update(priority=10)
+        record_call.enqueue(value='later', run_after=datetime.datetime.now() + datetime.timedelta(hours=1))
+
+        self.assertEqual(run_pending_jobs(), 2)
+        self.assertEqual(calls, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(state='done').count(), 2)
+        self.assertEqual(Job.objects.filter(state='queued').count(), 1)
+
+    def test_failed_job_backs_off_then_dies(self):
+        job = always_fail.enqueue()
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, datetime.datetime.now())
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+        Job.objects.filter(id=job.id).update(run_after=datetime.datetime.now())
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), ('dead', 2))
+        self.assertEqual(run_pending_jobs(), 0)
+
+    def test_stalled_job_is_queued_again(self):
+        job = record_call.enqueue(value='stalled')
+        Job.objects.filter(id=job.id).update(
+            state='running', attempts=1, locked_at=datetime.datetime.now() - datetime.timedelta(days=1))
+        self.assertEqual(requeue_stalled_jobs(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(calls, ['stalled'])
+
+    def test_long_leased_job_is_not_queued_again_while_running(self):
+        job = process_p2pmb_monthly_interest.enqueue()
+        self.assertEqual(job.timeout, datetime.timedelta(hours=6))
+        self.assertEqual(record_call.enqueue(value='x').timeout, JOB_TIMEOUT)
+        Job.objects.filter(id=job.id).update(
+            state='running', attempts=1, locked_at=datetime.datetime.now() - datetime.timedelta(hours=3))
+        self.assertEqual(requeue_stalled_jobs(), 0)
+        Job.objects.filter(id=job.id).update(locked_at=datetime.datetime.now() - datetime.timedelta(hours=7))
+        self.assertEqual(requeue_stalled_jobs(), 1)
+
+    def test_job_list_is_for_staff_only(self):
+        record_call.enqueue(value='secret')
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='job-user'))
+        self.assertEqual(client.get('/api/master/job/').status_code, 403)
+        client.force_authenticate(User.objects.create(username='job-staff', is_staff=True))
+        self.assertEqual(client.get('/api/master/job/').status_code, 200)
+
+
+class CronScheduleTest(TestCase):
+
+    def next_runs(self, expression, start, count=3):
+        runs, moment = [], start
+        for _ in range(count):
+            moment = CronSchedule(expression).next_after(moment)
+            runs.append(moment)
+        return runs
+
+    def test_crontab_fields(self):
+        start = datetime.datetime(2026, 1, 31, 23, 58, 10)
+        self.assertEqual(self.next_runs('*/7 * * * *', start), [
+            datetime.datetime(2026, 2, 1, 0, 0), datetime.datetime(2026, 2, 1, 0, 7),
+            datetime.datetime(2026, 2, 1, 0, 14)])
+        self.assertEqual(self.next_runs('0 0 1 * *', start, 2), [
+            datetime.datetime(2026, 2, 1), datetime.datetime(2026, 3, 1)])
+        self.assertEqual(self.next_runs('30 1 * * 0', start, 2), [
+            datetime.datetime(2026, 2, 1, 1, 30), datetime.datetime(2026, 2, 8, 1, 30)])
+
+    def test_seconds_field(self):
+        start = datetime.datetime(2026, 1, 1, 10, 0, 20, 500)
+        self.assertEqual(self.next_runs('15,45 * * * * *', start), [
+            datetime.datetime(2026, 1, 1, 10, 0, 45), datetime.datetime(2026, 1, 1, 10, 1, 15),
+            datetime.datetime(2026, 1, 1, 10, 1, 45)])
+
+    def test_invalid_schedule(self):
+        with self.assertRaises(ValueError):
+            CronSchedule('61 * * * *')
+        with self.assertRaises(ValueError):
+            CronSchedule('* * *')
+
+
+@mock.patch.dict(OUTBOX_HANDLERS, {'test.event': 'master.tests.handle_event'})
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_events_are_handled_in_order(self):
+        for value in ('first', 'second', 'third'):
+            publish_event('test.event', value=value)
+        self.assertEqual(dispatch_outbox(limit=2), 2)
+        self.assertEqual(dispatch_outbox(), 1)
+        self.assertEqual(calls, ['first', 'second', 'third'])
+        self.assertFalse(OutboxEvent.objects.exclude(state='done').exists())
+
+    def test_failed_event_holds_back_the_rest_until_dead(self):
+        failing = publish_event('test.event', value='fail')
+        publish_event('test.event', value='after')
+        for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+            self.assertEqual(dispatch_outbox(), 0)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(dispatch_outbox(), 1)
+        self.assertEqual(calls, ['after'])
+        failing.refresh_from_db()
+        self.assertEqual((failing.state, failing.attempts), ('dead', OUTBOX_MAX_ATTEMPTS))
+
+    def test_unknown_topic_is_refused(self):
+        with self.assertRaises(ValueError):
+            publish_event('test.unknown')
+
+
+class PipelineTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        self.fail_on = {7}
+
+    def write_chunk(self, ids):
+        for item_id in ids:
+            # Rows written before the failing id roll back with the rest of the chunk.
+            JobLease.objects.get_or_create(name=f'item-{item_id}', defaults={'expires_at': datetime.datetime.now()})
+            if item_id in self.fail_on:
+                raise RuntimeError('boom')
+        calls.append(list(ids))
+
+    def get_steps(self):
+        return [
+            Step('report', lambda: calls.append('report'), depends=('items', 'other')),
+            Step('items', self.write_chunk, ids=lambda: [9, 3, 1, 7, 5, 2, 8, 4, 6, 10], chunk_size=3),
+            Step('other', lambda ids: calls.append(('other', list(ids))), ids=lambda: [1, 2]),
+        ]
+
+    def test_failed_chunk_resumes_without_repeating_committed_ones(self):
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', self.get_steps(), processes=0)}
+        self.assertEqual(checkpoints['items'].state, 'failed')
+        self.assertIn('boom', checkpoints['items'].error)
+        self.assertEqual((checkpoints['items'].chunks_done, checkpoints['items'].last_id), (2, 6))
+        self.assertEqual(checkpoints['other'].state, 'done')
+        self.assertEqual(checkpoints['report'].state, 'pending')
+        self.assertEqual(JobLease.objects.count(), 6)
+
+        self.fail_on = set()
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', self.get_steps(), processes=0)}
+        self.assertTrue(all(checkpoint.state == 'done' for checkpoint in checkpoints.values()))
+        self.assertEqual((checkpoints['items'].chunks_done, checkpoints['items'].items_done), (4, 10))
+        self.assertEqual(checkpoints['items'].chunks.count(), 4)
+        self.assertEqual(JobLease.objects.count(), 10)
+        self.assertEqual(calls, [[1, 2, 3], [4, 5, 6], ('other', [1, 2]), [7, 8, 9], [10], 'report'])
+
+    def test_done_pipeline_is_not_run_again(self):
+        self.fail_on = set()
+        run_pipeline('close', '2025-01', self.get_steps(), processes=0)
+        calls.clear()
+        run_pipeline('close', '2025-01', self.get_steps(), processes=0)
+        self.assertEqual(calls, [])
+        run_pipeline('close', '2025-02', self.get_steps(), processes=0)
+        self.assertEqual(calls[-1], 'report')
+        self.assertEqual(PipelineCheckpoint.objects.filter(state='done').count(), 6)
+
+    def test_step_waits_for_its_condition(self):
+        self.fail_on, due = set(), []
+        steps = self.get_steps()
+        steps[2].when = lambda: bool(due)
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', steps, processes=0)}
+        self.assertEqual((checkpoints['other'].state, checkpoints['report'].state), ('pending', 'pending'))
+        self.assertEqual(checkpoints['items'].state, 'done')
+
+        due.append(True)
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', steps, processes=0)}
+        self.assertTrue(all(checkpoint.state == 'done' for checkpoint in checkpoints.values()))
+        self.assertEqual(calls[-2:], [('other', [1, 2]), 'report'])
+
+    def test_met_condition_is_not_checked_again_on_resume(self):
+        self.fail_on, due = {7}, [True]
+        steps = self.get_steps()
+        steps[1].when = lambda: bool(due)
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', steps, processes=0)}
+        self.assertEqual(checkpoints['items'].state, 'failed')
+        self.assertTrue(checkpoints['items'].condition_met)
+
+        # A resume after the condition stopped holding finishes the step it started.
+        self.fail_on = set()
+        due.clear()
+        checkpoints = {c.step: c for c in run_pipeline('close', '2025-01', steps, processes=0)}
+        self.assertTrue(all(checkpoint.state == 'done' for checkpoint in checkpoints.values()))
+        self.assertEqual(calls[-3:], [[7, 8, 9], [10], 'report'])
+
+    def test_worker_processes_need_the_step_factory(self):
+        with self.assertRaises(ValueError):
+            run_pipeline('close', '2025-01', self.get_steps(), processes=2)
+        self.assertFalse(PipelineCheckpoint.objects.exists())
 
-# Create your tests here.
+    def test_dependency_cycle_is_refused(self):
+        steps = [Step('a', print, depends=('b',)), Step('b', print, depends=('a',))]
+        with self.assertRaises(ValueError):
+            run_pipeline('close', '2025-01', steps, processes=0)
@@ -14,6 +14,7 @@ router.register(r'company-bank-detail', CompanyBankDetailsMasterViewSet)
 router.register(r'royalty', RoyaltyMasterViewSet)
 router.register(r'core-group-phase', CoreGroupPhaseViewSet)
 router.register(r'core-group-income', CoreGroupIncomeViewset)
+router.register(r'job', JobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
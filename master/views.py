@@ -4,7 +4,7 @@ from collections import defaultdict
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 
 from master.serializers import *
@@ -150,4 +150,14 @@ class CoreGroupIncomeViewset(viewsets.ModelViewSet):
             return self.get_paginated_response(serializer.data)
 
         serializer = CoreGroupIncomeListSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Progress of the background jobs queued by the distribution endpoints, for staff only.
+    """
+    permission_classes = [IsAdminUser]
+    queryset = Job.objects.all().order_by('-id')
+    serializer_class = JobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['name', 'state']
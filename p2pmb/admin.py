@@ -3,10 +3,12 @@ from import_export.admin import ImportExportModelAdmin
 
 from accounts.admin import CustomModelAdminMixin
 from p2pmb.models import MLMTree, Package, ScheduledCommission, RoyaltyClub, Reward, Commission, P2PMBRoyaltyMaster, \
-    ExtraReward, CoreIncomeEarned, RoyaltyEarned, ExtraRewardEarned, HoldLevelIncome, LapsedAmount, ROIOverride
+    ExtraReward, CoreIncomeEarned, RoyaltyEarned, ExtraRewardEarned, HoldLevelIncome, LapsedAmount, ROIOverride, \
+    DirectIncomeSchedule, UserEarningsSummary
 from p2pmb.resources import MLMTreeResource, PackageResource, RoyaltyClubResource, ScheduledCommissionResource, \
     RewardResource, CommissionResource, P2PMBRoyaltyMasterResource, ExtraRewardResource, CoreIncomeEarnedResource, \
-    RoyaltyEarnedResource, ExtraRewardEarnedResource, HoldLevelIncomeResource, LapsedAmountResource, ROIOverrideResource
+    RoyaltyEarnedResource, ExtraRewardEarnedResource, HoldLevelIncomeResource, LapsedAmountResource, ROIOverrideResource, \
+    DirectIncomeScheduleResource, UserEarningsSummaryResource
 
 
 # Register your models here.
@@ -15,6 +17,7 @@ class MLMTreeAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     resource_class = MLMTreeResource
     raw_id_fields = ('created_by', 'updated_by', 'parent', 'child', 'referral_by')
     list_filter = ('status', )
+    readonly_fields = MLMTree.ROLLUP_FIELDS
 
 
 @admin.register(Package)
@@ -31,6 +34,20 @@ class ScheduledCommissionAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     list_filter = ('status', )
 
 
+@admin.register(DirectIncomeSchedule)
+class DirectIncomeScheduleAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = DirectIncomeScheduleResource
+    raw_id_fields = ('created_by', 'updated_by', 'investment', 'send_by', 'user')
+    list_filter = ('status', 'is_completed')
+
+
+@admin.register(UserEarningsSummary)
+class UserEarningsSummaryAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = UserEarningsSummaryResource
+    raw_id_fields = ('user', )
+    search_fields = ('user__username', 'user__email')
+
+
 @admin.register(RoyaltyClub)
 class RoyaltyClubResourceAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     resource_class = RoyaltyClubResource
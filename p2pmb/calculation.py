@@ -1,20 +1,24 @@
+import array
 import datetime
-from collections import deque
 from decimal import Decimal
-from itertools import combinations
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth.models import User
 from django.db import transaction
-from django.db.models import Count, Sum
+from django.db.models import Count, Sum, F, OuterRef, Subquery
 
+from accounts.models import Profile
 from agency.models import RewardEarned, Investment, InvestmentInterest
 from master.models import RewardMaster, RoyaltyMaster
-from p2pmb.helpers import create_transaction_entry, create_commission_entry, get_level_counts
+from p2pmb.helpers import create_transaction_entry, create_commission_entry, get_level_counts, get_ancestor_nodes, \
+    credit_wallets, get_latest_wallet_ids, get_turnover_investments, record_earnings, EarningsCap
 from p2pmb.models import MLMTree, ScheduledCommission, Commission, RoyaltyClub, Reward, P2PMBRoyaltyMaster, \
-    RoyaltyEarned, HoldLevelIncome, ROIOverride, LapsedAmount
+    RoyaltyEarned, HoldLevelIncome, ROIOverride, LapsedAmount, MLMTreeClosure, DirectIncomeSchedule
+from p2pmb.tree_snapshot import MLMTreeSnapshot
+from payment_app.helpers import post_wallet
 from payment_app.models import Transaction, UserWallet
-from real_estate.constant import TURNOVER_DISTRIBUTION
+from real_estate.constant import TURNOVER_DISTRIBUTION, ROYALTY_CLUB_DISTRIBUTION, ROYALTY_DEFAULT_USER_ID
+from utils.payout import apply_rates, paise_array, percent_to_basis_points, to_basis_points, to_paise, to_rupees
 
 
 # def calculate_level_income(instance, amount):
@@ -74,8 +78,11 @@ class DistributeDirectCommission:
         referral_user_wallet = UserWallet.objects.filter(user=referral_by, status='active').last()
         mlm_commission = MLMTree.objects.filter(child=referral_by, status='active').last()
         if referral_user_wallet:
-            referral_user_wallet.app_wallet_balance += instant_commission
-            referral_user_wallet.save()
+            instant_commission = EarningsCap.clip_one(
+                referral_by.id, instant_commission, 'direct_income',
+                f'Direct Income over the ID value while adding {child.username}')
+        if referral_user_wallet and instant_commission:
+            post_wallet(referral_user_wallet, {'app_wallet_balance': instant_commission}, 'commission')
             if mlm_commission:
                 mlm_commission.commission_earned += instant_commission
                 mlm_commission.save()
@@ -92,8 +99,11 @@ class DistributeDirectCommission:
     def process_parent_commission(parent, child, monthly_commission):
         regular_leader_wallet = UserWallet.objects.filter(user=parent, status='active').last()
         if regular_leader_wallet:
-            regular_leader_wallet.app_wallet_balance += monthly_commission
-            regular_leader_wallet.save()
+            monthly_commission = EarningsCap.clip_one(
+                parent.id, monthly_commission, 'direct_income',
+                f'Direct Income over the ID value while adding {child.username}')
+        if regular_leader_wallet and monthly_commission:
+            post_wallet(regular_leader_wallet, {'app_wallet_balance': monthly_commission}, 'commission')
 
             DistributeDirectCommission.create_commission_entry(
                 parent, child, 'direct', monthly_commission,
@@ -108,9 +118,12 @@ class DistributeDirectCommission:
         top_user = MLMTree.objects.filter(parent=12, position=1).first()
         admin_wallet = UserWallet.objects.filter(user=top_user.child, status='active').last()
         if top_user:
-            admin_wallet.app_wallet_balance += instant_commission
+            instant_commission = EarningsCap.clip_one(
+                top_user.child_id, instant_commission, 'direct_income',
+                f'Direct Income over the ID value while adding {profile_instance.child.username}')
+        if top_user and instant_commission:
+            post_wallet(admin_wallet, {'app_wallet_balance': instant_commission}, 'commission')
             top_user.commission_earned += instant_commission
-            admin_wallet.save()
             top_user.save()
 
             DistributeDirectCommission.create_commission_entry(
@@ -121,20 +134,22 @@ class DistributeDirectCommission:
                 profile_instance.child, top_user.child, instant_commission, 'commission',
                 'approved', f'Direct Commission Added while adding {profile_instance.child.username}')
 
-            if profile_instance.parent:
-                DistributeDirectCommission.schedule_monthly_payments(profile_instance.child,
-                                                                     profile_instance.parent, monthly_commission)
+        if top_user and profile_instance.parent:
+            DistributeDirectCommission.schedule_monthly_payments(profile_instance.child,
+                                                                 profile_instance.parent, monthly_commission)
 
     @staticmethod
     def create_commission_entry(created_by, commission_by, commission_type, amount, description):
-        Commission.objects.create(
-            created_by=created_by,
-            commission_by=commission_by,
-            commission_to=created_by,
-            commission_type=commission_type,
-            amount=amount,
-            description=description
-        )
+        with transaction.atomic():
+            commission = Commission.objects.create(
+                created_by=created_by,
+                commission_by=commission_by,
+                commission_to=created_by,
+                commission_type=commission_type,
+                amount=amount,
+                description=description
+            )
+            record_earnings([commission])
 
     @staticmethod
     def create_transaction_entry(created_by, receiver, amount, transaction_type,
@@ -152,25 +167,107 @@ class DistributeDirectCommission:
         )
 
     @staticmethod
-    def schedule_monthly_payments(child, parent, monthly_amount):
-        for month in range(1, 11):
-            DistributeDirectCommission.schedule_payment(child, parent, monthly_amount, month)
+    def get_first_installment_date():
+        return datetime.date.today().replace(day=1) + relativedelta(months=2)
 
     @staticmethod
-    def schedule_payment(sender, user, amount, months_ahead):
-        today = datetime.date.today()
-        first_of_next_month = (today.replace(day=1) + relativedelta(months=2))
-        scheduled_date = first_of_next_month + relativedelta(months=months_ahead - 1)
-        ScheduledCommission.objects.create(
-            created_by=user,
-            send_by=sender,
-            user=user,
-            amount=amount,
-            scheduled_date=scheduled_date
+    def schedule_monthly_payments(child, parent, monthly_amount, investment=None):
+        DirectIncomeSchedule.objects.create(
+            created_by=parent,
+            investment=investment,
+            send_by=child,
+            user=parent,
+            installment_amount=monthly_amount,
+            total_installments=10,
+            next_due_date=DistributeDirectCommission.get_first_installment_date()
         )
 
+    @staticmethod
+    def pay_due_installments(chunk_size=500):
+        """
+        Pay every installment due up to today from the compact direct income schedules, chunk by chunk.
+        """
+        today = datetime.date.today()
+        schedule_ids = list(DirectIncomeSchedule.objects.filter(
+            status='active', is_completed=False, next_due_date__lte=today
+        ).order_by('id').values_list('id', flat=True))
+        paid = 0
+        for index in range(0, len(schedule_ids), chunk_size):
+            paid += DistributeDirectCommission.pay_installment_chunk(schedule_ids[index:index + chunk_size], today)
+        return paid
+
+    @staticmethod
+    def pay_installment_chunk(schedule_ids, today):
+        """
+        Pay the due installments of the given schedules: per installment Commission/Transaction rows in bulk,
+        one wallet increment per receiver and one advancing UPDATE per (installments, next due date) group.
+        Installments over the receiver's ID value are lapsed but still count as paid.
+        """
+        with transaction.atomic():
+            schedules = list(DirectIncomeSchedule.objects.filter(
+                id__in=schedule_ids, is_completed=False, next_due_date__lte=today
+            ).select_for_update(skip_locked=True))
+            wallet_ids = get_latest_wallet_ids({schedule.user_id for schedule in schedules})
+            cap = EarningsCap(wallet_ids.keys())
+            usernames = dict(User.objects.filter(
+                id__in={schedule.send_by_id for schedule in schedules}).values_list('id', 'username'))
+
+            commissions, transactions = [], []
+            wallet_credits, advances = {}, {}
+            verified_on = datetime.datetime.now()
+            for schedule in schedules:
+                if schedule.user_id not in wallet_ids:
+                    continue
+
+                elapsed = relativedelta(today, schedule.next_due_date)
+                due_count = min(elapsed.years * 12 + elapsed.months + 1,
+                                schedule.total_installments - schedule.paid_installments)
+                if due_count <= 0:
+                    continue
+
+                description = (f'Direct Income Monthly Installment Added while adding '
+                               f'{usernames.get(schedule.send_by_id)}')
+                for _ in range(due_count):
+                    amount = cap.clip(schedule.user_id, schedule.installment_amount, 'direct_income',
+                                      f'{description} over the ID value')
+                    if not amount:
+                        continue
+                    commissions.append(Commission(
+                        created_by_id=schedule.user_id, commission_by_id=schedule.send_by_id,
+                        commission_to_id=schedule.user_id, commission_type=schedule.commission_type,
+                        amount=amount, description=description
+                    ))
+                    transactions.append(Transaction(
+                        created_by_id=schedule.user_id, sender_id=schedule.user_id, receiver_id=schedule.user_id,
+                        amount=amount, transaction_type='commission',
+                        transaction_status='approved', payment_method='wallet', remarks=description,
+                        verified_on=verified_on
+                    ))
+                    wallet_credits[schedule.user_id] = wallet_credits.get(schedule.user_id, Decimal('0')) + amount
+                next_due_date = schedule.next_due_date + relativedelta(months=due_count)
+                advances.setdefault((due_count, next_due_date), []).append(schedule.id)
+
+            Commission.objects.bulk_create(commissions)
+            Transaction.objects.bulk_create(transactions)
+            record_earnings(commissions)
+            cap.flush()
+            credit_wallets(wallet_credits, wallet_ids=wallet_ids)
+            for (due_count, next_due_date), ids in advances.items():
+                DirectIncomeSchedule.objects.filter(id__in=ids).update(
+                    paid_installments=F('paid_installments') + due_count, next_due_date=next_due_date,
+                    date_updated=verified_on
+                )
+            DirectIncomeSchedule.objects.filter(
+                id__in=[schedule.id for schedule in schedules], paid_installments__gte=F('total_installments')
+            ).update(is_completed=True)
+
+        return len(commissions)
+
     @staticmethod
     def cron_send_monthly_payment_direct_income():
+        DistributeDirectCommission.pay_due_installments()
+
+        # Per-month rows scheduled before the compact DirectIncomeSchedule
         schedule_commission_instance = ScheduledCommission.objects.filter(scheduled_date__date__lte=datetime.datetime.today(),
                                                                           is_paid=False, remarks__isnull=True)
         for income in schedule_commission_instance:
@@ -178,19 +275,21 @@ class DistributeDirectCommission:
             if not user_wallet:
                 continue
 
-            user_wallet.app_wallet_balance += income.amount
-            user_wallet.save()
+            description = f'Direct Income Monthly Installment Added while adding {income.send_by.username}'
+            with transaction.atomic():
+                amount = EarningsCap.clip_one(income.user_id, income.amount, 'direct_income',
+                                              f'{description} over the ID value')
+                if amount:
+                    post_wallet(user_wallet, {'app_wallet_balance': amount}, 'commission')
 
-            DistributeDirectCommission.create_commission_entry(
-                income.user, income.send_by, 'direct', income.amount,
-                f'Direct Income Monthly Installment Added while adding {income.send_by.username}')
+                    DistributeDirectCommission.create_commission_entry(
+                        income.user, income.send_by, 'direct', amount, description)
 
-            DistributeDirectCommission.create_transaction_entry(
-                income.user, income.user, income.amount, 'commission', 'approved',
-                f'Direct Income Monthly Installment Added while adding {income.send_by.username}')
+                    DistributeDirectCommission.create_transaction_entry(
+                        income.user, income.user, amount, 'commission', 'approved', description)
 
-            income.is_paid = True
-            income.save()
+                income.is_paid = True
+                income.save()
 
     @staticmethod
     def distribute_monthly_commission():
@@ -201,19 +300,147 @@ class DistributeDirectCommission:
             if not user_wallet:
                 continue
 
-            user_wallet.app_wallet_balance += income.amount
-            user_wallet.save()
+            with transaction.atomic():
+                amount = EarningsCap.clip_one(income.user_id, income.amount, 'direct_income',
+                                              f'{income.remarks} over the ID value')
+                if amount:
+                    post_wallet(user_wallet, {'app_wallet_balance': amount}, 'commission')
 
-            DistributeDirectCommission.create_commission_entry(
-                income.user, income.send_by, 'direct', income.amount,
-                income.remarks)
+                    DistributeDirectCommission.create_commission_entry(
+                        income.user, income.send_by, 'direct', amount, income.remarks)
 
-            DistributeDirectCommission.create_transaction_entry(
-                income.user, income.user, income.amount, 'commission', 'approved',
-                income.remarks)
+                    DistributeDirectCommission.create_transaction_entry(
+                        income.user, income.user, amount, 'commission', 'approved', income.remarks)
+
+                income.is_paid = True
+                income.save()
+
+
+class DistributeDirectCommissionBatch:
+    """
+    Set-based direct income for the cron: the referrer rows of a chunk are prefetched, commissions, transactions
+    and installment schedules are bulk inserted and repeated credits to one referrer collapse into a single UPDATE.
+    """
+
+    @staticmethod
+    def get_pending_investments():
+        return Investment.objects.filter(
+            status='active', is_approved=True, pay_method='main_wallet', investment_type='p2pmb',
+            send_direct_income=False, package__isnull=False
+        )
 
-            income.is_paid = True
-            income.save()
+    @staticmethod
+    def distribute_pending(chunk_size=200, on_chunk=None):
+        """
+        Distribute direct income of every pending investment, oldest first, chunk by chunk. `on_chunk` is called
+        before each chunk, the cron uses it to renew its job lease.
+        """
+        investment_ids = list(dict.fromkeys(
+            DistributeDirectCommissionBatch.get_pending_investments().order_by('date_created').values_list(
+                'id', flat=True)
+        ))
+        processed = 0
+        for index in range(0, len(investment_ids), chunk_size):
+            if on_chunk:
+                on_chunk()
+            processed += DistributeDirectCommissionBatch.distribute_chunk(investment_ids[index:index + chunk_size])
+        return processed
+
+    @staticmethod
+    def distribute_chunk(investment_ids):
+        """
+        Distribute direct income for the given investments. Rows already flagged `send_direct_income` by an
+        earlier or concurrent run are skipped, so a chunk can safely be retried.
+        """
+        with transaction.atomic():
+            investments = list(
+                Investment.objects.filter(id__in=investment_ids, send_direct_income=False)
+                .select_for_update(skip_locked=True).order_by('date_created')
+            )
+            nodes = {
+                node.child_id: node for node in MLMTree.objects.filter(
+                    status='active', child_id__in={investment.user_id for investment in investments}
+                ).order_by('id')
+            }
+            eligible = [(investment, nodes[investment.user_id]) for investment in investments
+                        if investment.user_id in nodes]
+            if not eligible:
+                return 0
+
+            top_user = MLMTree.objects.filter(parent=12, position=1).first()
+            referrer_ids = {node.referral_by_id for _, node in eligible if node.referral_by_id}
+            receiver_ids = referrer_ids | ({top_user.child_id} if top_user else set())
+            wallet_ids = get_latest_wallet_ids(receiver_ids)
+            cap = EarningsCap(wallet_ids.keys())
+            referrer_nodes = {
+                child_id: node_id for child_id, node_id in MLMTree.objects.filter(
+                    status='active', child_id__in=referrer_ids).order_by('id').values_list('child_id', 'id')
+            }
+            usernames = dict(User.objects.filter(id__in=nodes.keys()).values_list('id', 'username'))
+
+            commissions, transactions, schedules = [], [], []
+            wallet_credits, commission_earned, paid_node_ids = {}, {}, set()
+            first_installment_date = DistributeDirectCommission.get_first_installment_date()
+            verified_on = datetime.datetime.now()
+
+            for investment, node in eligible:
+                if not investment.amount:
+                    continue
+                instant_commission = Decimal(investment.amount) * Decimal('0.03')
+                monthly_commission = Decimal(investment.amount) * Decimal('0.0015')
+                description = f'Direct Commission Added while adding {usernames[node.child_id]}'
+
+                if node.referral_by_id:
+                    receiver_id, sender_id, schedule_to = node.referral_by_id, node.referral_by_id, node.referral_by_id
+                    earned_node_id = referrer_nodes.get(receiver_id)
+                elif top_user:
+                    receiver_id, sender_id, schedule_to = top_user.child_id, node.child_id, node.parent_id
+                    earned_node_id = top_user.id
+                else:
+                    continue
+                paid_node_ids.add(node.id)
+
+                if receiver_id in wallet_ids:
+                    instant_commission = cap.clip(
+                        receiver_id, instant_commission, 'direct_income',
+                        f'Direct Income over the ID value while adding {usernames[node.child_id]}')
+                if receiver_id in wallet_ids and instant_commission:
+                    wallet_credits[receiver_id] = wallet_credits.get(receiver_id, Decimal('0')) + instant_commission
+                    if earned_node_id:
+                        commission_earned[earned_node_id] = (commission_earned.get(earned_node_id, Decimal('0')) +
+                                                             instant_commission)
+                    commissions.append(Commission(
+                        created_by_id=receiver_id, commission_by_id=node.child_id, commission_to_id=receiver_id,
+                        commission_type='direct', amount=instant_commission, description=description
+                    ))
+                    transactions.append(Transaction(
+                        created_by_id=sender_id, sender_id=sender_id, receiver_id=receiver_id,
+                        amount=instant_commission, transaction_type='commission', transaction_status='approved',
+                        payment_method='wallet', remarks=description, verified_on=verified_on
+                    ))
+
+                if schedule_to:
+                    schedules.append(DirectIncomeSchedule(
+                        created_by_id=schedule_to, investment=investment, send_by_id=node.child_id,
+                        user_id=schedule_to, installment_amount=monthly_commission, total_installments=10,
+                        next_due_date=first_installment_date
+                    ))
+
+            Commission.objects.bulk_create(commissions)
+            Transaction.objects.bulk_create(transactions)
+            record_earnings(commissions)
+            cap.flush()
+            DirectIncomeSchedule.objects.bulk_create(schedules)
+            credit_wallets(wallet_credits, wallet_ids=wallet_ids)
+            for node_id, amount in commission_earned.items():
+                MLMTree.objects.filter(id=node_id).update(commission_earned=F('commission_earned') + amount)
+            MLMTree.objects.filter(id__in=paid_node_ids).update(send_direct_income=True)
+            Investment.objects.filter(id__in=[investment.id for investment, _ in eligible]).update(
+                send_direct_income=True, date_updated=datetime.datetime.now()
+            )
+
+        print(f"✅ Direct Income Distributed for {len(eligible)} investments ({len(commissions)} credits).")
+        return len(eligible)
 
 
 # Distribute Level Income
@@ -345,21 +572,22 @@ class DistributeLevelIncome:
         Distribute commission up to max_levels above the user.
         Based on the receiver's directs and depth logic.
         """
-        current_user = user.parent
         base_user = user
-        distributed_levels = 0
         commission = Decimal(amount) * percent
         total_distributed = Decimal('0')
 
-        level = 1
+        if not user.parent or not max_levels:
+            return total_distributed
 
-        while distributed_levels < max_levels and current_user:
-            parent_relation = MLMTree.objects.filter(child=current_user).first()
+        ancestors = list(get_ancestor_nodes(user.child, max_levels).select_related('child'))
+        direct_counts = MLMTree.get_direct_referral_counts([node.child_id for node in ancestors])
 
-            if not parent_relation:
+        for level, parent_relation in enumerate(ancestors, start=1):
+            if parent_relation.depth != level:
                 break
 
-            direct_count = MLMTree.objects.filter(referral_by=current_user).count()
+            current_user = parent_relation.child
+            direct_count = direct_counts.get(current_user.id, 0)
             up_levels, down_levels = DistributeLevelIncome.get_level_counts(direct_count)
             if direct_count == 0:
                 direct_id_required = DistributeLevelIncome.get_level_by_direct_user_required_counts(level)
@@ -376,17 +604,20 @@ class DistributeLevelIncome:
             else:
                 if level <= up_levels:
                     total_distributed += commission
+                    paid = EarningsCap.clip_one(current_user.id, commission, 'level_income',
+                                                f'Level Income over the ID value for {base_user.child.username}')
+                    if not paid:
+                        continue
                     parent_wallet = UserWallet.objects.filter(user=current_user, status='active').last()
                     if parent_wallet:
-                        parent_wallet.app_wallet_balance += commission
-                        parent_wallet.save()
+                        post_wallet(parent_wallet, {'app_wallet_balance': paid}, 'commission')
 
                     create_transaction_entry(
-                        base_user.child, current_user, commission, 'commission', 'approved',
+                        base_user.child, current_user, paid, 'commission', 'approved',
                         f'Level Commission added by adding {base_user.child.username}'
                     )
 
-                    create_commission_entry(current_user, base_user.child, 'level', commission,
+                    create_commission_entry(current_user, base_user.child, 'level', paid,
                                             f'Level Commission added for {base_user.child.username}')
                 else:
                     direct_id_required = DistributeLevelIncome.get_level_by_direct_user_required_counts(level)
@@ -401,10 +632,6 @@ class DistributeLevelIncome:
                         direct_user_required=direct_id_required,
                     )
 
-            distributed_levels += 1
-            level += 1
-            current_user = parent_relation.parent
-
         return total_distributed
 
     @staticmethod
@@ -425,7 +652,7 @@ class DistributeLevelIncome:
         current_user = relation.child if relation else None
 
         while distributed_levels < max_levels and current_user:
-            direct_count = MLMTree.objects.filter(referral_by=current_user).count()
+            direct_count = MLMTree.get_direct_referral_counts([current_user.id]).get(current_user.id, 0)
             up_levels, down_levels = DistributeLevelIncome.get_level_counts(direct_count)
 
             if direct_count == 0:
@@ -442,18 +669,20 @@ class DistributeLevelIncome:
                 total_distributed += commission
             else:
                 if level <= down_levels:
-                    parent_wallet = UserWallet.objects.filter(user=current_user, status='active').last()
-                    if parent_wallet:
-                        parent_wallet.app_wallet_balance += commission
-                        parent_wallet.save()
-
-                    create_transaction_entry(
-                        base_user, current_user, commission, 'commission', 'approved',
-                        f'Down Level Commission added by {base_user.username}'
-                    )
+                    paid = EarningsCap.clip_one(current_user.id, commission, 'level_income',
+                                                f'Down Level Income over the ID value for {base_user.username}')
+                    if paid:
+                        parent_wallet = UserWallet.objects.filter(user=current_user, status='active').last()
+                        if parent_wallet:
+                            post_wallet(parent_wallet, {'app_wallet_balance': paid}, 'commission')
+
+                        create_transaction_entry(
+                            base_user, current_user, paid, 'commission', 'approved',
+                            f'Down Level Commission added by {base_user.username}'
+                        )
 
-                    create_commission_entry(current_user, base_user, 'level', commission,
-                                            f'Down Level Commission added for {base_user.username}')
+                        create_commission_entry(current_user, base_user, 'level', paid,
+                                                f'Down Level Commission added for {base_user.username}')
                     total_distributed += commission
                 else:
                     direct_id_required = DistributeLevelIncome.get_below_level_by_direct_user_required_counts(level)
@@ -543,54 +772,403 @@ class DistributeLevelIncome:
     #     return commission * Decimal(remaining_levels)
 
 
-class LifeTimeRewardIncome:
+class DistributeLevelIncomeBatch:
+    """
+    Set-based level income for the cron: a chunk of investments is resolved, computed in memory and written
+    back with bulk inserts and one aggregated wallet update per receiver, inside a single transaction.
+    """
+
     @staticmethod
-    def check_and_allocate_rewards():
-        parents = MLMTree.objects.filter(parent__isnull=False, status='active', is_show=True).select_related('parent')
+    def get_pending_investments():
+        return Investment.objects.filter(
+            status='active', is_approved=True, pay_method='main_wallet', investment_type='p2pmb',
+            send_level_income=False, package__isnull=False
+        )
 
-        processed_parents = {}
+    @staticmethod
+    def distribute_pending(chunk_size=200, on_chunk=None):
+        """
+        Distribute level income of every pending investment, oldest first, chunk by chunk. `on_chunk` is called
+        before each chunk, the cron uses it to renew its job lease.
+        """
+        investment_ids = list(dict.fromkeys(
+            DistributeLevelIncomeBatch.get_pending_investments().order_by('date_created').values_list('id', flat=True)
+        ))
+        processed = 0
+        for index in range(0, len(investment_ids), chunk_size):
+            if on_chunk:
+                on_chunk()
+            processed += DistributeLevelIncomeBatch.distribute_chunk(investment_ids[index:index + chunk_size])
+        return processed
 
-        reward_master_queryset = RewardMaster.objects.filter(applicable_for='p2pmb').only(
-            'id', 'turnover_threshold', 'gift_amount', 'total_paid_month'
-        )
+    @staticmethod
+    def get_first_child_chains(root_ids, max_depth):
+        """
+        First child (lowest id) of every node reachable from root_ids through first children, max_depth deep.
+        """
+        first_child = {}
+        frontier = set(root_ids)
+        for _ in range(max_depth):
+            frontier -= first_child.keys()
+            if not frontier:
+                break
+            rows = MLMTree.objects.filter(parent_id__in=frontier).order_by('-id').values_list('parent_id', 'child_id')
+            found = {}
+            for parent_id, child_id in rows:
+                found[parent_id] = child_id
+            first_child.update(found)
+            frontier = set(found.values())
+        return first_child
 
-        for parent in parents:
-            if parent.parent_id in processed_parents:
-                continue
+    @staticmethod
+    def distribute_chunk(investment_ids):
+        """
+        Distribute level income for the given investments and mark them as sent. Returns the number processed.
+        """
+        commission_percent = Decimal(0.0015)
+        with transaction.atomic():
+            investments = list(
+                Investment.objects.filter(id__in=investment_ids, send_level_income=False)
+                .select_for_update(skip_locked=True).order_by('date_created')
+            )
+            user_ids = {investment.user_id for investment in investments if investment.user_id}
+            nodes = {
+                node.child_id: node for node in
+                MLMTree.objects.filter(status='active', child_id__in=user_ids).order_by('id')
+            }
+            referrer_direct_counts = MLMTree.get_direct_referral_counts(
+                {node.referral_by_id for node in nodes.values()})
+
+            eligible = []
+            for investment in investments:
+                node = nodes.get(investment.user_id)
+                if not node:
+                    print(f"User {investment.user_id} is not enroll in MLM yet.")
+                    continue
+                up_levels, down_levels = get_level_counts(referrer_direct_counts.get(node.referral_by_id, 0))
+                if up_levels and down_levels:
+                    eligible.append((investment, node, up_levels, down_levels))
+            if not eligible:
+                return 0
+
+            upline = {}
+            for descendant_id, ancestor_id, depth in MLMTreeClosure.objects.filter(
+                    descendant_id__in=[node.child_id for _, node, _, _ in eligible if node.parent_id],
+                    depth__range=(1, max(up for _, _, up, _ in eligible))
+            ).order_by('depth').values_list('descendant_id', 'ancestor_id', 'depth'):
+                upline.setdefault(descendant_id, []).append((depth, ancestor_id))
+            ancestor_ids = {ancestor_id for path in upline.values() for _, ancestor_id in path}
+            show_levels = dict(MLMTree.objects.filter(child_id__in=ancestor_ids).values_list('child_id', 'show_level'))
+
+            first_child = DistributeLevelIncomeBatch.get_first_child_chains(
+                [node.child_id for _, node, _, _ in eligible], max(down for _, _, _, down in eligible)
+            )
+            receiver_ids = ancestor_ids | set(first_child.values())
+            direct_counts = MLMTree.get_direct_referral_counts(receiver_ids)
+            usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+            cap = EarningsCap(receiver_ids)
+
+            holds, commissions, transactions, lapsed = [], [], [], []
+            wallet_credits = {}
+            verified_on = datetime.datetime.now()
+
+            def allocate(base_id, receiver_id, level, level_type, on_level, commission):
+                username = usernames[base_id]
+                prefix = 'Level' if level_type == 'up' else 'Down Level'
+                direct_count = direct_counts.get(receiver_id, 0)
+                up_levels, down_levels = get_level_counts(direct_count)
+                if direct_count and level <= (up_levels if level_type == 'up' else down_levels):
+                    commission = cap.clip(receiver_id, commission, 'level_income',
+                                          f'{prefix} Income over the ID value for {username}')
+                    if not commission:
+                        return
+                    wallet_credits[receiver_id] = wallet_credits.get(receiver_id, Decimal('0')) + commission
+                    transactions.append(Transaction(
+                        created_by_id=base_id, sender_id=base_id, receiver_id=receiver_id, amount=commission,
+                        transaction_type='commission', transaction_status='approved', payment_method='wallet',
+                        remarks=(f'Level Commission added by adding {username}' if level_type == 'up'
+                                 else f'Down Level Commission added by {username}'),
+                        verified_on=verified_on
+                    ))
+                    commissions.append(Commission(
+                        created_by_id=receiver_id, commission_by_id=base_id, commission_to_id=receiver_id,
+                        commission_type='level', amount=commission,
+                        description=f'{prefix} Commission added for {username}'
+                    ))
+                    return
+                if direct_count and level_type == 'down':
+                    direct_id_required = DistributeLevelIncome.get_below_level_by_direct_user_required_counts(level)
+                else:
+                    direct_id_required = DistributeLevelIncome.get_level_by_direct_user_required_counts(level)
+                holds.append(HoldLevelIncome(
+                    commission_by_id=base_id, commission_to_id=receiver_id, level_type=level_type,
+                    amount=commission, on_level=on_level, description=f'{prefix} Commission added for {username}',
+                    direct_user_required=direct_id_required,
+                ))
 
-            children = list(MLMTree.objects.filter(parent=parent.parent, status='active')[:5])
+            for investment, node, up_levels, down_levels in eligible:
+                amount = investment.amount if investment.amount else 0
+                commission = Decimal(amount) * commission_percent
+                base_id = node.child_id
 
-            if len(children) < 4:
-                continue
+                total_above = Decimal('0')
+                for level, (depth, ancestor_id) in enumerate(upline.get(base_id, [])[:up_levels], start=1):
+                    if depth != level or ancestor_id not in show_levels:
+                        break
+                    allocate(base_id, ancestor_id, level, 'up', show_levels[ancestor_id] or 0, commission)
+                    total_above += commission
+
+                total_below = Decimal('0')
+                receiver_id = first_child.get(base_id)
+                for level in range(1, down_levels + 1):
+                    if not receiver_id:
+                        break
+                    allocate(base_id, receiver_id, level, 'down', level, commission)
+                    total_below += commission
+                    receiver_id = first_child.get(receiver_id)
+
+                remaining_above = amount * Decimal(0.03) - total_above
+                remaining_below = amount * Decimal(0.015) - total_below
+                if int(remaining_above) > 0:
+                    lapsed.append(LapsedAmount(user_id=base_id, earned_type='level_income', amount=remaining_above,
+                                               remarks=f'Up Level Income Remaining in the top up of {amount}'))
+                if int(remaining_below) > 0:
+                    lapsed.append(LapsedAmount(user_id=base_id, earned_type='level_income', amount=remaining_below,
+                                               remarks=f'Down Level Income Remaining in the top up of {amount}'))
+
+            HoldLevelIncome.objects.bulk_create(holds)
+            Commission.objects.bulk_create(commissions)
+            Transaction.objects.bulk_create(transactions)
+            record_earnings(commissions)
+            LapsedAmount.objects.bulk_create(lapsed)
+            cap.flush()
+            credit_wallets(wallet_credits)
+            Investment.objects.filter(id__in=[investment.id for investment, _, _, _ in eligible]).update(
+                send_level_income=True, date_updated=datetime.datetime.now()
+            )
+
+        print(f"✅ Level Income Distributed for {len(eligible)} investments "
+              f"({len(commissions)} credits, {len(holds)} on hold).")
+        return len(eligible)
+
+
+class ReleaseHoldLevelIncome:
+    """
+    Release held level income once the receiver has the direct referrals it was held for. Rows are picked through
+    the (commission_to, release_status, direct_user_required) index and released in one batch per chunk.
+    """
 
-            processed_parents[parent.parent_id] = True
+    @staticmethod
+    def release_for_user(user_id):
+        """
+        Release the held rows a single user now qualifies for, called when their direct count grows.
+        """
+        direct_count = MLMTree.get_direct_referral_counts([user_id]).get(user_id)
+        if not direct_count:
+            return 0
+        return ReleaseHoldLevelIncome.release_rows(HoldLevelIncome.objects.filter(
+            commission_to_id=user_id, release_status='on_hold', direct_user_required__lte=direct_count
+        ))
 
-            for reward in reward_master_queryset:
-                if RewardEarned.objects.filter(
-                        user=parent.parent, reward=reward, status='active', is_p2p=True
-                ).exists():
+    @staticmethod
+    def release_qualified(chunk_size=1000, on_chunk=None):
+        """
+        Periodic sweep: release every held row whose receiver's direct count now meets its requirement. `on_chunk`
+        is called before each chunk.
+        """
+        direct_count = MLMTree.objects.filter(child=OuterRef('commission_to')).order_by('-id').values(
+            'referral_count')[:1]
+        hold_ids = list(HoldLevelIncome.objects.filter(release_status='on_hold').annotate(
+            receiver_direct_count=Subquery(direct_count)
+        ).filter(direct_user_required__lte=F('receiver_direct_count')).order_by('id').values_list('id', flat=True))
+
+        released = 0
+        for index in range(0, len(hold_ids), chunk_size):
+            if on_chunk:
+                on_chunk()
+            released += ReleaseHoldLevelIncome.release_rows(
+                HoldLevelIncome.objects.filter(id__in=hold_ids[index:index + chunk_size], release_status='on_hold')
+            )
+        return released
+
+    @staticmethod
+    def release_rows(queryset):
+        """
+        Credit the held rows of the queryset: bulk Commission/Transaction rows, one wallet increment per
+        receiver and a single status update. Amounts over the receiver's ID value are lapsed. Returns the number
+        of rows released.
+        """
+        with transaction.atomic():
+            holds = list(queryset.filter(status='active').select_for_update(skip_locked=True))
+            if not holds:
+                return 0
+
+            released_on = datetime.datetime.now()
+            cap = EarningsCap(hold.commission_to_id for hold in holds)
+            wallet_credits = {}
+            commissions, transactions = [], []
+            for hold in holds:
+                description = f'{hold.description} (released from hold)'
+                amount = cap.clip(hold.commission_to_id, hold.amount, 'level_income',
+                                  f'{hold.description} over the ID value')
+                if not amount:
                     continue
+                wallet_credits[hold.commission_to_id] = (wallet_credits.get(hold.commission_to_id, Decimal('0')) +
+                                                         amount)
+                commissions.append(Commission(
+                    created_by_id=hold.commission_to_id, commission_by_id=hold.commission_by_id,
+                    commission_to_id=hold.commission_to_id, commission_type='level', level_type=hold.level_type,
+                    amount=amount, description=description
+                ))
+                transactions.append(Transaction(
+                    created_by_id=hold.commission_by_id, sender_id=hold.commission_by_id,
+                    receiver_id=hold.commission_to_id, amount=amount, transaction_type='commission',
+                    transaction_status='approved', payment_method='wallet', remarks=description,
+                    verified_on=released_on
+                ))
+
+            Commission.objects.bulk_create(commissions)
+            Transaction.objects.bulk_create(transactions)
+            record_earnings(commissions)
+            cap.flush()
+            credit_wallets(wallet_credits)
+            HoldLevelIncome.objects.filter(id__in=[hold.id for hold in holds]).update(
+                release_status='release', released_date=released_on, date_updated=released_on
+            )
+        return len(holds)
 
-                threshold = reward.turnover_threshold
 
-                for comb in combinations(children, 4):
-                    turnovers = sorted([child.turnover for child in comb], reverse=True)
+class ReconcileTurnover:
 
-                    if all(turnovers[i] >= (threshold * TURNOVER_DISTRIBUTION[i]) / 100 for i in range(4)):
-                        parent.commission_earned += reward.gift_amount or 0
-                        parent.save()
+    @staticmethod
+    def expected_turnover(snapshot):
+        """
+        Per snapshot node, the turnover (paise) of its whole subtree recomputed from the approved investments.
+        """
+        own = array.array('q', [0]) * len(snapshot)
+        for _, user_id, amount in get_turnover_investments().values_list('id', 'user_id', 'amount').distinct():
+            node = snapshot.index_of(user_id)
+            if node >= 0:
+                own[node] += to_paise(amount)
+        return snapshot.subtree_sums(values=own)
 
-                        RewardEarned.objects.create(
-                            user=parent.parent,
-                            created_by=parent.parent,
-                            reward=reward,
-                            earned_at=datetime.datetime.now().today().replace(day=1),
-                            turnover_at_earning=parent.turnover,
-                            is_paid=True,
-                            total_month=reward.total_paid_month,
-                            is_p2p=True
-                        )
-                        break
+    @staticmethod
+    def reconcile(dry_run=False, batch_size=1000):
+        """
+        Recompute every subtree turnover in one pass and correct the nodes that drifted. The tree rows are locked
+        before the investments are read: an approval rolling up its turnover waits for the reconcile to commit, so
+        its investment is either in both reads or in neither and is never counted twice. Returns the number of
+        drifted nodes.
+        """
+        with transaction.atomic():
+            snapshot = MLMTreeSnapshot.load(lock=True)
+            expected = ReconcileTurnover.expected_turnover(snapshot)
+            drift = {}
+            for node in range(len(snapshot)):
+                delta = expected[node] - snapshot.turnover[node]
+                if delta:
+                    drift.setdefault(delta, []).append(snapshot.user_ids[node])
+
+            if not dry_run:
+                for delta, user_ids in drift.items():
+                    for index in range(0, len(user_ids), batch_size):
+                        MLMTree.objects.filter(child_id__in=user_ids[index:index + batch_size]).update(
+                            turnover=F('turnover') + to_rupees(delta))
+
+        return sum(len(user_ids) for user_ids in drift.values())
+
+
+class LifeTimeRewardIncome:
+    @staticmethod
+    def legs_reach_threshold(legs, threshold):
+        return all(legs[i] >= (threshold * share) / 100 for i, share in enumerate(TURNOVER_DISTRIBUTION))
+
+    @staticmethod
+    def highest_reward_reached(legs, rewards):
+        """
+        Number of rewards (sorted by threshold) reached by the legs. The condition is monotonic in the threshold,
+        so the boundary is found by binary search.
+        """
+        low, high = 0, len(rewards)
+        while low < high:
+            middle = (low + high) // 2
+            if LifeTimeRewardIncome.legs_reach_threshold(legs, rewards[middle].turnover_threshold):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def check_and_allocate_rewards():
+        """
+        Award every p2pmb lifetime reward a parent's four strongest legs now qualify for. A set of four legs
+        satisfying TURNOVER_DISTRIBUTION exists exactly when the four largest leg turnovers do, so each parent
+        needs only its sorted legs; the tree is read in one query. A reward worth more than the parent's remaining
+        ID value is lapsed and kept as an inactive RewardEarned row so it is not awarded again.
+        """
+        rewards = sorted(
+            RewardMaster.objects.filter(applicable_for='p2pmb').only(
+                'id', 'turnover_threshold', 'gift_amount', 'total_paid_month'),
+            key=lambda reward: reward.turnover_threshold
+        )
+        if not rewards:
+            return 0
+
+        legs = {}
+        representative = {}
+        for node_id, parent_id, turnover, status, is_show in MLMTree.objects.filter(
+                parent__isnull=False).order_by('id').values_list('id', 'parent_id', 'turnover', 'status', 'is_show'):
+            if status != 'active':
+                continue
+            legs.setdefault(parent_id, []).append(turnover)
+            if is_show and parent_id not in representative:
+                representative[parent_id] = (node_id, turnover)
+
+        earned = set(RewardEarned.objects.filter(
+            status__in=('active', 'inactive'), is_p2p=True, reward__in=rewards
+        ).values_list('user_id', 'reward_id'))
+
+        reached_rewards = []
+        for parent_id, (node_id, node_turnover) in representative.items():
+            leg_turnovers = sorted(legs[parent_id][:5], reverse=True)
+            if len(leg_turnovers) < len(TURNOVER_DISTRIBUTION):
+                continue
+
+            reached = LifeTimeRewardIncome.highest_reward_reached(leg_turnovers, rewards)
+            reached_rewards.extend(
+                (parent_id, node_id, node_turnover, reward) for reward in rewards[:reached]
+                if (parent_id, reward.id) not in earned
+            )
+
+        earned_at = datetime.datetime.now().today().replace(day=1)
+        with transaction.atomic():
+            cap = EarningsCap(parent_id for parent_id, _, _, _ in reached_rewards)
+            new_rewards = []
+            commission_earned = {}
+            for parent_id, node_id, node_turnover, reward in reached_rewards:
+                granted = cap.fits(parent_id, reward.gift_amount, 'reward',
+                                   f'Reward {reward.id} over the ID value at turnover {node_turnover}')
+                if granted:
+                    commission_earned[node_id] = (commission_earned.get(node_id, Decimal('0')) +
+                                                  (reward.gift_amount or 0))
+                new_rewards.append(RewardEarned(
+                    user_id=parent_id,
+                    created_by_id=parent_id,
+                    reward=reward,
+                    earned_at=earned_at,
+                    turnover_at_earning=node_turnover,
+                    is_paid=granted,
+                    total_month=reward.total_paid_month,
+                    is_p2p=True,
+                    status='active' if granted else 'inactive'
+                ))
+
+            RewardEarned.objects.bulk_create(new_rewards)
+            record_earnings(new_rewards)
+            cap.flush()
+            for node_id, amount in commission_earned.items():
+                MLMTree.objects.filter(id=node_id).update(commission_earned=F('commission_earned') + amount)
+        return len(new_rewards)
 
 
 class RoyaltyClubDistribute:
@@ -635,21 +1213,13 @@ class RoyaltyClubDistribute:
     @staticmethod
     def check_working_id_active():
         """
-        Check and update the status of working id.
+        Check and update the status of working id. The flag is kept in sync with direct_referral_count as
+        referrals join and leave, this only repairs rows that drifted.
         """
-        persons = MLMTree.objects.filter(status='active', is_working_id=False)
-        for person in persons:
-            direct_ids_count = MLMTree.objects.filter(referral_by=person.child, status='active').count()
-            if direct_ids_count >= 2:
-                person.is_working_id = True
-                person.save()
-            # team_count_level_one = MLMTree.objects.filter(parent=person.child, status='active').count()
-            # team_count_level_two = MLMTree.objects.filter(
-            #     parent__in=MLMTree.objects.filter(parent=person.child).values_list('child', flat=True)).count()
-            #
-            # if (direct_ids_count >= 10) or (team_count_level_one >= 5 and team_count_level_two >= 25):
-            #     person.is_working_id = True
-            #     person.save()
+        MLMTree.objects.filter(
+            is_working_id=False, direct_referral_count__gte=MLMTree.WORKING_ID_REFERRALS).update(is_working_id=True)
+        MLMTree.objects.filter(
+            is_working_id=True, direct_referral_count__lt=MLMTree.WORKING_ID_REFERRALS).update(is_working_id=False)
 
     @staticmethod
     def calculate_royalty(user):
@@ -691,295 +1261,131 @@ class RoyaltyClubDistribute:
         return {"star_level": star_level, "royalty": royalty}
 
     @staticmethod
-    def one_star_royalty():
-        royalty = P2PMBRoyaltyMaster.objects.filter(
-            month__month=datetime.datetime.now().month, month__year=datetime.datetime.now().year,
-            is_distributed=False
-        ).last()
-
-        if not royalty or royalty.star_income == 0:
-            return {"status": "error", "message": "No valid royalty to distribute"}
-
-        eligible_users = MLMTree.objects.filter(
-            status='active', is_show=True, referral_by__isnull=False
-        ).values_list('referral_by', flat=True).distinct()
-
-        if not eligible_users:
-            return {"status": "error", "message": "No eligible users for royalty distribution"}
-
-        final_eligible_users = []
-
-        for elg_user in eligible_users:
-            user = User.objects.filter(id=elg_user).last()
-            eligible_users = MLMTree.objects.filter(
-                status='active', is_show=True, referral_by__isnull=False, referral_by=user
-            )
-            if not eligible_users or eligible_users.count() < 5:
-                continue
-
-            # Investment.objects :todo -> Add Amount greater then or equal to logic
-
-            referrer_earnings = RoyaltyEarned.objects.filter(
-                user=user, club_type='star'
-            ).aggregate(total_earned=Sum('earned_amount'))["total_earned"] or 0
-
-            if referrer_earnings > 200000:
+    def get_club_rules(clubs=None):
+        """
+        Distribution rules of the requested clubs, thresholds overridden by the active RoyaltyMaster if any.
+        """
+        masters = {
+            master.club_type: master for master in RoyaltyMaster.objects.filter(status='active').order_by('id')
+        }
+        rules = []
+        for rule in ROYALTY_CLUB_DISTRIBUTION:
+            if clubs is not None and rule['club'] not in clubs:
                 continue
+            rule = dict(rule)
+            master = masters.get(rule['club'])
+            if master:
+                rule.update(direct=master.direct_ids_required, level1=master.level_one_required,
+                            level2=master.level_two_required)
+            rules.append(rule)
+        return rules
 
-            final_eligible_users.append(user)
-
-        default_user = User.objects.filter(id=33).first()
-        if default_user and default_user not in final_eligible_users:
-            final_eligible_users.append(default_user)
-
-        if not final_eligible_users:
-            return {"status": "error", "message": "No eligible users after applying earnings filter"}
-
-        total_users = len(final_eligible_users)
-        total_income_distributed = royalty.star_income / total_users if total_users > 0 else 0
-
-        for user in final_eligible_users:
-            RoyaltyEarned.objects.create(
-                user=user, club_type='star', earned_date=datetime.datetime.now(),
-                earned_amount=total_income_distributed, royalty=royalty, is_paid=True
-            )
-            user_wallet = UserWallet.objects.filter(user=user, status='active').last()
-            if user_wallet:
-                user_wallet.app_wallet_balance += total_income_distributed
-                user_wallet.save()
-
-            create_transaction_entry(
-                user, user, total_income_distributed, 'commission', 'approved',
-                'Royalty Commission for 1 Star.'
-            )
+    @staticmethod
+    def distribute_clubs(clubs=None):
+        """
+        Split this month's P2PMBRoyaltyMaster income of every requested club equally among its qualifying
+        members. Eligibility for all clubs comes from a few GROUP BY queries and every payout is bulk written.
+        Returns {club: number of users paid}.
+        """
+        now = datetime.datetime.now()
+        with transaction.atomic():
+            royalties = list(P2PMBRoyaltyMaster.objects.filter(
+                month__month=now.month, month__year=now.year
+            ).select_for_update().order_by('id'))
+
+            pending = []
+            for rule in RoyaltyClubDistribute.get_club_rules(clubs):
+                royalty = next((row for row in reversed(royalties) if not getattr(row, rule['flag'])), None)
+                if royalty and getattr(royalty, rule['income']):
+                    pending.append((rule, royalty))
+            if not pending:
+                return {}
+
+            direct_counts = dict(MLMTree.objects.filter(direct_referral_count__gt=0).order_by('id').values_list(
+                'child_id', 'direct_referral_count'))
+            team_counts = {
+                child_id: (level_one, level_two) for child_id, level_one, level_two in
+                MLMTree.objects.filter(child_id__in=direct_counts.keys()).order_by('id').values_list(
+                    'child_id', 'level_one_count', 'level_two_count')
+            }
+            earned = {
+                (user_id, club_type): total for user_id, club_type, total in
+                RoyaltyEarned.objects.filter(club_type__in=[rule['club'] for rule, _ in pending]).values(
+                    'user', 'club_type').annotate(total=Sum('earned_amount')).values_list(
+                    'user', 'club_type', 'total')
+            }
+            default_user_exists = User.objects.filter(id=ROYALTY_DEFAULT_USER_ID).exists()
+
+            club_members = []
+            for rule, royalty in pending:
+                members = [
+                    user_id for user_id, direct_count in direct_counts.items()
+                    if direct_count >= rule['direct']
+                    and team_counts.get(user_id, (0, 0))[0] >= rule['level1']
+                    and team_counts.get(user_id, (0, 0))[1] >= rule['level2']
+                    and (earned.get((user_id, rule['club'])) or 0) <= rule['cap']
+                ]
+                if default_user_exists and ROYALTY_DEFAULT_USER_ID not in members:
+                    members.append(ROYALTY_DEFAULT_USER_ID)
+                if members:
+                    club_members.append((rule, royalty, members))
+            cap = EarningsCap(user_id for _, _, members in club_members for user_id in members)
+
+            royalty_rows, transactions, commissions = [], [], []
+            wallet_credits, paid = {}, {}
+            for rule, royalty, members in club_members:
+                club_share = getattr(royalty, rule['income']) / len(members)
+                description = f"Royalty Commission for {rule['label']}."
+                for user_id in members:
+                    share = cap.clip(user_id, club_share, 'royalty', f"{description[:-1]} over the ID value.")
+                    if not share:
+                        continue
+                    royalty_rows.append(RoyaltyEarned(
+                        user_id=user_id, club_type=rule['club'], earned_date=now, earned_amount=share,
+                        royalty=royalty, is_paid=True
+                    ))
+                    transactions.append(Transaction(
+                        created_by_id=user_id, sender_id=user_id, receiver_id=user_id, amount=share,
+                        transaction_type='commission', transaction_status='approved', payment_method='wallet',
+                        remarks=description, verified_on=now
+                    ))
+                    commissions.append(Commission(
+                        created_by_id=user_id, commission_by_id=user_id, commission_to_id=user_id,
+                        commission_type='royalty', amount=share, description=description
+                    ))
+                    wallet_credits[user_id] = wallet_credits.get(user_id, Decimal('0')) + share
+                    paid[rule['club']] = paid.get(rule['club'], 0) + 1
+                P2PMBRoyaltyMaster.objects.filter(id=royalty.id).update(**{rule['flag']: True})
+                setattr(royalty, rule['flag'], True)
+
+            RoyaltyEarned.objects.bulk_create(royalty_rows)
+            Transaction.objects.bulk_create(transactions)
+            Commission.objects.bulk_create(commissions)
+            record_earnings(royalty_rows + commissions)
+            cap.flush()
+            credit_wallets(wallet_credits)
+        return paid
 
-            create_commission_entry(
-                user, user, 'royalty', total_income_distributed,
-                'Royalty Commission for 1 Star.'
-            )
-        royalty.is_distributed = True
-        royalty.save()
-        return total_users
+    @staticmethod
+    def one_star_royalty():
+        return RoyaltyClubDistribute.distribute_clubs(['star']).get('star', 0)
 
     @staticmethod
     def two_star_royalty():
-        royalty = P2PMBRoyaltyMaster.objects.filter(
-            month__month=datetime.datetime.now().month, month__year=datetime.datetime.now().year,
-            is_two_star_distributed=False
-        ).last()
-
-        if not royalty or royalty.star_income == 0:
-            return 0
-
-        eligible_users = MLMTree.objects.filter(
-            status='active', is_show=True, referral_by__isnull=False
-        ).values_list('referral_by', flat=True).distinct()
-
-        if not eligible_users:
-            return 0
-
-        final_eligible_users = []
-
-        for elg_user in eligible_users:
-            user = User.objects.filter(id=elg_user).last()
-            eligible_users = MLMTree.objects.filter(
-                status='active', is_show=True, referral_by__isnull=False, referral_by=user
-            )
-            if not eligible_users or eligible_users.count() < 10:
-                continue
-
-            # Investment.objects :todo -> Add Amount greater then or equal to logic
-
-            referrer_earnings = RoyaltyEarned.objects.filter(
-                user=user, club_type='2_star'
-            ).aggregate(total_earned=Sum('earned_amount'))["total_earned"] or 0
-
-            if referrer_earnings > 500000:
-                continue
-
-            final_eligible_users.append(user)
-
-        default_user = User.objects.filter(id=33).first()
-        if default_user and default_user not in final_eligible_users:
-            final_eligible_users.append(default_user)
-
-        if not final_eligible_users:
-            return 0
-
-        total_users = len(final_eligible_users)
-        total_income_distributed = royalty.two_star_income / total_users if total_users > 0 else 0
-
-        for user in final_eligible_users:
-            RoyaltyEarned.objects.create(
-                user=user, club_type='2_star', earned_date=datetime.datetime.now(),
-                earned_amount=total_income_distributed, royalty=royalty, is_paid=True
-            )
-            user_wallet = UserWallet.objects.filter(user=user, status='active').last()
-            if user_wallet:
-                user_wallet.app_wallet_balance += total_income_distributed
-                user_wallet.save()
-
-            create_transaction_entry(
-                user, user, total_income_distributed, 'commission', 'approved',
-                'Royalty Commission for 1 Star.'
-            )
-
-            create_commission_entry(
-                user, user, 'royalty', total_income_distributed,
-                'Royalty Commission for 1 Star.'
-            )
-        royalty.is_two_star_distributed = True
-        royalty.save()
-        return total_users
+        return RoyaltyClubDistribute.distribute_clubs(['2_star']).get('2_star', 0)
 
     @staticmethod
     def three_star_royalty():
-        royalty = P2PMBRoyaltyMaster.objects.filter(
-            month__month=datetime.datetime.now().month, month__year=datetime.datetime.now().year
-        ).last()
-
-        if not royalty or royalty.star_income == 0:
-            return {"status": "error", "message": "No valid royalty to distribute"}
-
-        eligible_users = MLMTree.objects.filter(
-            status='active', is_show=True, referral_by__isnull=False
-        ).values_list('referral_by', flat=True).distinct()
-
-        if not eligible_users:
-            return {"status": "error", "message": "No eligible users for royalty distribution"}
-
-        final_eligible_users = []
-
-        for elg_user in eligible_users:
-            user = User.objects.filter(id=elg_user).last()
-            eligible_users = MLMTree.objects.filter(
-                status='active', is_show=True, referral_by__isnull=False, referral_by=user
-            )
-            if not eligible_users or eligible_users.count() < 5:
-                continue
-
-            # Investment.objects :todo -> Add Amount greater then or equal to logic
-
-            referrer_earnings = RoyaltyEarned.objects.filter(
-                user=user, club_type='star'
-            ).aggregate(total_earned=Sum('earned_amount'))["total_earned"] or 0
-
-            if referrer_earnings > 200000:
-                continue
-
-            final_eligible_users.append(user)
-
-        default_user = User.objects.filter(id=33).first()
-        if default_user and default_user not in final_eligible_users:
-            final_eligible_users.append(default_user)
-
-        if not final_eligible_users:
-            return {"status": "error", "message": "No eligible users after applying earnings filter"}
-
-        total_users = len(final_eligible_users)
-        total_income_distributed = royalty.star_income / total_users if total_users > 0 else 0
-
-        for user in final_eligible_users:
-            RoyaltyEarned.objects.create(
-                user=user, club_type='star', earned_date=datetime.datetime.now(),
-                earned_amount=total_income_distributed, royalty=royalty, is_paid=True
-            )
-            user_wallet = UserWallet.objects.filter(user=user, status='active').last()
-            if user_wallet:
-                user_wallet.app_wallet_balance += total_income_distributed
-                user_wallet.save()
-
-            create_transaction_entry(
-                user, user, total_income_distributed, 'commission', 'approved',
-                'Royalty Commission for 1 Star.'
-            )
-
-            create_commission_entry(
-                user, user, 'royalty', total_income_distributed,
-                'Royalty Commission for 1 Star.'
-            )
-        royalty.is_distributed = True
-        royalty.save()
-        return total_users
+        return RoyaltyClubDistribute.distribute_clubs(['3_star']).get('3_star', 0)
 
     @staticmethod
     def five_star_royalty():
-        royalty = P2PMBRoyaltyMaster.objects.filter(
-            month__month=datetime.datetime.now().month, month__year=datetime.datetime.now().year,
-            is_distributed=False
-        ).last()
-
-        if not royalty or royalty.star_income == 0:
-            return {"status": "error", "message": "No valid royalty to distribute"}
-
-        eligible_users = MLMTree.objects.filter(
-            status='active', is_show=True, referral_by__isnull=False
-        ).values_list('referral_by', flat=True).distinct()
-
-        if not eligible_users:
-            return {"status": "error", "message": "No eligible users for royalty distribution"}
-
-        final_eligible_users = []
-
-        for elg_user in eligible_users:
-            user = User.objects.filter(id=elg_user).last()
-            eligible_users = MLMTree.objects.filter(
-                status='active', is_show=True, referral_by__isnull=False, referral_by=user
-            )
-            if not eligible_users or eligible_users.count() < 5:
-                continue
-
-            # Investment.objects :todo -> Add Amount greater then or equal to logic
-
-            referrer_earnings = RoyaltyEarned.objects.filter(
-                user=user, club_type='star'
-            ).aggregate(total_earned=Sum('earned_amount'))["total_earned"] or 0
-
-            if referrer_earnings > 200000:
-                continue
-
-            final_eligible_users.append(user)
-
-        default_user = User.objects.filter(id=33).first()
-        if default_user and default_user not in final_eligible_users:
-            final_eligible_users.append(default_user)
-
-        if not final_eligible_users:
-            return {"status": "error", "message": "No eligible users after applying earnings filter"}
-
-        total_users = len(final_eligible_users)
-        total_income_distributed = royalty.star_income / total_users if total_users > 0 else 0
-
-        for user in final_eligible_users:
-            RoyaltyEarned.objects.create(
-                user=user, club_type='star', earned_date=datetime.datetime.now(),
-                earned_amount=total_income_distributed, royalty=royalty, is_paid=True
-            )
-            user_wallet = UserWallet.objects.filter(user=user, status='active').last()
-            if user_wallet:
-                user_wallet.app_wallet_balance += total_income_distributed
-                user_wallet.save()
-
-            create_transaction_entry(
-                user, user, total_income_distributed, 'commission', 'approved',
-                'Royalty Commission for 1 Star.'
-            )
-
-            create_commission_entry(
-                user, user, 'royalty', total_income_distributed,
-                'Royalty Commission for 1 Star.'
-            )
-        royalty.is_distributed = True
-        royalty.save()
-        return total_users
+        return RoyaltyClubDistribute.distribute_clubs(['5_star']).get('5_star', 0)
 
     @staticmethod
-    def distribute_royalty():
-        total_one_star_user = RoyaltyClubDistribute.one_star_royalty()
-        # total_two_star_user = RoyaltyClubDistribute.two_star_royalty()
-        # total_three_star_user = RoyaltyClubDistribute.three_star_royalty()
-        # total_five_star_user = RoyaltyClubDistribute.five_star_royalty()
-        return {"status": "success", "message": f"Royalty distributed among {total_one_star_user} users"}
+    def distribute_royalty(clubs=('star',)):
+        total_users = sum(RoyaltyClubDistribute.distribute_clubs(clubs).values())
+        return {"status": "success", "message": f"Royalty distributed among {total_users} users"}
 
 
 def process_monthly_reward_payments():
@@ -1010,8 +1416,7 @@ def transfer_to_wallet(person, amount):
     Replace this with your actual wallet transfer logic.
     """
     user_wallet = UserWallet.objects.filter(user=person.child).last()
-    user_wallet.app_wallet_balance += amount
-    user_wallet.save()
+    post_wallet(user_wallet, {'app_wallet_balance': amount}, 'reward')
     if person and person.parent:
         get_mlm = MLMTree.objects.filter(status='active', child=person.parent).last()
         get_mlm.commission_earned += amount
@@ -1046,23 +1451,26 @@ def transfer_to_wallet(person, amount):
 class ProcessMonthlyInterestP2PMB:
 
     @staticmethod
-    def calculate_monthly_interest_amount(user, investment_type, invested_amount):
-        """Calculate monthly interest with all ROI overrides applied."""
-        interest_rate = ProcessMonthlyInterestP2PMB.calculate_interest_rate(user, investment_type)
-
-        overrides = ROIOverride.objects.filter(user=user, status='active')
+    def apply_roi_overrides(interest_rate, overrides):
+        """Apply (action_type, percentage) ROI overrides to a rate, never going below zero."""
+        for action_type, percentage in overrides:
+            adjustment = Decimal(str(percentage or 0)) / Decimal('100')
 
-        for override in overrides:
-            percentage_value = override.percentage or 0
-            adjustment = Decimal(str(percentage_value)) / Decimal('100')
-
-            if override.action_type == 'increase':
+            if action_type == 'increase':
                 interest_rate += adjustment
-            elif override.action_type == 'decrease':
+            elif action_type == 'decrease':
                 interest_rate -= adjustment
 
         if interest_rate < Decimal('0'):
             interest_rate = Decimal('0')
+        return interest_rate
+
+    @staticmethod
+    def calculate_monthly_interest_amount(user, investment_type, invested_amount):
+        """Calculate monthly interest with all ROI overrides applied."""
+        interest_rate = ProcessMonthlyInterestP2PMB.calculate_interest_rate(user, investment_type)
+        overrides = ROIOverride.objects.filter(user=user, status='active').values_list('action_type', 'percentage')
+        interest_rate = ProcessMonthlyInterestP2PMB.apply_roi_overrides(interest_rate, overrides)
 
         interest_amount = invested_amount * interest_rate
         return interest_amount
@@ -1077,115 +1485,174 @@ class ProcessMonthlyInterestP2PMB:
         return investment_duration.get(investment_type, 0)
 
     @staticmethod
-    def generate_interest_for_all_investments():
-        """Generate interest for all approved investments that need interest payments."""
-        today = datetime.datetime.now().date()
-        if today.day != 2 or (today.month <= 3 and today.year <= 2025):
-            print("Interest calculation skipped. Only runs on the 1st of each month.")
-            return
-        investments = Investment.objects.filter(
+    def get_interest_investments():
+        return Investment.objects.filter(
             status='active', is_approved=True, pay_method='main_wallet', investment_type='p2pmb',
             package__isnull=False, investment_guaranteed_type__isnull=False, date_created__gte='2025-03-01'
-        ).select_related('user')
-
-        interest_records = []
-
-        for investment in investments:
-            if investment.user and investment.user.profile and not investment.user.profile.is_roi_send:
-                continue
-            user = investment.user
-            approved_date = investment.date_created.date()
-            duration_years = ProcessMonthlyInterestP2PMB.get_investment_duration(investment.investment_guaranteed_type)
-
-            if duration_years == 0:
-                continue
-
-            first_interest_date = (approved_date.replace(day=1) + relativedelta(months=1))
-            end_date = approved_date + relativedelta(years=duration_years)
-
-            if today > end_date:
-                continue
-
-            existing_interest = InvestmentInterest.objects.filter(
-                investment=investment, interest_send_date=today.replace(day=1)
-            ).exists()
-
-            if existing_interest:
-                continue
+        )
 
-            amount = ProcessMonthlyInterestP2PMB.calculate_monthly_interest_amount(
-                user, investment.investment_guaranteed_type, investment.amount)
+    @staticmethod
+    def is_interest_day(today):
+        """
+        Monthly interest is paid on the 2nd of the month, from April 2025 on. Every path paying it checks this.
+        """
+        return today.day == 2 and not (today.month <= 3 and today.year <= 2025)
 
-            # Handle partial month interest for the first month
-            if approved_date.year == today.year and approved_date.month == today.month - 1:
-                days_remaining = (first_interest_date - approved_date).days
-                full_month_days = (first_interest_date - datetime.timedelta(days=1)).day
+    @staticmethod
+    def get_interest_day(period):
+        """ The interest day of a 'YYYY-MM' period. """
+        return datetime.datetime.strptime(period, '%Y-%m').date().replace(day=2)
 
-                amount = (amount / full_month_days) * days_remaining
+    @staticmethod
+    def is_interest_due(period, today):
+        """
+        Whether the interest of `period` may be paid on `today`: its interest day has been reached and is one
+        is_interest_day accepts. A close resumed after the interest day still pays its month.
+        """
+        interest_day = ProcessMonthlyInterestP2PMB.get_interest_day(period)
+        return today >= interest_day and ProcessMonthlyInterestP2PMB.is_interest_day(interest_day)
 
-                interest_records.append(
-                    InvestmentInterest(
-                        created_by=user,
-                        investment=investment,
-                        interest_amount=amount,
-                        interest_send_date=today.replace(day=1),
-                        is_sent=True,
-                        end_date=end_date
-                    )
-                )
-            else:
-                interest_records.append(
-                    InvestmentInterest(
-                        created_by=user,
-                        investment=investment,
-                        interest_amount=amount,
-                        interest_send_date=today.replace(day=1),
-                        is_sent=True,
-                        end_date=end_date
-                    )
-                )
+    @staticmethod
+    def generate_interest_for_all_investments(dry_run=False, chunk_size=500):
+        """
+        Generate interest for all approved investments that need interest payments, chunk by chunk.
+        With dry_run nothing is written and the totals that would be paid are returned.
+        """
+        today = datetime.datetime.now().date()
+        if not dry_run and not ProcessMonthlyInterestP2PMB.is_interest_day(today):
+            print("Interest calculation skipped. Only runs on the interest day of each month.")
+            return
+        investment_ids = list(dict.fromkeys(
+            ProcessMonthlyInterestP2PMB.get_interest_investments().order_by('id').values_list('id', flat=True)
+        ))
+
+        totals = {'investments': 0, 'amount': Decimal('0')}
+        for index in range(0, len(investment_ids), chunk_size):
+            count, amount = ProcessMonthlyInterestP2PMB.generate_interest_for_chunk(
+                investment_ids[index:index + chunk_size], today, dry_run)
+            totals['investments'] += count
+            totals['amount'] += amount
+
+        prefix = '[dry run] ' if dry_run else ''
+        print(f"{prefix}Interest records created for {totals['investments']} investments, "
+              f"total {totals['amount']}.")
+        return totals
 
-            create_transaction_entry(
-                user, user, amount, 'interest', 'approved',
-                f'Monthly Interest Added for investment of {investment.amount} in P2PMB.'
-            )
+    @staticmethod
+    def generate_interest_for_chunk(investment_ids, today, dry_run=False):
+        """
+        Compute the interest of a chunk from preloaded profiles, existing interest keys, tree counters and ROI
+        overrides, then bulk insert interest and transaction rows, credit each wallet once and flag the
+        investments. Amounts are computed in paise for the whole chunk at once (see utils.payout). Interest over
+        the investor's ID value is lapsed, its InvestmentInterest row is still written so the month is not paid
+        again. Returns (investments paid, total amount).
+        """
+        interest_send_date = today.replace(day=1)
+        now = datetime.datetime.now()
+        with transaction.atomic():
+            investments = list(Investment.objects.filter(id__in=investment_ids).order_by('id'))
+            user_ids = {investment.user_id for investment in investments if investment.user_id}
+            roi_stopped = set(Profile.objects.filter(
+                user_id__in=user_ids, is_roi_send=False).values_list('user_id', flat=True))
+            already_paid = set(InvestmentInterest.objects.filter(
+                investment_id__in=investment_ids, interest_send_date=interest_send_date
+            ).values_list('investment_id', flat=True))
+            nodes = {
+                node.child_id: node for node in MLMTree.objects.filter(child_id__in=user_ids).only(
+                    'id', 'child_id', 'referral_count', 'team_high_performer_count',
+                    'direct_high_performer_count').order_by('id')
+            }
+            adjustments = {}
+            for user_id, action_type, percentage in ROIOverride.objects.filter(
+                    user_id__in=user_ids, status='active').values_list('user_id', 'action_type', 'percentage'):
+                sign = {'increase': 1, 'decrease': -1}.get(action_type, 0)
+                adjustments[user_id] = adjustments.get(user_id, 0) + sign * percent_to_basis_points(percentage)
+
+            payable, rates, days, month_days = [], [], [], []
+            for investment in investments:
+                user_id = investment.user_id
+                if not user_id or user_id in roi_stopped or investment.id in already_paid:
+                    continue
+                approved_date = investment.date_created.date()
+                duration_years = ProcessMonthlyInterestP2PMB.get_investment_duration(
+                    investment.investment_guaranteed_type)
+                if duration_years == 0:
+                    continue
 
-            # Update user wallet
-            user_wallet = UserWallet.objects.filter(user=user, status='active').last()
-            if user_wallet:
-                user_wallet.app_wallet_balance += amount
-                user_wallet.save()
+                first_interest_date = (approved_date.replace(day=1) + relativedelta(months=1))
+                end_date = approved_date + relativedelta(years=duration_years)
+                if today > end_date:
+                    continue
 
-            # Mark investment as interest sent
-            investment.is_interest_send = True
-            investment.save()
+                payable.append((investment, end_date))
+                rates.append(to_basis_points(ProcessMonthlyInterestP2PMB.get_interest_rate(
+                    nodes.get(user_id), investment.investment_guaranteed_type)) + adjustments.get(user_id, 0))
 
-        if interest_records:
-            InvestmentInterest.objects.bulk_create(interest_records)
-            print(f"Interest records created for {len(interest_records)} investments.")
+                # Handle partial month interest for the first month
+                if approved_date.year == today.year and approved_date.month == today.month - 1:
+                    days.append((first_interest_date - approved_date).days)
+                    month_days.append((first_interest_date - datetime.timedelta(days=1)).day)
+                else:
+                    days.append(1)
+                    month_days.append(1)
+
+            amounts = apply_rates(paise_array(investment.amount for investment, _ in payable), rates, days, month_days)
+            cap = EarningsCap(investment.user_id for investment, _ in payable)
+
+            interest_records, transactions, paid_ids = [], [], []
+            wallet_credits = {}
+            for (investment, end_date), paise in zip(payable, amounts):
+                user_id = investment.user_id
+                amount = cap.clip(user_id, to_rupees(paise), 'roi',
+                                  f'Monthly Interest over the ID value for investment of {investment.amount}.')
+                paid_ids.append(investment.id)
+                interest_records.append(InvestmentInterest(
+                    created_by_id=user_id,
+                    investment=investment,
+                    interest_amount=amount,
+                    interest_send_date=interest_send_date,
+                    is_sent=True,
+                    end_date=end_date
+                ))
+                if not amount:
+                    continue
+                transactions.append(Transaction(
+                    created_by_id=user_id, sender_id=user_id, receiver_id=user_id, amount=amount,
+                    transaction_type='interest', transaction_status='approved', payment_method='wallet',
+                    remarks=f'Monthly Interest Added for investment of {investment.amount} in P2PMB.',
+                    verified_on=now
+                ))
+                wallet_credits[user_id] = wallet_credits.get(user_id, Decimal('0')) + amount
+
+            if not dry_run:
+                InvestmentInterest.objects.bulk_create(interest_records)
+                Transaction.objects.bulk_create(transactions)
+                record_earnings(interest_records)
+                cap.flush()
+                credit_wallets(wallet_credits, source_type='interest')
+                Investment.objects.filter(id__in=paid_ids).update(is_interest_send=True, date_updated=now)
+
+        return len(paid_ids), sum(wallet_credits.values(), Decimal('0'))
 
     @staticmethod
     def calculate_interest_rate(user, investment_type):
-        direct_referrals = MLMTree.objects.filter(referral_by=user).select_related('child')
-        referral_count = direct_referrals.count()
+        node = MLMTree.objects.filter(child=user).only(
+            'id', 'referral_count', 'team_high_performer_count', 'direct_high_performer_count').last()
+        return ProcessMonthlyInterestP2PMB.get_interest_rate(node, investment_type)
+
+    @staticmethod
+    def get_interest_rate(node, investment_type):
+        referral_count = node.referral_count if node else 0
 
         base_interest_rate = Decimal('0.01') if investment_type == 'full_payment' else Decimal('0.02')
 
-        full_team_users = ProcessMonthlyInterestP2PMB.get_full_team_users(user)
-        high_performers_in_team = sum(
-            1 for member in full_team_users
-            if MLMTree.objects.filter(referral_by=member).count() >= 10
-        )
-        if high_performers_in_team >= 10:
+        # 5x: at least 10 members of the full team have ≥10 referrals
+        if node and node.team_high_performer_count >= 10:
             return Decimal('0.05') if investment_type == 'full_payment' else Decimal('0.1')
 
         # 4. Check for 3x: From direct referrals, any 5 have ≥10 referrals
         if referral_count >= 10:
-            high_performers_in_directs = sum(
-                1 for referral in direct_referrals
-                if MLMTree.objects.filter(referral_by=referral.child).count() >= 10
-            )
-            if high_performers_in_directs >= 5:
+            if node.direct_high_performer_count >= 5:
                 return Decimal('0.03') if investment_type == 'full_payment' else Decimal('0.06')  # 3x
 
             return Decimal('0.02') if investment_type == 'full_payment' else Decimal('0.04')  # 2x
@@ -1196,30 +1663,3 @@ class ProcessMonthlyInterestP2PMB:
 
         # 6. Fallback
         return base_interest_rate
-
-    @staticmethod
-    def get_full_team_users(user):
-        """
-        Traverses the MLM tree downward starting from the given user
-        and returns a set of all users in their full team (all levels).
-        """
-        visited = set()
-        queue = deque()
-
-        # Start with direct children
-        children = MLMTree.objects.filter(parent=user).select_related('child')
-        for node in children:
-            queue.append(node.child)
-
-        while queue:
-            current_user = queue.popleft()
-            if current_user in visited:
-                continue
-            visited.add(current_user)
-
-            # Enqueue current_user's children
-            children = MLMTree.objects.filter(parent=current_user).select_related('child')
-            for node in children:
-                queue.append(node.child)
-
-        return visited
\ No newline at end of file
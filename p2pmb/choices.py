@@ -18,7 +18,10 @@ RELEASE_LEVEL_INCOME_CHOICES = [
 LAPSED_EARNED_CHOICES = [
     ('level_income', 'Level Income'),
     ('core_group_income', 'Core Group Income'),
-    ('royalty', 'Royalty')
+    ('royalty', 'Royalty'),
+    ('direct_income', 'Direct Income'),
+    ('roi', 'ROI'),
+    ('reward', 'Reward')
 ]
 
 
@@ -1,82 +1,43 @@
-import os
-from agency.models import Investment
-from p2pmb.calculation import DistributeDirectCommission, DistributeLevelIncome, ProcessMonthlyInterestP2PMB
-from p2pmb.helpers import get_level_counts
-from p2pmb.models import MLMTree
+import datetime
 
+from master.helpers import job_lease, heartbeat_job_lease, background_job
+from p2pmb.calculation import DistributeDirectCommission, DistributeDirectCommissionBatch, DistributeLevelIncomeBatch, \
+    ProcessMonthlyInterestP2PMB, ReleaseHoldLevelIncome, ReconcileTurnover
+from p2pmb.helpers import rebuild_earnings_summaries
 
-LOCK_FILE = "/tmp/distribute_direct_income.lock"
-LOCK_LEVEL_INCOME_FILE = "/tmp/distribute_level_income.lock"
 
+DIRECT_INCOME_CHUNK_SIZE = 200
+LEVEL_INCOME_CHUNK_SIZE = 200
 
+
+@background_job
+@job_lease()
 def distribute_direct_income():
     """
     Function to distribute direct income only if the previous job has completed.
     """
-    if os.path.exists(LOCK_FILE):
-        print("🔴 Previous job is still running. Skipping this execution.")
-        return
-
-    try:
-        open(LOCK_FILE, "w").close()
-        print("🚀 Starting Direct Income Distribution...")
-
-        investments = Investment.objects.filter(
-            status='active', is_approved=True, pay_method='main_wallet', investment_type='p2pmb',
-            send_direct_income=False, package__isnull=False
-        ).order_by('date_created')
-        for investment_instance in investments:
-            if investment_instance and investment_instance.user:
-                instance = MLMTree.objects.filter(status='active', child=investment_instance.user).last()
-                if instance:
-                    DistributeDirectCommission.distribute_p2pmb_commission(instance, investment_instance.amount)
-                    investment_instance.send_direct_income = True
-                    investment_instance.save()
-                    print("✅ Payment of Direct Income Distributed successfully.")
-                else:
-                    print(f"{instance.user.username} is not enroll in MLM yet.")
-
-    finally:
-        os.remove(LOCK_FILE)
-        print("🔄 Job finished. Ready for next execution.")
+    print("🚀 Starting Direct Income Distribution...")
+    processed = DistributeDirectCommissionBatch.distribute_pending(
+        chunk_size=DIRECT_INCOME_CHUNK_SIZE, on_chunk=heartbeat_job_lease)
+    print(f"✅ Direct Income Distributed for {processed} investments.")
+    print("🔄 Job finished. Ready for next execution.")
 
 
+@background_job
+@job_lease()
 def distribute_level_income():
     """
     Function to distribute level income only if the previous job has completed.
     """
-    if os.path.exists(LOCK_LEVEL_INCOME_FILE):
-        print("🔴 Previous job is still running. Skipping this execution.")
-        return
-
-    try:
-        open(LOCK_LEVEL_INCOME_FILE, "w").close()
-        print("🚀 Starting Direct Income Distribution...")
-
-        investments = Investment.objects.filter(status='active', is_approved=True, pay_method='main_wallet',
-                                                investment_type='p2pmb', send_level_income=False,
-                                                package__isnull=False).order_by('date_created')
-        for investment_instance in investments:
-
-            if investment_instance and investment_instance.user:
-                instance = MLMTree.objects.filter(status='active', child=investment_instance.user).last()
-                direct_count = MLMTree.objects.filter(status='active', referral_by=instance.referral_by).count()
-                up_level, down_level = get_level_counts(direct_count)
-                if instance and up_level and down_level:
-                    amount = investment_instance.amount if investment_instance.amount else 0
-                    DistributeLevelIncome.distribute_level_income(instance, amount, up_level, down_level)
-                    investment_instance.send_level_income = True
-                    investment_instance.save()
-                    print(f"✅ Payment of Direct Income Distributed successfully of user "
-                          f"{investment_instance.user.username}.")
-                else:
-                    print(f"{investment_instance.user.username} is not enroll in MLM yet.")
-
-    finally:
-        os.remove(LOCK_LEVEL_INCOME_FILE)
-        print("🔄 Job finished. Ready for next execution.")
+    print("🚀 Starting Level Income Distribution...")
+    processed = DistributeLevelIncomeBatch.distribute_pending(
+        chunk_size=LEVEL_INCOME_CHUNK_SIZE, on_chunk=heartbeat_job_lease)
+    print(f"✅ Level Income Distributed for {processed} investments.")
+    print("🔄 Job finished. Ready for next execution.")
 
 
+@background_job
+@job_lease(ttl=datetime.timedelta(hours=6))
 def process_p2pmb_monthly_interest():
     """
     Process monthly interest for all eligible investments.
@@ -86,10 +47,42 @@ def process_p2pmb_monthly_interest():
     print("🔄 Interest Income Distribution Successfully")
 
 
+@background_job
+@job_lease(ttl=datetime.timedelta(hours=2))
 def process_direct_monthly_interest():
     """
     Process monthly interest for all eligible investments.
     """
     print("🚀 Starting Direct Income Distribution...")
     DistributeDirectCommission.cron_send_monthly_payment_direct_income()
-    print("🔄 Monthly commission Distribution Successfully")
\ No newline at end of file
+    print("🔄 Monthly commission Distribution Successfully")
+
+
+@job_lease()
+def release_hold_level_income():
+    """
+    Release held level income for every receiver whose direct referrals now meet the requirement.
+    """
+    print("🚀 Starting Hold Level Income Release...")
+    released = ReleaseHoldLevelIncome.release_qualified(on_chunk=heartbeat_job_lease)
+    print(f"🔄 Hold Level Income Released for {released} entries.")
+
+
+@job_lease(ttl=datetime.timedelta(hours=1))
+def reconcile_mlm_turnover():
+    """
+    Recompute the subtree turnover of every node and fix the drifted ones.
+    """
+    print("🚀 Starting Turnover Reconciliation...")
+    drifted = ReconcileTurnover.reconcile()
+    print(f"🔄 Turnover Reconciled, {drifted} nodes corrected.")
+
+
+@job_lease(ttl=datetime.timedelta(hours=1))
+def rebuild_earnings_summary():
+    """
+    Compare the per-user earnings summaries with the source tables and fix the drifted ones.
+    """
+    print("🚀 Starting Earnings Summary Rebuild...")
+    drifted = rebuild_earnings_summaries()
+    print(f"🔄 Earnings Summary Rebuilt, {drifted} users corrected.")
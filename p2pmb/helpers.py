@@ -1,22 +1,32 @@
 import datetime
+from collections import Counter
+from decimal import Decimal
 
 import django_filters
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, FilteredRelation, Max, Sum, Case, When, Value
 from rest_framework.pagination import PageNumberPagination
 
-from p2pmb.models import Commission, MLMTree, ExtraReward
-from payment_app.models import Transaction
+from agency.models import Investment, InvestmentInterest, RewardEarned
+from master.models import RewardMaster
+from p2pmb.models import Commission, MLMTree, ExtraReward, MLMTreeClosure, MLMTreeOpenSlot, UserEarningsSummary, \
+    RoyaltyEarned, CoreIncomeEarned, ExtraRewardEarned, LapsedAmount
+from payment_app.helpers import post_to_wallets
+from payment_app.models import Transaction, UserWallet
+from real_estate.constant import ID_VALUE_MULTIPLIER, WORKING_ID_VALUE_MULTIPLIER
 
 
 def create_commission_entry(commission_to, commission_by, commission_type, amount, description):
-    Commission.objects.create(
-        created_by=commission_to,
-        commission_by=commission_by,
-        commission_to=commission_to,
-        commission_type=commission_type,
-        amount=amount,
-        description=description
-    )
+    with transaction.atomic():
+        commission = Commission.objects.create(
+            created_by=commission_to,
+            commission_by=commission_by,
+            commission_to=commission_to,
+            commission_type=commission_type,
+            amount=amount,
+            description=description
+        )
+        record_earnings([commission])
 
 
 def create_transaction_entry(sender, receiver, amount, transaction_type, transaction_status, remarks):
@@ -33,44 +43,542 @@ def create_transaction_entry(sender, receiver, amount, transaction_type, transac
     )
 
 
-def get_levels_above_count(user):
-    """ Retrieve and count all levels of parent users recursively until the root is reached. """
-    current_user = user.parent
-    level_count = 0
+def get_latest_wallet_ids(user_ids):
+    """
+    Map each user to their latest active wallet, the one the per-credit code paths pick with `.last()`.
+    """
+    return dict(
+        UserWallet.objects.filter(user_id__in=user_ids, status='active').values('user_id').annotate(
+            wallet_id=Max('id')).values_list('user_id', 'wallet_id')
+    )
+
+
+def get_or_create_wallet_ids(user_ids):
+    """
+    Map each user to their wallet, creating the missing ones the way `UserWallet.objects.get_or_create` does.
+    """
+    user_ids = set(user_ids)
+    wallet_ids = dict(UserWallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+    missing = user_ids - wallet_ids.keys()
+    if missing:
+        UserWallet.objects.bulk_create([UserWallet(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        wallet_ids.update(UserWallet.objects.filter(user_id__in=missing).values_list('user_id', 'id'))
+    return wallet_ids
+
+
+def credit_wallets(credits, field='app_wallet_balance', wallet_ids=None, source_type='commission'):
+    """
+    Post aggregated credits {user_id: amount} to the wallet ledger, one balance UPDATE per wallet.
+    """
+    credits = {user_id: amount for user_id, amount in credits.items() if amount}
+    if not credits:
+        return
+    if wallet_ids is None:
+        wallet_ids = get_latest_wallet_ids(credits.keys())
+    post_to_wallets([(wallet_ids[user_id], field, amount) for user_id, amount in credits.items()
+                     if user_id in wallet_ids], source_type)
+
+
+def get_turnover_investments():
+    """
+    Investments counted in MLM turnover: approved, active P2PMB package purchases.
+    """
+    return Investment.objects.filter(is_approved=True, status='active', investment_type='p2pmb', package__isnull=False)
+
+
+def roll_up_investment_turnover(investment):
+    """
+    Add an investment that counts as turnover to its owner's node and the whole upline. Call it once, inside
+    the transaction approving the investment.
+    """
+    if get_turnover_investments().filter(id=investment.id).exists():
+        MLMTree.add_turnover(investment.user_id, investment.amount)
+
+
+def roll_up_user_turnover(user_id):
+    """
+    Add the turnover a user already has to the upline of their newly placed node.
+    """
+    investments = get_turnover_investments().filter(user_id=user_id).values_list('id', 'amount').distinct()
+    total = sum((amount for _, amount in investments), Decimal('0'))
+    if total:
+        MLMTree.add_turnover(user_id, total)
+
+
+COMMISSION_EARNING_FIELDS = {'direct': 'direct_income', 'level': 'level_income'}
+
+
+def get_id_value_investments():
+    """
+    Investments making up a user's ID value: active P2PMB package purchases.
+    """
+    return Investment.objects.filter(status='active', investment_type='p2pmb', package__isnull=False)
+
+
+def record_earnings(rows):
+    """
+    Add newly written income rows (Commission, InvestmentInterest, RoyaltyEarned, RewardEarned, CoreIncomeEarned,
+    ExtraRewardEarned) to their owners' UserEarningsSummary. Call it in the transaction that wrote them.
+    """
+    rows = [row for row in rows if row.status == 'active']
+    investment_users = dict(Investment.objects.filter(
+        id__in={row.investment_id for row in rows if isinstance(row, InvestmentInterest)}
+    ).values_list('id', 'user_id'))
+    rewards = {
+        reward_id: (gift_amount, applicable_for) for reward_id, gift_amount, applicable_for in
+        RewardMaster.objects.filter(
+            id__in={row.reward_id for row in rows if isinstance(row, RewardEarned)}
+        ).values_list('id', 'gift_amount', 'applicable_for')
+    }
+
+    totals = {}
+
+    def add(user_id, field, amount):
+        fields = totals.setdefault(user_id, {})
+        fields[field] = fields.get(field, 0) + (amount or 0)
+
+    for row in rows:
+        if isinstance(row, Commission):
+            add(row.commission_to_id, COMMISSION_EARNING_FIELDS.get(row.commission_type, 'other_commission_income'),
+                row.amount)
+        elif isinstance(row, InvestmentInterest):
+            add(investment_users.get(row.investment_id), 'roi_income', row.interest_amount)
+        elif isinstance(row, RoyaltyEarned) and row.is_paid:
+            add(row.user_id, 'royalty_income', row.earned_amount)
+        elif isinstance(row, RewardEarned):
+            gift_amount, applicable_for = rewards.get(row.reward_id, (0, None))
+            add(row.user_id, 'reward_income' if applicable_for == 'p2pmb' else 'other_reward_income', gift_amount)
+        elif isinstance(row, CoreIncomeEarned):
+            add(row.user_id, 'core_group_income', row.income_earned)
+        elif isinstance(row, ExtraRewardEarned):
+            add(row.user_id, 'extra_reward_income', row.amount)
+    UserEarningsSummary.add(totals)
+
+
+def record_investment(investment):
+    """
+    Add an investment that just became active to its owner's invested amount, top-up count and ID value cap.
+    """
+    if get_id_value_investments().filter(id=investment.id).exists():
+        UserEarningsSummary.add({investment.user_id: {'invested_amount': investment.amount, 'top_up_count': 1}})
+
+
+class EarningsCap:
+    """
+    Remaining ID value (id_value_cap - id_value_income) of a set of receivers, read from UserEarningsSummary with
+    one locking query per 1000 users so a batch clips every credit in memory. Users without an ID value (no
+    active P2PMB top-up) are not capped. The clipped excess becomes LapsedAmount rows written by flush(); use it
+    inside the transaction that writes the income.
+    """
+
+    def __init__(self, user_ids):
+        self.headroom = {}
+        self.lapsed = []
+        user_ids = sorted({user_id for user_id in user_ids if user_id})
+        for index in range(0, len(user_ids), 1000):
+            for summary in UserEarningsSummary.objects.filter(
+                    user_id__in=user_ids[index:index + 1000], id_value_cap__gt=0
+            ).select_for_update().order_by('user_id'):
+                self.headroom[summary.user_id] = max(summary.id_value_cap - summary.id_value_income, Decimal('0'))
+
+    @classmethod
+    def clip_one(cls, user_id, amount, earned_type, remarks=None):
+        """
+        clip() for the single credit paths, lapsed excess written right away.
+        """
+        with transaction.atomic():
+            cap = cls([user_id])
+            paid = cap.clip(user_id, amount, earned_type, remarks)
+            cap.flush()
+        return paid
+
+    def clip(self, user_id, amount, earned_type, remarks=None):
+        """
+        The part of `amount` that still fits under the user's ID value; the rest is lapsed.
+        """
+        if user_id not in self.headroom or not amount:
+            return amount
+        paid = min(Decimal(amount), self.headroom[user_id])
+        self.headroom[user_id] -= paid
+        self.lapse(user_id, amount - paid, earned_type, remarks)
+        return paid
+
+    def fits(self, user_id, amount, earned_type, remarks=None):
+        """
+        All or nothing check for rewards: True when the whole amount fits, otherwise all of it is lapsed.
+        """
+        if user_id not in self.headroom or not amount:
+            return True
+        if amount > self.headroom[user_id]:
+            self.lapse(user_id, amount, earned_type, remarks)
+            return False
+        self.headroom[user_id] -= amount
+        return True
+
+    def lapse(self, user_id, amount, earned_type, remarks=None):
+        if amount >= Decimal('0.01'):
+            self.lapsed.append(LapsedAmount(user_id=user_id, earned_type=earned_type, amount=amount,
+                                            remarks=remarks[:150] if remarks else remarks))
+
+    def flush(self):
+        LapsedAmount.objects.bulk_create(self.lapsed)
+        self.lapsed = []
+
+
+def get_expected_earnings():
+    """
+    Recompute every user's UserEarningsSummary totals from the source tables, {user_id: {field: value}}.
+    """
+    totals = {}
+
+    def add(user_id, field, amount):
+        if user_id:
+            fields = totals.setdefault(user_id, {})
+            fields[field] = fields.get(field, 0) + (amount or 0)
+
+    for _, user_id, amount in get_id_value_investments().values_list('id', 'user_id', 'amount').distinct():
+        add(user_id, 'invested_amount', amount)
+        add(user_id, 'top_up_count', 1)
+    for row in Commission.objects.filter(status='active').values('commission_to_id', 'commission_type').annotate(
+            total=Sum('amount')):
+        add(row['commission_to_id'],
+            COMMISSION_EARNING_FIELDS.get(row['commission_type'], 'other_commission_income'), row['total'])
+    for row in InvestmentInterest.objects.filter(status='active').values('investment__user_id').annotate(
+            total=Sum('interest_amount')):
+        add(row['investment__user_id'], 'roi_income', row['total'])
+    for row in RoyaltyEarned.objects.filter(status='active', is_paid=True).values('user_id').annotate(
+            total=Sum('earned_amount')):
+        add(row['user_id'], 'royalty_income', row['total'])
+    for row in RewardEarned.objects.filter(status='active').values('user_id', 'reward__applicable_for').annotate(
+            total=Sum('reward__gift_amount')):
+        add(row['user_id'], 'reward_income' if row['reward__applicable_for'] == 'p2pmb' else 'other_reward_income',
+            row['total'])
+    for row in CoreIncomeEarned.objects.filter(status='active').values('user_id').annotate(
+            total=Sum('income_earned')):
+        add(row['user_id'], 'core_group_income', row['total'])
+    for row in ExtraRewardEarned.objects.filter(status='active').values('user_id').annotate(total=Sum('amount')):
+        add(row['user_id'], 'extra_reward_income', row['total'])
+    return totals
+
+
+def rebuild_earnings_summaries(dry_run=False):
+    """
+    Compare every UserEarningsSummary with the source tables and correct the drifted ones with F() deltas, so
+    credits committed while this runs are kept. Returns the number of drifted users.
+    """
+    fields = UserEarningsSummary.TOTAL_FIELDS
+    with transaction.atomic():
+        expected = get_expected_earnings()
+        working = set(MLMTree.objects.filter(is_working_id=True).values_list('child_id', flat=True))
+        stored = {
+            row[0]: dict(zip(fields + ('id_value_cap',), row[1:]))
+            for row in UserEarningsSummary.objects.values_list('user_id', *fields, 'id_value_cap')
+        }
+        deltas, stale_caps = {}, []
+        for user_id in expected.keys() | stored.keys():
+            expected_fields, stored_fields = expected.get(user_id, {}), stored.get(user_id, {})
+            delta = {field: expected_fields.get(field, 0) - stored_fields.get(field, 0) for field in fields}
+            delta = {field: value for field, value in delta.items() if value}
+            if delta:
+                deltas[user_id] = delta
+            multiplier = WORKING_ID_VALUE_MULTIPLIER if user_id in working else ID_VALUE_MULTIPLIER
+            if expected_fields.get('invested_amount', 0) * multiplier != stored_fields.get('id_value_cap', 0):
+                stale_caps.append(user_id)
 
-    while current_user:
-        parent = MLMTree.objects.filter(child=current_user, status='active', is_show=True).first()
-        if not parent or not parent.parent:
+        if not dry_run:
+            UserEarningsSummary.add(deltas)
+            UserEarningsSummary.refresh_id_value_cap(stale_caps)
+    return len(deltas)
+
+
+def get_expected_team_counters(nodes):
+    """
+    Recount the MLMTree team counters of `nodes`, {child_id: (parent_id, referral_by_id, is_team_member, is_show)},
+    as {field: Counter({child_id: value})}.
+    """
+    counters = {field: Counter() for field in MLMTree.TEAM_COUNTER_FIELDS}
+    children = {}
+    for child_id, (parent_id, _, _, _) in nodes.items():
+        if parent_id in nodes:
+            children.setdefault(parent_id, []).append(child_id)
+
+    def walk_upline(user_id):
+        seen = set()
+        current = nodes.get(user_id, (None,))[0]
+        while current is not None and current not in seen:
+            seen.add(current)
+            yield current
+            current = nodes.get(current, (None,))[0]
+
+    # Level by level from the roots, then children before parents so a subtree is counted before its parent adds it.
+    order = [child_id for child_id, node in nodes.items() if node[0] not in nodes]
+    for child_id in order:
+        order.extend(children.get(child_id, ()))
+    for child_id in reversed(order):
+        parent_id, _, is_team_member, is_show = nodes[child_id]
+        if is_show and parent_id:
+            counters['visible_descendant_count'][parent_id] += 1 + counters['visible_descendant_count'][child_id]
+        if is_team_member and parent_id:
+            counters['descendant_count'][parent_id] += 1 + counters['descendant_count'][child_id]
+
+    for child_id, (parent_id, referral_by_id, is_team_member, _) in nodes.items():
+        if referral_by_id:
+            counters['referral_count'][referral_by_id] += 1
+        if not is_team_member:
+            continue
+        if referral_by_id:
+            counters['direct_referral_count'][referral_by_id] += 1
+        if parent_id:
+            counters['level_one_count'][parent_id] += 1
+            grandparent_id = nodes.get(parent_id, (None,))[0]
+            if grandparent_id:
+                counters['level_two_count'][grandparent_id] += 1
+
+    for user_id, referral_count in list(counters['referral_count'].items()):
+        if referral_count < MLMTree.HIGH_PERFORMER_REFERRALS or user_id not in nodes:
+            continue
+        referral_by_id = nodes[user_id][1]
+        if referral_by_id:
+            counters['direct_high_performer_count'][referral_by_id] += 1
+        for ancestor_id in walk_upline(user_id):
+            counters['team_high_performer_count'][ancestor_id] += 1
+    return counters
+
+
+def rebuild_team_counters(dry_run=False):
+    """
+    Compare the MLMTree team counters with a recount of the tree and correct the drifted ones with F() deltas, so
+    counter updates committed while this runs are kept. Working ID flags that no longer follow the direct referral
+    count are flipped and the ID value caps of those users refreshed. Returns the number of drifted nodes.
+    """
+    fields = MLMTree.TEAM_COUNTER_FIELDS
+    with transaction.atomic():
+        nodes, stored = {}, {}
+        for child_id, parent_id, referral_by_id, status, is_show, *values in MLMTree.objects.values_list(
+                'child_id', 'parent_id', 'referral_by_id', 'status', 'is_show', *fields):
+            nodes[child_id] = (parent_id, referral_by_id, status == 'active' and is_show, is_show)
+            stored[child_id] = dict(zip(fields, values))
+        expected = get_expected_team_counters(nodes)
+
+        deltas, drifted = {}, set()
+        for child_id, values in stored.items():
+            for field in fields:
+                delta = expected[field][child_id] - values[field]
+                if delta:
+                    deltas.setdefault((field, delta), []).append(child_id)
+                    drifted.add(child_id)
+        if dry_run:
+            return len(drifted)
+
+        for (field, delta), child_ids in deltas.items():
+            for index in range(0, len(child_ids), 1000):
+                MLMTree.objects.filter(child_id__in=child_ids[index:index + 1000]).update(
+                    **{field: F(field) + delta})
+
+        working = Q(direct_referral_count__gte=MLMTree.WORKING_ID_REFERRALS)
+        flipped = list(MLMTree.objects.filter(
+            (working & Q(is_working_id=False)) | (~working & Q(is_working_id=True))
+        ).values_list('child_id', flat=True))
+        MLMTree.objects.filter(child_id__in=flipped).update(
+            is_working_id=Case(When(working, then=Value(True)), default=Value(False)))
+        UserEarningsSummary.refresh_id_value_cap(flipped)
+    return len(drifted)
+
+
+def rebuild_closure(reset=False, batch_size=5000):
+    """
+    Write the closure rows of every node from the parent links, keeping existing rows unless `reset`.
+    Returns (nodes, paths).
+    """
+    parent_map = dict(MLMTree.objects.values_list('child_id', 'parent_id'))
+    ancestors_cache = {}
+
+    def get_ancestors(user_id):
+        """ Ancestors of a user nearest first, resolved iteratively and memoised per node. """
+        path = []
+        current = user_id
+        while current is not None and current not in ancestors_cache:
+            path.append(current)
+            current = parent_map.get(current)
+        known = ancestors_cache.get(current, []) if current is not None else []
+        for node in reversed(path):
+            parent = parent_map.get(node)
+            known = [parent] + known if parent is not None else []
+            ancestors_cache[node] = known
+        return ancestors_cache[user_id]
+
+    with transaction.atomic():
+        if reset:
+            MLMTreeClosure.objects.all().delete()
+
+        rows = []
+        total = 0
+        for child_id in parent_map:
+            rows.append(MLMTreeClosure(ancestor_id=child_id, descendant_id=child_id, depth=0))
+            for depth, ancestor_id in enumerate(get_ancestors(child_id), start=1):
+                rows.append(MLMTreeClosure(ancestor_id=ancestor_id, descendant_id=child_id, depth=depth))
+
+            if len(rows) >= batch_size:
+                MLMTreeClosure.objects.bulk_create(rows, ignore_conflicts=True)
+                total += len(rows)
+                rows = []
+
+        if rows:
+            MLMTreeClosure.objects.bulk_create(rows, ignore_conflicts=True)
+            total += len(rows)
+    return len(parent_map), total
+
+
+def add_closure_for_node(parent, child):
+    """
+    Insert the closure rows of a newly placed node: one row to itself and one row per ancestor of its parent.
+    """
+    rows = [MLMTreeClosure(ancestor_id=child.id, descendant_id=child.id, depth=0)]
+    if parent:
+        rows.extend(
+            MLMTreeClosure(ancestor_id=ancestor_id, descendant_id=child.id, depth=depth + 1)
+            for ancestor_id, depth in MLMTreeClosure.objects.filter(descendant=parent).values_list('ancestor_id',
+                                                                                                     'depth')
+        )
+    MLMTreeClosure.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def get_ancestor_nodes(user, max_depth=None, **filters):
+    """
+    Return the MLMTree rows of the upline of `user` ordered nearest first, each annotated with its `depth`.
+    """
+    depth_filter = {'path__depth__range': (1, max_depth)} if max_depth is not None else {'path__depth__gte': 1}
+    return MLMTree.objects.annotate(
+        path=FilteredRelation('child__descendant_links', condition=Q(child__descendant_links__descendant=user))
+    ).filter(**depth_filter, **filters).annotate(depth=F('path__depth')).order_by('depth')
+
+
+def get_descendant_nodes(user, max_depth=None, **filters):
+    """
+    Return the MLMTree rows of the downline of `user` ordered level by level, each annotated with its `depth`.
+    """
+    depth_filter = {'path__depth__range': (1, max_depth)} if max_depth is not None else {'path__depth__gte': 1}
+    return MLMTree.objects.annotate(
+        path=FilteredRelation('child__ancestor_links', condition=Q(child__ancestor_links__ancestor=user))
+    ).filter(**depth_filter, **filters).annotate(depth=F('path__depth')).order_by('depth', 'position')
+
+
+def get_visible_upline(user, max_levels=None):
+    """
+    Walk the upline of an MLMTree node and stop at the first inactive or hidden node, or at the root.
+    """
+    nodes = get_ancestor_nodes(user.child, max_levels).select_related('child', 'parent')
+    levels = []
+    for depth, node in enumerate(nodes, start=1):
+        if node.depth != depth or node.status != 'active' or not node.is_show or not node.parent_id:
             break
+        levels.append(node)
+    return levels
 
-        current_user = parent.parent
-        level_count += 1
 
-    return level_count
+MAX_CHILDREN_PER_NODE = 5
 
 
-def count_all_descendants(user):
+def get_bfs_key(node):
+    """ Path of child positions from the root down to the given MLMTree node. """
+    positions = list(get_ancestor_nodes(node.child).values_list('position', flat=True))
+    return ''.join(str(position) for position in reversed(positions)) + str(node.position)
+
+
+def find_open_slot(start_node):
     """
-    Recursively count all child users at all levels.
+    Lock and return the first open slot of the subtree of `start_node` in breadth-first order.
+    Each depth is a single range seek on the (depth, bfs_key) index, so the cost does not grow with the tree.
     """
-    children = MLMTree.objects.filter(parent=user, status='active', is_show=True)
-    count = children.count()
+    start_slot = MLMTreeOpenSlot.objects.filter(node=start_node).first()
+    prefix = start_slot.bfs_key if start_slot else get_bfs_key(start_node)
+    max_depth = MLMTreeOpenSlot.objects.aggregate(max_depth=Max('depth'))['max_depth'] or 0
+
+    for depth in range(len(prefix), max_depth + 1):
+        padding = depth - len(prefix)
+        queryset = MLMTreeOpenSlot.objects.filter(
+            depth=depth, bfs_key__range=(prefix + '0' * padding, prefix + '9' * padding)
+        )
+        slot = queryset.select_for_update(of=('self',)).select_related('node').order_by('bfs_key').first()
+        if not slot and queryset.exists():
+            # The slot we waited on was filled by a concurrent placement, look again at this depth.
+            slot = queryset.select_for_update(of=('self',)).select_related('node').order_by('bfs_key').first()
+        if slot:
+            return slot
+    return None
 
-    for child in children:
-        count += count_all_descendants(child.child)
 
-    return count
+def update_open_slots(parent_node, node):
+    """ Register the new node as an open slot and close the parent slot once it has all its children. """
+    parent_slot = MLMTreeOpenSlot.objects.filter(node=parent_node).first()
+    parent_key = parent_slot.bfs_key if parent_slot else get_bfs_key(parent_node)
+    MLMTreeOpenSlot.objects.create(node=node, depth=len(parent_key) + 1, bfs_key=parent_key + str(node.position))
+
+    if parent_slot:
+        if node.position >= MAX_CHILDREN_PER_NODE:
+            parent_slot.delete()
+        else:
+            parent_slot.children_count = node.position
+            parent_slot.save(update_fields=['children_count'])
+
+
+def rebuild_open_slots(batch_size=5000):
+    """
+    Rebuild the open-slot queue from the tree: one slot per node with fewer than MAX_CHILDREN_PER_NODE children.
+    Returns (slots, nodes).
+    """
+    nodes = {
+        child_id: (node_id, parent_id, position)
+        for node_id, child_id, parent_id, position in MLMTree.objects.values_list(
+            'id', 'child_id', 'parent_id', 'position')
+    }
+    children_count = Counter(MLMTree.objects.filter(parent__isnull=False).values_list('parent_id', flat=True))
+    keys = {}
+
+    def get_key(user_id):
+        """ Path of positions from the root, resolved iteratively and memoised per node. """
+        path = []
+        current = user_id
+        while current in nodes and current not in keys:
+            path.append(current)
+            current = nodes[current][1]
+        prefix = keys.get(current, '')
+        for node in reversed(path):
+            prefix += str(nodes[node][2])
+            keys[node] = prefix
+        return keys[user_id]
+
+    slots = []
+    for child_id, (node_id, parent_id, position) in nodes.items():
+        count = children_count.get(child_id, 0)
+        if count >= MAX_CHILDREN_PER_NODE:
+            continue
+        bfs_key = get_key(child_id)
+        slots.append(MLMTreeOpenSlot(node_id=node_id, depth=len(bfs_key), bfs_key=bfs_key, children_count=count))
+
+    with transaction.atomic():
+        MLMTreeOpenSlot.objects.all().delete()
+        MLMTreeOpenSlot.objects.bulk_create(slots, batch_size=batch_size)
+    return len(slots), len(nodes)
+
+
+def get_levels_above_count(user):
+    """ Retrieve and count all levels of parent users until the root is reached. """
+    return len(get_visible_upline(user))
+
+
+def count_all_descendants(user):
+    """
+    Count the child users at all levels reached through active and visible nodes, read from the team counter.
+    """
+    return MLMTree.objects.filter(child=user).values_list('descendant_count', flat=True).first() or 0
 
 
 def get_downline_count(user):
-    def count_children(parent_user):
-        children = MLMTree.objects.filter(parent=parent_user, is_show=True)
-        count = children.count()
-        for child_entry in children:
-            count += count_children(child_entry.child)
-        return count
-
-    return count_children(user)
+    """
+    Count the child users at all levels reached through visible nodes, read from the team counter.
+    """
+    return MLMTree.objects.filter(child=user).values_list('visible_descendant_count', flat=True).first() or 0
 
 
 def get_level_counts(direct_count):
@@ -0,0 +1,45 @@
+"""
+Background jobs of the p2pmb app that have no cron entry, queued by the admin endpoints, and its outbox handlers.
+"""
+from master.helpers import background_job
+from p2pmb.calculation import DistributeDirectCommissionBatch, DistributeLevelIncomeBatch, RoyaltyClubDistribute, \
+    LifeTimeRewardIncome
+
+
+@background_job
+def distribute_direct_income_for_investment(investment_id):
+    """
+    Direct income of a single investment. Skips it if an earlier run already flagged it, so a retry is safe.
+    """
+    DistributeDirectCommissionBatch.distribute_chunk([investment_id])
+
+
+@background_job
+def distribute_royalty_income():
+    """
+    This month's royalty; each club's income row is flagged in the same transaction as its payouts.
+    """
+    RoyaltyClubDistribute.distribute_royalty()
+
+
+@background_job
+def allocate_lifetime_rewards():
+    """
+    Lifetime rewards; rewards already earned are skipped.
+    """
+    LifeTimeRewardIncome.check_and_allocate_rewards()
+
+
+def distribute_investment_income(investment_id=None, user_id=None):
+    """
+    Outbox handler of investment.approved and mlm.node_placed: direct and level income of one investment, or of
+    every pending investment of a user whose tree node was just placed. Both batches skip investments that are
+    already paid, so a redelivered event pays nothing twice.
+    """
+    filters = {'id': investment_id} if investment_id else {'user_id': user_id}
+    for batch in (DistributeDirectCommissionBatch, DistributeLevelIncomeBatch):
+        investment_ids = list(dict.fromkeys(
+            batch.get_pending_investments().filter(**filters).order_by('date_created').values_list('id', flat=True)
+        ))
+        if investment_ids:
+            batch.distribute_chunk(investment_ids)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.helpers import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = 'Build the MLMTree ancestor/descendant closure table from the existing tree.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Delete the existing closure rows first.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        nodes, total = rebuild_closure(reset=options['reset'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Closure rows written for {nodes} nodes ({total} paths).'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from p2pmb.models import ScheduledCommission, DirectIncomeSchedule
+
+
+class Command(BaseCommand):
+    help = 'Fold unpaid per-month direct income ScheduledCommission rows into compact DirectIncomeSchedule rows.'
+
+    def handle(self, *args, **options):
+        legacy = ScheduledCommission.objects.filter(is_paid=False, remarks__isnull=True, status='active')
+        groups = legacy.values('send_by', 'user', 'amount', 'commission_type').annotate(
+            remaining=Count('id'), next_due=Min('scheduled_date'))
+
+        with transaction.atomic():
+            schedules = [
+                DirectIncomeSchedule(
+                    created_by_id=group['user'], send_by_id=group['send_by'], user_id=group['user'],
+                    commission_type=group['commission_type'], installment_amount=group['amount'],
+                    total_installments=group['remaining'], next_due_date=group['next_due'].date()
+                )
+                for group in groups
+            ]
+            DirectIncomeSchedule.objects.bulk_create(schedules, batch_size=2000)
+            deleted, _ = legacy.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{deleted} scheduled commission rows folded into {len(schedules)} installment schedules.'))
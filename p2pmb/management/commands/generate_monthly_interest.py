@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.calculation import ProcessMonthlyInterestP2PMB
+
+
+class Command(BaseCommand):
+    help = 'Generate the monthly P2PMB interest, or report what would be paid with --dry-run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Compute the totals without writing anything.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        totals = ProcessMonthlyInterestP2PMB.generate_interest_for_all_investments(
+            dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        if totals:
+            self.stdout.write(self.style.SUCCESS(
+                f"{totals['investments']} investments, {totals['amount']} interest."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.helpers import rebuild_earnings_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute UserEarningsSummary from the commission, interest, reward and investment tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many users drifted.')
+
+    def handle(self, *args, **options):
+        drifted = rebuild_earnings_summaries(dry_run=options['dry_run'])
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{drifted} users with drifted earnings summaries.'))
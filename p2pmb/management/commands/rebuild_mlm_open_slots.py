@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.helpers import rebuild_open_slots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the open-slot placement queue of the MLM tree.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        slots, nodes = rebuild_open_slots(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{slots} open slots rebuilt for {nodes} nodes.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.helpers import rebuild_team_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the MLMTree team and high performer counters and the working ID flag from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many nodes drifted.')
+
+    def handle(self, *args, **options):
+        drifted = rebuild_team_counters(dry_run=options['dry_run'])
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{drifted} nodes with drifted team counters.'))
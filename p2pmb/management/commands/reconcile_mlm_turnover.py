@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from p2pmb.calculation import ReconcileTurnover
+
+
+class Command(BaseCommand):
+    help = 'Recompute MLMTree.turnover as the approved P2PMB investment of each subtree and fix drifted nodes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many nodes drifted.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        drifted = ReconcileTurnover.reconcile(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{drifted} nodes with drifted turnover.'))
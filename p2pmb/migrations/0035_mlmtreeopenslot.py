@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0034_mlmtreeclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MLMTreeOpenSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('bfs_key', models.CharField(max_length=255)),
+                ('children_count', models.PositiveSmallIntegerField(default=0)),
+                ('node', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='open_slot', to='p2pmb.mlmtree')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['depth', 'bfs_key'], name='open_slot_depth_key_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0035_mlmtreeopenslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmtree',
+            name='descendant_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mlmtree',
+            name='direct_referral_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mlmtree',
+            name='level_one_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mlmtree',
+            name='level_two_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agency', '0036_agency_is_default_superagency_is_default'),
+        ('p2pmb', '0036_mlmtree_descendant_count_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectIncomeSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Date of creation')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Date of update')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('inactive', 'Inactive'), ('blocked', 'Blocked')], default='active', max_length=20)),
+                ('commission_type', models.CharField(default='direct', max_length=50)),
+                ('installment_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_installments', models.PositiveSmallIntegerField(default=10)),
+                ('paid_installments', models.PositiveSmallIntegerField(default=0)),
+                ('next_due_date', models.DateField()),
+                ('is_completed', models.BooleanField(default=False)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+                ('investment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='direct_income_schedules', to='agency.investment')),
+                ('send_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='direct_income_schedules_sent', to=settings.AUTH_USER_MODEL)),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_updated', to=settings.AUTH_USER_MODEL, verbose_name='Updated by')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='direct_income_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_completed', 'next_due_date'], name='direct_schedule_due_idx')],
+            },
+        ),
+    ]
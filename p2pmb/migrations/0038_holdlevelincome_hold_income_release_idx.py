@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0037_directincomeschedule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='holdlevelincome',
+            index=models.Index(fields=['commission_to', 'release_status', 'direct_user_required'], name='hold_income_release_idx'),
+        ),
+    ]
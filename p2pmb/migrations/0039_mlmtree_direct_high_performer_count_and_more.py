@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0038_holdlevelincome_hold_income_release_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmtree',
+            name='direct_high_performer_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mlmtree',
+            name='team_high_performer_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
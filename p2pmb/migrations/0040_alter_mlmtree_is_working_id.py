@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0039_mlmtree_direct_high_performer_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mlmtree',
+            name='is_working_id',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
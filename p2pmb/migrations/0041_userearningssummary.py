@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0040_alter_mlmtree_is_working_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEarningsSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invested_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('top_up_count', models.IntegerField(default=0)),
+                ('id_value_cap', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('direct_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('level_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('other_commission_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('roi_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('royalty_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('reward_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('other_reward_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('core_group_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('extra_reward_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='earnings_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0041_userearningssummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lapsedamount',
+            name='earned_type',
+            field=models.CharField(choices=[('level_income', 'Level Income'), ('core_group_income', 'Core Group Income'), ('royalty', 'Royalty'), ('direct_income', 'Direct Income'), ('roi', 'ROI'), ('reward', 'Reward')], default='level_income', max_length=20),
+        ),
+    ]
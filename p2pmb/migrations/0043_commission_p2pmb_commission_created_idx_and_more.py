@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0011_coregroupphase_coregroupincome'),
+        ('p2pmb', '0042_alter_lapsedamount_earned_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commission',
+            index=models.Index(fields=['date_created'], name='p2pmb_commission_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coreincomeearned',
+            index=models.Index(fields=['date_created'], name='core_income_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lapsedamount',
+            index=models.Index(fields=['date_created'], name='lapsed_amount_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='royaltyearned',
+            index=models.Index(fields=['date_created'], name='royalty_earned_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='royaltyearned',
+            index=models.Index(fields=['earned_date'], name='royalty_earned_date_idx'),
+        ),
+    ]
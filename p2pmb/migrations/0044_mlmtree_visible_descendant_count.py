@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0043_commission_p2pmb_commission_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmtree',
+            name='visible_descendant_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def backfill_open_slots(apps, schema_editor):
+    """
+    Fill the open-slot queue for the nodes placed before it existed, so placement finds the breadth-first parent
+    without a manual rebuild_mlm_open_slots run. Uses the same helper as that command.
+    """
+    if not apps.get_model('p2pmb', 'MLMTree').objects.exists():
+        return
+    from p2pmb.helpers import rebuild_open_slots
+
+    rebuild_open_slots()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0044_mlmtree_visible_descendant_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mlmtreeopenslot',
+            name='bfs_key',
+            field=models.TextField(),
+        ),
+        migrations.RunPython(backfill_open_slots, migrations.RunPython.noop),
+    ]
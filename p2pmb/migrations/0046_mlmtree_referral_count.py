@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+def backfill_referral_counts(apps, schema_editor):
+    """
+    Count the referrals of the existing nodes and move the high performer counters onto them. Uses the same
+    helper as rebuild_mlm_team_counters.
+    """
+    if not apps.get_model('p2pmb', 'MLMTree').objects.exists():
+        return
+    from p2pmb.helpers import rebuild_team_counters
+
+    rebuild_team_counters()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2pmb', '0045_mlmtreeopenslot_bfs_key_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmtree',
+            name='referral_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_referral_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def backfill_tree_rollups(apps, schema_editor):
+    """
+    Build the closure table, the team counters and the subtree turnover of the nodes that existed before they
+    were maintained. The closure comes first: the counters and the turnover are then kept up to date along it.
+    Uses the same helpers as backfill_mlm_closure, rebuild_mlm_team_counters and reconcile_mlm_turnover.
+    """
+    if not apps.get_model('p2pmb', 'MLMTree').objects.exists():
+        return
+    from p2pmb.calculation import ReconcileTurnover
+    from p2pmb.helpers import rebuild_closure, rebuild_team_counters
+
+    rebuild_closure()
+    rebuild_team_counters()
+    ReconcileTurnover.reconcile()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agency', '0037_investment_investment_created_idx_and_more'),
+        ('p2pmb', '0046_mlmtree_referral_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tree_rollups, migrations.RunPython.noop),
+    ]
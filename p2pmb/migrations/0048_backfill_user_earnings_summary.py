@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def backfill_earnings_summaries(apps, schema_editor):
+    """
+    Fill UserEarningsSummary for the earnings and investments recorded before it existed. Uses the same helper as
+    rebuild_earnings_summary, and runs after the working ID backfill so the ID value caps use the right multiplier.
+    """
+    if not apps.get_model('agency', 'Investment').objects.exists():
+        return
+    from p2pmb.helpers import rebuild_earnings_summaries
+
+    rebuild_earnings_summaries()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agency', '0037_investment_investment_created_idx_and_more'),
+        ('master', '0017_job_timeout'),
+        ('p2pmb', '0047_backfill_mlm_tree_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_earnings_summaries, migrations.RunPython.noop),
+    ]
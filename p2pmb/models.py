@@ -1,12 +1,13 @@
 from decimal import Decimal
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 
 from master.choices import ROYALTY_CLUB_TYPE
 from master.models import CoreGroupIncome, State
 from p2pmb.choices import EXTRA_REWARD_CHOICES, INCOME_EARNED_CHOICES, RELEASE_LEVEL_INCOME_CHOICES, \
     LAPSED_EARNED_CHOICES, ROI_CHOICE
+from real_estate.constant import ID_VALUE_MULTIPLIER, WORKING_ID_VALUE_MULTIPLIER
 from real_estate.model_mixin import ModelMixin
 
 
@@ -24,8 +25,33 @@ class MLMTree(ModelMixin):
     commission_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0.0)
     send_direct_income = models.BooleanField(default=False)
     send_level_income = models.BooleanField(default=False)
-    is_working_id = models.BooleanField(default=False)
+    is_working_id = models.BooleanField(default=False, db_index=True)
     is_show = models.BooleanField(default=True)
+    descendant_count = models.IntegerField(default=0)
+    visible_descendant_count = models.IntegerField(default=0)
+    direct_referral_count = models.IntegerField(default=0)
+    referral_count = models.IntegerField(default=0)
+    level_one_count = models.IntegerField(default=0)
+    level_two_count = models.IntegerField(default=0)
+    team_high_performer_count = models.IntegerField(default=0)
+    direct_high_performer_count = models.IntegerField(default=0)
+
+    # Maintained with F() updates along the upline, never written back from a possibly stale instance.
+    # descendant_count is the team of count_all_descendants: nodes reached through active and visible nodes only.
+    # visible_descendant_count is the team of get_downline_count: nodes reached through visible nodes only. A node
+    # outside the team still counts the team below it, but its ancestors count neither.
+    # referral_count counts every node referred by the user whatever its status, direct_referral_count only the
+    # referred team members.
+    TEAM_COUNTER_FIELDS = ('descendant_count', 'visible_descendant_count', 'direct_referral_count', 'referral_count',
+                           'level_one_count', 'level_two_count', 'team_high_performer_count',
+                           'direct_high_performer_count')
+    # Subtree totals rolled up the same way: turnover is the approved P2PMB investment of the node and its downline.
+    # is_working_id follows direct_referral_count and is flipped in the same transaction.
+    ROLLUP_FIELDS = TEAM_COUNTER_FIELDS + ('turnover', 'is_working_id')
+    # A member with at least this many referrals counts as a high performer for the interest tiers.
+    HIGH_PERFORMER_REFERRALS = 10
+    # A member with at least this many direct referrals has a working ID (4.4x instead of 2.1x return).
+    WORKING_ID_REFERRALS = 2
 
     class Meta:
         constraints = [
@@ -33,6 +59,174 @@ class MLMTree(ModelMixin):
             models.CheckConstraint(check=models.Q(position__gte=0) & models.Q(position__lte=5), name='valid_position')
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        deferred = instance.get_deferred_fields()
+        instance._was_team_member = None if {'status', 'is_show'} & deferred else instance.is_team_member
+        instance._was_visible = None if 'is_show' in deferred else instance.is_show
+        instance._loaded_rollups = {
+            field: getattr(instance, field) for field in cls.ROLLUP_FIELDS if field not in deferred
+        }
+        return instance
+
+    @property
+    def is_team_member(self):
+        """ Only active and visible nodes are counted in the team counters. """
+        return self.status == 'active' and self.is_show
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not adding and kwargs.get('update_fields') is None:
+            changed = [
+                field for field, value in getattr(self, '_loaded_rollups', {}).items()
+                if getattr(self, field) != value
+            ]
+            if changed:
+                raise ValueError(
+                    f"MLMTree {', '.join(changed)} are maintained along the upline and are not saved with the "
+                    f"node. Use add_turnover / apply_team_counters, or pass update_fields to overwrite them.")
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.ROLLUP_FIELDS
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if adding and self.referral_by_id:
+                self.apply_referral_count(1)
+            was_visible = False if adding else getattr(self, '_was_visible', None)
+            if was_visible is not None and was_visible != self.is_show:
+                self.apply_subtree_count('visible_descendant_count', models.Q(is_show=False),
+                                         1 if self.is_show else -1)
+            was_team_member = False if adding else getattr(self, '_was_team_member', None)
+            if was_team_member is not None and was_team_member != self.is_team_member:
+                self.apply_team_counters(1 if self.is_team_member else -1)
+        self._loaded_rollups = {field: getattr(self, field) for field in self.ROLLUP_FIELDS}
+        self._was_visible = self.is_show
+        self._was_team_member = self.is_team_member
+
+    def apply_subtree_count(self, field, outside, delta):
+        """
+        Add `delta` times this node and the part of its subtree counted in `field` to `field` of the ancestors that
+        reach this node through counted nodes only. The walk up stops at the nearest ancestor matching `outside`,
+        which still counts what is below it.
+        """
+        if not self.parent_id:
+            return
+        size = 1 + MLMTree.objects.select_for_update().filter(id=self.id).values_list(field, flat=True).get()
+        upline = MLMTreeClosure.objects.filter(descendant_id=self.parent_id)
+        cut = upline.filter(ancestor_id__in=MLMTree.objects.filter(outside).values('child_id')).aggregate(
+            depth=models.Min('depth'))['depth']
+        if cut is not None:
+            upline = upline.filter(depth__lte=cut)
+        MLMTree.objects.filter(child_id__in=upline.values('ancestor_id')).update(
+            **{field: models.F(field) + delta * size})
+
+    def apply_team_counters(self, delta):
+        """
+        Add `delta` to the team counters of every node affected by this node joining or leaving the team:
+        the ancestors reaching it through team members (descendant count), parent and grandparent (level counts)
+        and the referrer (direct referrals and working ID).
+        """
+        if self.parent_id:
+            self.apply_subtree_count('descendant_count', ~models.Q(status='active') | models.Q(is_show=False), delta)
+            upline = MLMTreeClosure.objects.filter(descendant_id=self.parent_id)
+            MLMTree.objects.filter(child_id=self.parent_id).update(
+                level_one_count=models.F('level_one_count') + delta)
+            MLMTree.objects.filter(child_id__in=upline.filter(depth=1).values('ancestor_id')).update(
+                level_two_count=models.F('level_two_count') + delta)
+        if self.referral_by_id:
+            referrer = MLMTree.objects.filter(child_id=self.referral_by_id)
+            referrer.update(direct_referral_count=models.F('direct_referral_count') + delta)
+            working_at = self.WORKING_ID_REFERRALS if delta > 0 else self.WORKING_ID_REFERRALS - 1
+            if referrer.filter(direct_referral_count=working_at).update(is_working_id=delta > 0):
+                UserEarningsSummary.refresh_id_value_cap([self.referral_by_id])
+
+    def apply_referral_count(self, delta):
+        """
+        Add `delta` to the referral count of the referrer, and to the high performer counters when that count
+        crosses HIGH_PERFORMER_REFERRALS.
+        """
+        referrer = MLMTree.objects.filter(child_id=self.referral_by_id)
+        referrer.update(referral_count=models.F('referral_count') + delta)
+        crossed_at = self.HIGH_PERFORMER_REFERRALS if delta > 0 else self.HIGH_PERFORMER_REFERRALS - 1
+        if referrer.filter(referral_count=crossed_at).exists():
+            self.apply_high_performer_counters(self.referral_by_id, delta)
+
+    @staticmethod
+    def get_direct_referral_counts(user_ids):
+        """
+        {user_id: referrals} from the maintained counter: every node referred by the user, whatever its status.
+        Level income and held income release count these; working IDs follow direct_referral_count.
+        """
+        return dict(MLMTree.objects.filter(child_id__in=user_ids).order_by('id').values_list(
+            'child_id', 'referral_count'))
+
+    @staticmethod
+    def add_turnover(user_id, amount):
+        """
+        Add `amount` to the turnover of the node of `user_id` and of every ancestor in one UPDATE over the closure.
+        """
+        upline = MLMTreeClosure.objects.filter(descendant_id=user_id)
+        return MLMTree.objects.filter(child_id__in=upline.values('ancestor_id')).update(
+            turnover=models.F('turnover') + amount)
+
+    @staticmethod
+    def apply_high_performer_counters(user_id, delta):
+        """
+        Add `delta` to the high performer counters of the whole upline and of the referrer of `user_id`,
+        called when that user's referral count crosses HIGH_PERFORMER_REFERRALS.
+        """
+        upline = MLMTreeClosure.objects.filter(descendant_id=user_id, depth__gte=1)
+        MLMTree.objects.filter(child_id__in=upline.values('ancestor_id')).update(
+            team_high_performer_count=models.F('team_high_performer_count') + delta)
+        referrer_id = MLMTree.objects.filter(child_id=user_id).values_list('referral_by_id', flat=True).last()
+        if referrer_id:
+            MLMTree.objects.filter(child_id=referrer_id).update(
+                direct_high_performer_count=models.F('direct_high_performer_count') + delta)
+
+
+class MLMTreeClosure(models.Model):
+    """
+    Ancestor/descendant pairs of the MLM tree with their distance, so that an upline or downline
+    can be fetched in a single indexed query. Every node also has a row pointing to itself at depth 0.
+    """
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_closure_path')
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='closure_descendant_depth_idx'),
+            models.Index(fields=['ancestor', 'depth'], name='closure_ancestor_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class MLMTreeOpenSlot(models.Model):
+    """
+    Queue of MLMTree nodes that still have room for children. `bfs_key` is the path of positions from the
+    root, so ordering by (depth, bfs_key) inside a key prefix gives the breadth-first order of any subtree.
+    """
+    node = models.OneToOneField(MLMTree, on_delete=models.CASCADE, related_name='open_slot')
+    depth = models.PositiveIntegerField()
+    bfs_key = models.TextField()
+    children_count = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['depth', 'bfs_key'], name='open_slot_depth_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.node_id} - {self.bfs_key} ({self.children_count})"
+
 
 class ScheduledCommission(ModelMixin):
     COMMISSION_TYPE_CHOICES = [
@@ -53,6 +247,31 @@ class ScheduledCommission(ModelMixin):
         return f"Commission for {self.user} on {self.scheduled_date}"
 
 
+class DirectIncomeSchedule(ModelMixin):
+    """
+    One row per direct income paid out in monthly installments, replacing one ScheduledCommission per month.
+    """
+    investment = models.ForeignKey('agency.Investment', on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='direct_income_schedules')
+    send_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='direct_income_schedules_sent',
+                                null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='direct_income_schedules')
+    commission_type = models.CharField(max_length=50, default='direct')
+    installment_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    total_installments = models.PositiveSmallIntegerField(default=10)
+    paid_installments = models.PositiveSmallIntegerField(default=0)
+    next_due_date = models.DateField()
+    is_completed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_completed', 'next_due_date'], name='direct_schedule_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.paid_installments}/{self.total_installments} of {self.installment_amount}"
+
+
 class Package(ModelMixin):
     APPLICABLE_FOR_CHOICES = [
         ('super_agency', 'Star Agency'),
@@ -137,6 +356,9 @@ class Commission(ModelMixin):
     description = models.CharField(max_length=255, blank=True, null=True)
     level_type = models.CharField(max_length=8, choices=LEVEL_CHOICES, null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['date_created'], name='p2pmb_commission_created_idx')]
+
     def __str__(self):
         return f"{self.commission_by.username} - {self.get_commission_type_display()} - {self.amount}"
 
@@ -179,6 +401,12 @@ class RoyaltyEarned(ModelMixin):
     earned_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     is_paid = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created'], name='royalty_earned_created_idx'),
+            models.Index(fields=['earned_date'], name='royalty_earned_date_idx'),
+        ]
+
     def __str__(self):
         return f"User {self.user.username} - Earned Date {self.earned_date}"
 
@@ -212,6 +440,9 @@ class CoreIncomeEarned(ModelMixin):
     income_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0.0)
     is_paid = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=['date_created'], name='core_income_created_idx')]
+
     def __str__(self):
         return str(self.id)
 
@@ -233,6 +464,12 @@ class HoldLevelIncome(ModelMixin):
     release_status = models.CharField(max_length=30, choices=RELEASE_LEVEL_INCOME_CHOICES, default='on_hold')
     released_date = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['commission_to', 'release_status', 'direct_user_required'],
+                         name='hold_income_release_idx'),
+        ]
+
     def __str__(self):
         return f"{self.commission_by.username} - {self.amount}"
 
@@ -243,6 +480,9 @@ class LapsedAmount(ModelMixin):
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     remarks = models.CharField(max_length=150, null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['date_created'], name='lapsed_amount_created_idx')]
+
     def __str__(self):
         return f"{self.id}"
 
@@ -254,4 +494,85 @@ class ROIOverride(ModelMixin):
     reason = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
-        return f"{self.user} - {self.percentage}%"
\ No newline at end of file
+        return f"{self.user} - {self.percentage}%"
+
+
+class UserEarningsSummary(models.Model):
+    """
+    Running totals of a user's P2PMB income and investment, one row per user, so dashboards read a single row.
+    Kept in step by the code paths writing income (see p2pmb.helpers.record_earnings) and rebuildable from the
+    source tables with `manage.py rebuild_earnings_summary`.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='earnings_summary')
+    invested_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    top_up_count = models.IntegerField(default=0)
+    id_value_cap = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    direct_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    level_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    other_commission_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    roi_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    royalty_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    reward_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    other_reward_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    core_group_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    extra_reward_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    TOTAL_FIELDS = ('invested_amount', 'top_up_count', 'direct_income', 'level_income', 'other_commission_income',
+                    'roi_income', 'royalty_income', 'reward_income', 'other_reward_income', 'core_group_income',
+                    'extra_reward_income')
+
+    def __str__(self):
+        return f"Earnings of {self.user_id}"
+
+    @property
+    def commission_income(self):
+        return self.direct_income + self.level_income + self.other_commission_income
+
+    @property
+    def total_earning(self):
+        """ Everything credited to the user: all commissions, P2PMB rewards, ROI, royalty, core group and extra. """
+        return (self.commission_income + self.reward_income + self.roi_income + self.royalty_income +
+                self.core_group_income + self.extra_reward_income)
+
+    @property
+    def id_value_income(self):
+        """ Income counted against the ID value: direct and level commissions plus every other income. """
+        return (self.direct_income + self.level_income + self.roi_income + self.royalty_income +
+                self.reward_income + self.other_reward_income + self.core_group_income + self.extra_reward_income)
+
+    @classmethod
+    def for_user(cls, user_id):
+        """ The stored row of a user, or an unsaved all-zero row when nothing was recorded yet. """
+        return cls.objects.filter(user_id=user_id).first() or cls(user_id=user_id)
+
+    @classmethod
+    def add(cls, totals):
+        """
+        Add {user_id: {field: amount}} to the running totals with one F() UPDATE per user, creating missing rows.
+        The ID value cap of users whose investment changed is refreshed afterwards.
+        """
+        totals = {user_id: fields for user_id, fields in totals.items() if user_id and any(fields.values())}
+        if not totals:
+            return
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in totals], ignore_conflicts=True)
+        for user_id, fields in sorted(totals.items()):
+            cls.objects.filter(user_id=user_id).update(
+                **{field: models.F(field) + amount for field, amount in fields.items() if amount})
+        cls.refresh_id_value_cap([user_id for user_id, fields in totals.items() if fields.get('invested_amount')])
+
+    @classmethod
+    def refresh_id_value_cap(cls, user_ids):
+        """
+        Recompute id_value_cap = invested_amount x multiplier, 4.4 for working IDs and 2.1 otherwise.
+        """
+        user_ids = list(set(user_ids))
+        for index in range(0, len(user_ids), 1000):
+            batch = set(user_ids[index:index + 1000])
+            working = set(MLMTree.objects.filter(child_id__in=batch, is_working_id=True).values_list(
+                'child_id', flat=True))
+            cls.objects.filter(user_id__in=working).update(
+                id_value_cap=models.F('invested_amount') * WORKING_ID_VALUE_MULTIPLIER)
+            cls.objects.filter(user_id__in=batch - working).update(
+                id_value_cap=models.F('invested_amount') * ID_VALUE_MULTIPLIER)
+
@@ -1,7 +1,8 @@
 from import_export import resources
 
 from p2pmb.models import MLMTree, Package, ScheduledCommission, RoyaltyClub, P2PMBRoyaltyMaster, ExtraReward, \
-    RoyaltyEarned, ExtraRewardEarned, LapsedAmount, ROIOverride
+    RoyaltyEarned, ExtraRewardEarned, LapsedAmount, ROIOverride, DirectIncomeSchedule, \
+    UserEarningsSummary
 
 
 class MLMTreeResource(resources.ModelResource):
@@ -25,6 +26,20 @@ class ScheduledCommissionResource(resources.ModelResource):
         exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
 
 
+class DirectIncomeScheduleResource(resources.ModelResource):
+    class Meta:
+        model = DirectIncomeSchedule
+        import_id_fields = ('id',)
+        exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
+
+
+class UserEarningsSummaryResource(resources.ModelResource):
+    class Meta:
+        model = UserEarningsSummary
+        import_id_fields = ('id',)
+        exclude = ('date_updated',)
+
+
 class RoyaltyClubResource(resources.ModelResource):
     class Meta:
         model = RoyaltyClub
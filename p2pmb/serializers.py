@@ -6,6 +6,9 @@ from rest_framework import serializers
 
 from accounts.models import Profile
 from agency.models import Investment, InvestmentInterest
+from master.helpers import publish_event
+from p2pmb.calculation import ReleaseHoldLevelIncome
+from p2pmb.helpers import add_closure_for_node, find_open_slot, update_open_slots, roll_up_user_turnover
 from payment_app.models import Transaction, UserWallet
 from .models import MLMTree, User, Package, Commission, ExtraReward, CoreIncomeEarned, P2PMBRoyaltyMaster, \
     RoyaltyEarned, ExtraRewardEarned, HoldLevelIncome, ROIOverride, LapsedAmount
@@ -66,7 +69,7 @@ class MLMTreeSerializer(serializers.ModelSerializer):
         show_level = parent_node.show_level + 1
         Profile.objects.filter(user=child_node).update(is_p2pmb=True)
 
-        return MLMTree.objects.create(
+        node = MLMTree.objects.create(
             parent=parent_node.child,
             child=child_node,
             position=position,
@@ -74,9 +77,21 @@ class MLMTreeSerializer(serializers.ModelSerializer):
             show_level=show_level,
             referral_by=referral_by if referral_by else None
         )
+        add_closure_for_node(parent_node.child, child_node)
+        roll_up_user_turnover(child_node.id)
+        update_open_slots(parent_node, node)
+        if node.referral_by_id:
+            ReleaseHoldLevelIncome.release_for_user(node.referral_by_id)
+        # Investments approved before the node existed could not pay income yet.
+        publish_event('mlm.node_placed', user_id=child_node.id)
+        return node
 
     def find_next_available_parent_node(self, start_node):
         """ Find the next available parent node in a breadth-first manner. """
+        slot = find_open_slot(start_node)
+        if slot:
+            return slot.node
+
         queue = deque([start_node])
 
         while queue:
@@ -0,0 +1,85 @@
+"""
+Read-only, array-backed snapshot of the MLM tree for batch jobs.
+
+The whole MLMTree table is loaded with one values_list query into parallel arrays indexed by node position
+(nodes are sorted by user id, so a user's index is a binary search away).
+
+The snapshot only holds parent links, turnover and a parents-first order, and only computes subtree sums:
+ReconcileTurnover is its one user. The royalty, reward, working ID and interest tier jobs read the closure table
+and the counters kept on MLMTree instead, so there are no sibling or referral links, status flags, ancestor walks
+or referral counts here. Nor is the snapshot saved to a memory-mapped file: the tree changes between runs, and
+the reconcile must read it under lock in its own transaction.
+"""
+import array
+import bisect
+from collections import deque
+
+from p2pmb.models import MLMTree
+
+
+class MLMTreeSnapshot:
+    """
+    Parallel arrays over the tree: user_ids, parent (index, -1 for a root), turnover (paise) and order (parents
+    before children).
+    """
+
+    def __init__(self, user_ids, parent, turnover, order):
+        self.user_ids = user_ids
+        self.parent = parent
+        self.turnover = turnover
+        self.order = order
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def load(cls, lock=False):
+        """
+        Build a snapshot from the database in a single query. With `lock` the rows stay locked for the rest of the
+        transaction, so no rollup can change a turnover the caller has read.
+        """
+        nodes = MLMTree.objects.order_by('child_id', 'id')
+        if lock:
+            nodes = nodes.select_for_update()
+        rows = {}
+        for child_id, parent_id, turnover in nodes.values_list('child_id', 'parent_id', 'turnover'):
+            rows[child_id] = (parent_id, turnover)
+
+        user_ids = array.array('q', sorted(rows))
+        index = {user_id: position for position, user_id in enumerate(user_ids)}
+        size = len(user_ids)
+        parent = array.array('q', [-1]) * size
+        turnover = array.array('q', [0]) * size
+        children = {}
+        for position, user_id in enumerate(user_ids):
+            parent_id, node_turnover = rows[user_id]
+            parent[position] = index.get(parent_id, -1)
+            turnover[position] = int((node_turnover or 0) * 100)
+            if parent[position] >= 0:
+                children.setdefault(parent[position], []).append(position)
+
+        order = array.array('q')
+        queue = deque(node for node in range(size) if parent[node] < 0)
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            queue.extend(children.get(node, ()))
+
+        return cls(user_ids, parent, turnover, order)
+
+    def index_of(self, user_id):
+        position = bisect.bisect_left(self.user_ids, user_id)
+        if position < len(self) and self.user_ids[position] == user_id:
+            return position
+        return -1
+
+    def subtree_sums(self, values):
+        """
+        Per node, the sum of `values` over its subtree, itself included, in one reverse pass over the parents-first
+        order.
+        """
+        totals = array.array('q', values)
+        for node in reversed(self.order):
+            if self.parent[node] >= 0:
+                totals[self.parent[node]] += totals[node]
+        return totals
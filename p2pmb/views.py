@@ -1,8 +1,7 @@
 import datetime
-from collections import deque
 from decimal import Decimal
 
-from django.db.models import Sum, Q, Max
+from django.db.models import Sum, Max
 from django.db.models.functions import TruncMonth
 from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
@@ -15,21 +14,22 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from agency.models import Investment, RewardEarned, InvestmentInterest
+from agency.models import Investment, InvestmentInterest
 from notification.models import InAppNotification
-from p2pmb.calculation import (RoyaltyClubDistribute, DistributeDirectCommission, DistributeLevelIncome,
-                               LifeTimeRewardIncome, ProcessMonthlyInterestP2PMB)
-from p2pmb.cron import distribute_level_income, distribute_direct_income
-from p2pmb.helpers import get_downline_count, count_all_descendants, get_levels_above_count, ExtraRewardFilter, \
-    PackagePagination
+from p2pmb.cron import distribute_level_income, distribute_direct_income, process_p2pmb_monthly_interest, \
+    process_direct_monthly_interest
+from p2pmb.helpers import get_levels_above_count, ExtraRewardFilter, \
+    PackagePagination, get_visible_upline
+from p2pmb.jobs import distribute_direct_income_for_investment, distribute_royalty_income, allocate_lifetime_rewards
 from p2pmb.models import MLMTree, Package, Commission, ExtraReward, CoreIncomeEarned, P2PMBRoyaltyMaster, RoyaltyEarned, \
-    ExtraRewardEarned, HoldLevelIncome, ROIOverride, LapsedAmount
+    HoldLevelIncome, ROIOverride, LapsedAmount, MLMTreeClosure, UserEarningsSummary
 from p2pmb.serializers import MLMTreeSerializer, MLMTreeNodeSerializer, PackageSerializer, CommissionSerializer, \
     ShowInvestmentDetail, GetP2PMBLevelData, GetMyApplyingData, MLMTreeNodeSerializerV2, MLMTreeParentNodeSerializerV2, \
     ExtraRewardSerializer, CoreIncomeEarnedSerializer, RoyaltyEarnedSerializer, P2PMBRoyaltyMasterSerializer, \
     CreateRoyaltyEarnedSerializer, TransactionSerializer, GetDirectUserSerializer, HoldLevelIncomeSerializer, \
     ROIOverRideSerializer, LapsedAmountSerializer, ROIOverrideListSerializer, InvestmentInterestSerializer
 from payment_app.models import Transaction, UserWallet, TDSSubmissionLog
+from web_admin.helpers import get_finance_totals
 
 
 # Create your views here.
@@ -128,8 +128,8 @@ class DiIncomeAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        distribute_direct_income()
-        return Response({'m': 'Done'})
+        job = distribute_direct_income.enqueue()
+        return Response({'m': 'Queued', 'job_id': job.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class GetParentLevelsView(APIView):
@@ -140,20 +140,7 @@ class GetParentLevelsView(APIView):
 
     def get_levels_above(self, user, max_levels=20):
         """ Retrieve up to 20 levels of parent users. """
-        current_user = user.parent
-        levels = []
-        level_count = 0
-
-        while level_count < max_levels and current_user:
-            parent = MLMTree.objects.filter(child=current_user, status='active', is_show=True).first()
-            if not parent or not parent.parent:
-                break
-
-            levels.append(parent)
-            current_user = parent.parent
-            level_count += 1
-
-        return levels
+        return get_visible_upline(user, max_levels)
 
     def get_users_below(self, user, max_levels=10):
         """
@@ -286,42 +273,10 @@ class CommissionViewSet(viewsets.ModelViewSet):
 
     def get_level_difference(self, from_user_id, to_user_id):
         """Find level difference between from_user and to_user. Tries downline first, then upline."""
-
-        # 1. Try Downline Traversal (BFS)
-        visited = set()
-        queue = deque([(from_user_id, 0)])  # (user_id, level)
-
-        while queue:
-            current_user_id, level = queue.popleft()
-            if current_user_id in visited:
-                continue
-            visited.add(current_user_id)
-
-            children = MLMTree.objects.filter(parent=current_user_id, status='active', is_show=True)
-            for entry in children:
-                child_id = entry.child.id
-                if child_id == to_user_id:
-                    return level + 1
-                queue.append((child_id, level + 1))
-
-        # 2. Try Upline Traversal (BFS)
-        visited = set()
-        queue = deque([(from_user_id, 0)])
-
-        while queue:
-            current_user_id, level = queue.popleft()
-            if current_user_id in visited:
-                continue
-            visited.add(current_user_id)
-
-            parents = MLMTree.objects.filter(child=current_user_id, status='active', is_show=True)
-            for entry in parents:
-                parent_id = entry.parent.id
-                if parent_id == to_user_id:
-                    return level + 1
-                queue.append((parent_id, level + 1))
-
-        return None
+        path = MLMTreeClosure.objects.filter(ancestor=from_user_id, descendant=to_user_id, depth__gte=1).first()
+        if not path:
+            path = MLMTreeClosure.objects.filter(ancestor=to_user_id, descendant=from_user_id, depth__gte=1).first()
+        return path.depth if path else None
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -434,12 +389,7 @@ class LapsedAmountViewSet(viewsets.ModelViewSet):
 
         earned_types = ['level_income', 'core_group_income', 'royalty']
 
-        queryset = self.get_queryset().filter(earned_type__in=earned_types)
-
-        if month:
-            queryset = queryset.filter(date_created__month=month)
-        if year:
-            queryset = queryset.filter(date_created__year=year)
+        totals = get_finance_totals('lapsed', int(month) if month else None, int(year) if year else None)
 
         response_data = {
             "month": month or "All",
@@ -447,8 +397,7 @@ class LapsedAmountViewSet(viewsets.ModelViewSet):
         }
 
         for etype in earned_types:
-            total = queryset.filter(earned_type=etype).aggregate(total_agreed=Sum('amount'))['total_agreed'] or 0
-            response_data[etype] = total
+            response_data[etype] = totals.get(etype) or 0
 
         return Response(response_data)
 
@@ -517,25 +466,9 @@ class DistributeLevelIncomeAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        distribute_level_income()
-        # investment_id = request.data.get('investment_id')
-        # investment_instance = Investment.objects.filter(
-        #     id=investment_id, status='active', is_approved=True, pay_method='main_wallet', investment_type='p2pmb',
-        #     send_level_income=False
-        # ).last()
-        # if investment_instance and investment_instance.user:
-        #     instance = MLMTree.objects.filter(status='active', child=investment_instance.user).last()
-        #     if instance:
-        #         amount = investment_instance.amount if investment_instance.amount else 0
-        #         DistributeLevelIncome.distribute_level_income(instance, amount)
-        #         investment_instance.send_level_income = True
-        #         investment_instance.save()
-        #         return Response({'message': 'Payment of Level Income Distribute successfully.'},
-        #                         status=status.HTTP_200_OK)
-        #     return Response({'message': 'This user is not enroll in MLM model.'},
-        #                     status=status.HTTP_400_BAD_REQUEST)
-        return Response({'message': 'This user is not invest any amount yet.'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        job = distribute_level_income.enqueue()
+        return Response({'message': 'Level income distribution queued.', 'job_id': job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class CommissionMessageAPIView(APIView):
@@ -565,11 +498,9 @@ class DistributeDirectIncome(APIView):
         if investment_instance and investment_instance.user:
             instance = MLMTree.objects.filter(status='active', child=investment_instance.user).last()
             if instance:
-                DistributeDirectCommission.distribute_p2pmb_commission(instance, investment_instance.amount)
-                investment_instance.send_direct_income = True
-                investment_instance.save()
-                return Response({'message': 'Payment of Direct Income Distribute successfully.'},
-                                status=status.HTTP_200_OK)
+                job = distribute_direct_income_for_investment.enqueue(investment_id=investment_instance.id)
+                return Response({'message': 'Payment of Direct Income queued.', 'job_id': job.id},
+                                status=status.HTTP_202_ACCEPTED)
             return Response({'message': 'This user is not enroll in MLM model.'},
                             status=status.HTTP_400_BAD_REQUEST)
         return Response({'message': 'This user is not invest any amount.'},
@@ -585,8 +516,8 @@ class LifeTimeRewardIncomeAPIView(APIView):
     def post(self, request):
         # calculate_lifetime_reward_income_task()
         # process_monthly_reward_payments()
-        LifeTimeRewardIncome.check_and_allocate_rewards()
-        return Response({"message": "successful earned life time Income"})
+        job = allocate_lifetime_rewards.enqueue()
+        return Response({"message": "Life time income queued.", "job_id": job.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class MonthlyDistributeDirectIncome(APIView):
@@ -596,8 +527,8 @@ class MonthlyDistributeDirectIncome(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        DistributeDirectCommission.cron_send_monthly_payment_direct_income()
-        return Response({"message": "successful send Income"})
+        job = process_direct_monthly_interest.enqueue()
+        return Response({"message": "Monthly income queued.", "job_id": job.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class RoyaltyIncome(APIView):
@@ -607,8 +538,9 @@ class RoyaltyIncome(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        RoyaltyClubDistribute.distribute_royalty()
-        return Response({"message": "Royalty income distribute successfully."})
+        job = distribute_royalty_income.enqueue()
+        return Response({"message": "Royalty income distribution queued.", "job_id": job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class SendMonthlyInterestIncome(APIView):
@@ -618,8 +550,9 @@ class SendMonthlyInterestIncome(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        ProcessMonthlyInterestP2PMB.generate_interest_for_all_investments()
-        return Response({"message": "Monthly Interest distribute successfully."})
+        job = process_p2pmb_monthly_interest.enqueue()
+        return Response({"message": "Monthly Interest distribution queued.", "job_id": job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class GetAllPayout(ListAPIView):
@@ -702,7 +635,7 @@ class GetParentLevelCountView(APIView):
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
         upper_count = get_levels_above_count(user)
-        lower_count = count_all_descendants(user.child)
+        lower_count = user.descendant_count
 
         return Response({
             "upper_count": upper_count,
@@ -742,52 +675,11 @@ class MyIdValueAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        total_invested_amount = Investment.objects.filter(status='active', user=self.request.user,
-                                                          package__isnull=False, investment_type='p2pmb').aggregate(
-            total=Sum('amount'))['total'] or Decimal(0)
-        check_working_id = MLMTree.objects.filter(referral_by=self.request.user).count()
-        if check_working_id and check_working_id >= 2:
-            is_working_id = True
-            total_return_amount = total_invested_amount * Decimal('4.4')
-        else:
-            is_working_id = False
-            total_return_amount = total_invested_amount * Decimal('2.1')
-
-        total_commission_earned = (
-                Commission.objects.filter(status="active", commission_to=request.user,
-                                          commission_type__in=['direct', 'level'])
-                .aggregate(total_amount=Sum("amount"))["total_amount"] or Decimal(0)
-        )
-
-        roi_earned = (
-                InvestmentInterest.objects.filter(status="active", investment__user=request.user)
-                .aggregate(total_amount=Sum("interest_amount"))["total_amount"] or Decimal(0)
-        )
-
-        royalty_earned = (
-                RoyaltyEarned.objects.filter(status="active", user=request.user)
-                .aggregate(total_amount=Sum("earned_amount"))["total_amount"] or Decimal(0)
-        )
-
-        reward_earned = (
-                RewardEarned.objects.filter(status="active", user=request.user)
-                .aggregate(total_amount=Sum("reward__gift_amount"))["total_amount"] or Decimal(0)
-        )
-
-        core_group_income = (
-                CoreIncomeEarned.objects.filter(status="active", user=request.user)
-                .aggregate(total=Sum("income_earned"))["total"] or Decimal(0)
-        )
-
-        extra_income = (
-                ExtraRewardEarned.objects.filter(status="active", user=request.user)
-                .aggregate(total=Sum("amount"))["total"] or Decimal(0)
-        )
-
-        total_income_earned = (
-                total_commission_earned + roi_earned + royalty_earned +
-                reward_earned + core_group_income + extra_income
-        )
+        summary = UserEarningsSummary.for_user(request.user.id)
+        total_invested_amount = summary.invested_amount
+        is_working_id = MLMTree.objects.filter(child=self.request.user, is_working_id=True).exists()
+        total_return_amount = summary.id_value_cap
+        total_income_earned = summary.id_value_income
 
         current_due_value = total_return_amount - total_income_earned
         twenty_percentage_of_value = total_return_amount * Decimal(0.20)
@@ -815,69 +707,27 @@ class GetAppDashboardAggregate(APIView):
         user = request.user
         mlm_user_entry = MLMTree.objects.filter(is_show=True, child=user).last()
         referrals = MLMTree.objects.filter(is_show=True, referral_by=user).count()
-        total_team_count = get_downline_count(user)
-        investments = Investment.objects.filter(
-            status='active', package__isnull=False, investment_type='p2pmb', user=user
-        )
-        latest_investment = investments.aggregate(total=Sum('amount'))['total'] or Decimal(0)
-        latest_amount = latest_investment if latest_investment else Decimal('0.0')
-        total_return_amount = latest_amount * Decimal('4.4' if referrals >= 2 else '2.1')
-
-        commission_agg = Commission.objects.filter(status='active', commission_to=user).aggregate(
-            total=Sum('amount'),
-            level_total=Sum('amount', filter=Q(commission_type='level')),
-            direct_total=Sum('amount', filter=Q(commission_type='direct'))
-        )
-        commission_amount = commission_agg['total'] or 0
-        level_income = commission_agg['level_total'] or 0
-        direct_income = commission_agg['direct_total'] or 0
-
-        earned_reward = RewardEarned.objects.filter(
-            status='active', user=user, reward__applicable_for='p2pmb'
-        ).aggregate(total=Sum('reward__gift_amount'))['total'] or 0
-
-        roi_interest = InvestmentInterest.objects.filter(
-            status='active', investment__user=user
-        ).aggregate(total=Sum('interest_amount'))['total'] or 0
-
-        royalty_earned = RoyaltyEarned.objects.filter(
-            status='active', is_paid=True, user=user
-        ).aggregate(total=Sum('earned_amount'))['total'] or 0
-
-        core_group_income = CoreIncomeEarned.objects.filter(
-            status='active', user=user
-        ).aggregate(total=Sum('income_earned'))['total'] or 0
+        total_team_count = mlm_user_entry.visible_descendant_count if mlm_user_entry else 0
+        summary = UserEarningsSummary.for_user(user.id)
 
-        extra_income = ExtraRewardEarned.objects.filter(
-            status='active', user=user
-        ).aggregate(total=Sum('amount'))['total'] or 0
-
-        total_roi_interest = InvestmentInterest.objects.filter(
-            status='active', investment__user=user
-        ).aggregate(total=Sum('interest_amount'))['total'] or 0
-
-        upper_count = get_levels_above_count(mlm_user_entry)
-        lower_count = count_all_descendants(mlm_user_entry.child)
+        upper_count = get_levels_above_count(mlm_user_entry) if mlm_user_entry else 0
+        lower_count = mlm_user_entry.descendant_count if mlm_user_entry else 0
         team_level_count = upper_count + lower_count
 
-        total_earning = (
-            commission_amount + earned_reward + roi_interest + royalty_earned + core_group_income + extra_income
-        )
-
         data = {
             'total_team_member': total_team_count,
-            'total_earning': total_earning,
-            'total_id_value': total_return_amount,
+            'total_earning': summary.total_earning,
+            'total_id_value': summary.id_value_cap,
             'total_direct_user_count': referrals,
             'team_level_count': team_level_count,
-            'direct_income': direct_income,
-            'level_income': level_income,
-            'royalty_income': royalty_earned,
-            'reward_income': earned_reward,
-            'extra_reward_income': extra_income,
-            'core_group_income': core_group_income,
-            'total_top_up_count': investments.count(),
-            'roi_income': total_roi_interest
+            'direct_income': summary.direct_income,
+            'level_income': summary.level_income,
+            'royalty_income': summary.royalty_income,
+            'reward_income': summary.reward_income,
+            'extra_reward_income': summary.extra_reward_income,
+            'core_group_income': summary.core_group_income,
+            'total_top_up_count': summary.top_up_count,
+            'roi_income': summary.roi_income
         }
         return Response(data, status=status.HTTP_200_OK)
 
@@ -2,6 +2,7 @@ from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 
 from accounts.admin import CustomModelAdminMixin
+from payment_app.helpers import post_wallet
 from payment_app.resources import *
 
 
@@ -15,6 +16,45 @@ class ProfileAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     raw_id_fields = ('created_by', 'updated_by', 'user')
     list_filter = ('status', )
 
+    def save_model(self, request, obj, form, change):
+        # Balance edits are posted to the ledger as adjustments instead of being written over the columns.
+        initial = form.initial if change else {}
+        changes = {field: form.cleaned_data[field] - (initial.get(field) or 0)
+                   for field in UserWallet.BALANCE_FIELDS if field in form.cleaned_data}
+        if not change:
+            for field in changes:
+                setattr(obj, field, 0)
+        super().save_model(request, obj, form, change)
+        post_wallet(obj, changes, 'adjustment', remarks=f'Admin edit by {request.user}')
+
+
+@admin.register(WalletLedgerEntry)
+class WalletLedgerEntryAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = WalletLedgerEntryResource
+    raw_id_fields = ('wallet',)
+    list_filter = ('bucket', 'source_type')
+
+    def has_import_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WalletBalanceSnapshot)
+class WalletBalanceSnapshotAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = WalletBalanceSnapshotResource
+    raw_id_fields = ('wallet',)
+
+    def has_import_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Transaction)
 class TransactionAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
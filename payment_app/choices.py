@@ -28,4 +28,20 @@ PAYMENT_METHOD = [
     ('wallet', 'Wallet'),
     ('bank_transfer', 'Bank transfer'),
     ('cheque', 'Cheque'),
-]
\ No newline at end of file
+]
+
+
+WALLET_BUCKET_CHOICES = [
+    ('main_wallet_balance', 'Main Wallet'),
+    ('app_wallet_balance', 'App Wallet'),
+    ('p2pmb_royalty_income', 'P2PMB Royalty Income'),
+    ('tds_amount', 'TDS Amount'),
+    ('admin_amount', 'Admin Amount'),
+]
+
+LEDGER_SOURCE_CHOICES = TRANSACTION_TYPE_CHOICES + [
+    ('property', 'Property Purchase'),
+    ('package', 'Package Purchase'),
+    ('tds', 'TDS Submission'),
+    ('adjustment', 'Admin Adjustment'),
+]
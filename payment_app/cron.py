@@ -0,0 +1,18 @@
+import datetime
+
+from master.helpers import job_lease
+from payment_app.helpers import snapshot_wallet_balances as write_wallet_snapshots, find_wallet_drift
+
+
+@job_lease(ttl=datetime.timedelta(hours=1))
+def snapshot_wallet_balances():
+    """
+    Fold the wallet ledger into balance snapshots and report wallets whose balance no longer matches it.
+    """
+    print("🚀 Starting Wallet Balance Snapshot...")
+    written = write_wallet_snapshots()
+    print(f"✅ {written} wallet balance snapshots written.")
+    drift = find_wallet_drift()
+    if drift:
+        print(f"🔴 {len(drift)} wallet balances differ from the ledger: {drift[:20]}")
+    print("🔄 Wallet Balance Snapshot finished.")
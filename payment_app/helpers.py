@@ -0,0 +1,268 @@
+"""
+Posting API of the wallet ledger.
+
+Every change to a UserWallet balance goes through post_to_wallets: the change is appended to WalletLedgerEntry and
+applied with an F() increment in the same transaction, so concurrent writers never overwrite each other's
+balances. snapshot_wallet_balances periodically folds the ledger into WalletBalanceSnapshot rows; a balance can
+then be rebuilt from the latest snapshot plus the entries after it and checked against the wallet columns.
+
+User initiated money moves (pay-money, app to main wallet, withdrawals, PPD deposits) go through transfer_funds,
+which also writes the Transaction, retries deadlocks and honours the client's idempotency key.
+"""
+import datetime
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction, IntegrityError, OperationalError
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from payment_app.models import UserWallet, WalletLedgerEntry, WalletBalanceSnapshot, Transaction
+
+# Entries younger than this may still belong to an open transaction, so snapshots stop before them.
+SNAPSHOT_LAG = datetime.timedelta(minutes=10)
+BATCH_SIZE = 1000
+TRANSFER_ATTEMPTS = 5
+TRANSFER_BACKOFF = 0.02
+# MySQL lock wait timeout and deadlock, PostgreSQL serialization failure and deadlock.
+RETRYABLE_ERROR_CODES = {1205, 1213, '40001', '40P01'}
+
+
+class InsufficientBalance(Exception):
+    """
+    A checked posting would take a wallet bucket below zero; nothing of the posting was written.
+    """
+
+
+def _group_entries(entries):
+    """
+    Round (wallet_id, bucket, amount) entries to the paisa, dropping zeros. Returns the rounded entries and the
+    net {wallet_id: {bucket: amount}}.
+    """
+    rounded, changes = [], {}
+    for wallet_id, bucket, amount in entries:
+        amount = Decimal(str(amount or 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        if not amount:
+            continue
+        buckets = changes.setdefault(wallet_id, {})
+        buckets[bucket] = buckets.get(bucket, Decimal('0')) + amount
+        rounded.append((wallet_id, bucket, amount))
+    return rounded, changes
+
+
+def post_to_wallets(entries, source_type, source_id=None, remarks=None, check_funds=False):
+    """
+    Post signed (wallet_id, bucket, amount) entries as one unit. Amounts are rounded to the paisa, each wallet
+    gets a single UPDATE of all its buckets, taken in wallet id order so concurrent postings lock rows in the same
+    order, and the ledger rows are appended afterwards. With check_funds every debited bucket must stay
+    non-negative, otherwise InsufficientBalance is raised and the posting is rolled back.
+    """
+    entries, changes = _group_entries(entries)
+    rows = [
+        WalletLedgerEntry(wallet_id=wallet_id, bucket=bucket, amount=amount, source_type=source_type,
+                          source_id=source_id, remarks=remarks[:255] if remarks else remarks)
+        for wallet_id, bucket, amount in entries
+    ]
+    if not rows:
+        return []
+
+    with transaction.atomic():
+        for wallet_id in sorted(changes):
+            buckets = {bucket: amount for bucket, amount in changes[wallet_id].items() if amount}
+            wallets = UserWallet.objects.filter(id=wallet_id)
+            if check_funds:
+                wallets = wallets.filter(**{
+                    f'{bucket}__gte': -amount for bucket, amount in buckets.items() if amount < 0})
+            updated = wallets.update(**{bucket: F(bucket) + amount for bucket, amount in buckets.items()})
+            if check_funds and not updated:
+                raise InsufficientBalance(f'Insufficient balance in wallet {wallet_id}.')
+        WalletLedgerEntry.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return rows
+
+
+def post_wallet(wallet, changes, source_type, source_id=None, remarks=None, check_funds=False):
+    """
+    Post {bucket: signed amount} to a single wallet and reload the changed buckets on the instance.
+    """
+    post_to_wallets([(wallet.id, bucket, amount) for bucket, amount in changes.items()], source_type,
+                    source_id=source_id, remarks=remarks, check_funds=check_funds)
+    wallet.refresh_from_db(fields=list(changes))
+
+
+def idempotency_key_from(request):
+    """
+    Client supplied idempotency key of a money moving request, from the Idempotency-Key header or the body.
+    """
+    key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+    return str(key)[:64] if key else None
+
+
+def transfer_funds(entries, transaction_fields, idempotency_key=None, on_posted=None, attempts=TRANSFER_ATTEMPTS):
+    """
+    Move money as one short transaction: lock every wallet in `entries` with select_for_update in primary key order,
+    refuse with InsufficientBalance if a debited bucket would go below zero, create the Transaction from
+    `transaction_fields` and post the entries against it. `on_posted(transaction)` runs inside the same transaction
+    for rows that belong to the move, such as a FundWithdrawal.
+
+    Deadlocks and serialization failures are retried with jittered backoff; when called inside an outer atomic
+    block the caller owns the transaction and nothing is retried. A repeated idempotency_key from the same sender
+    returns the Transaction of the first call without posting again. Returns (transaction, created).
+    """
+    sender = transaction_fields.get('sender')
+    if idempotency_key:
+        existing = Transaction.objects.filter(sender=sender, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    if transaction.get_connection().in_atomic_block:
+        attempts = 1
+
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                return _transfer(entries, transaction_fields, idempotency_key, on_posted), True
+        except IntegrityError:
+            # A concurrent request with the same key committed first.
+            existing = idempotency_key and Transaction.objects.filter(
+                sender=sender, idempotency_key=idempotency_key).first()
+            if not existing:
+                raise
+            return existing, False
+        except OperationalError as error:
+            if attempt == attempts or not _is_retryable(error):
+                raise
+            time.sleep(TRANSFER_BACKOFF * 2 ** (attempt - 1) * (1 + random.random()))
+
+
+def _transfer(entries, transaction_fields, idempotency_key, on_posted):
+    entries, changes = _group_entries(entries)
+    # Without row locks (SQLite) a read would have to be upgraded to a write lock, which fails instead of waiting;
+    # the checked UPDATE of post_to_wallets is the first write there and guards the debits on its own.
+    if transaction.get_connection().features.has_select_for_update:
+        _lock_and_check(changes)
+
+    record = Transaction.objects.create(idempotency_key=idempotency_key, **transaction_fields)
+    post_to_wallets(entries, record.transaction_type, source_id=record.id, remarks=record.remarks, check_funds=True)
+    if on_posted:
+        on_posted(record)
+    return record
+
+
+def _lock_and_check(changes):
+    locked = {
+        row[0]: dict(zip(UserWallet.BALANCE_FIELDS, row[1:]))
+        for row in UserWallet.objects.select_for_update().filter(id__in=changes).order_by('id').values_list(
+            'id', *UserWallet.BALANCE_FIELDS)
+    }
+    for wallet_id, buckets in changes.items():
+        if wallet_id not in locked:
+            raise UserWallet.DoesNotExist(f'Wallet {wallet_id} does not exist.')
+        for bucket, amount in buckets.items():
+            if amount < 0 and locked[wallet_id][bucket] + amount < 0:
+                raise InsufficientBalance(f'Insufficient {bucket} in wallet {wallet_id}.')
+
+
+def _is_retryable(error):
+    cause = error.__cause__
+    code = getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None) or next(iter(getattr(
+        cause, 'args', ())), None)
+    return code in RETRYABLE_ERROR_CODES or 'database is locked' in str(error)
+
+
+def _latest_snapshots(wallet_ids):
+    latest = WalletBalanceSnapshot.objects.filter(wallet=OuterRef('wallet')).order_by('-last_entry_id', '-id')
+    return {
+        snapshot.wallet_id: snapshot for snapshot in
+        WalletBalanceSnapshot.objects.filter(wallet_id__in=wallet_ids, id=Subquery(latest.values('id')[:1]))
+    }
+
+
+def _ledger_tail(wallet_ids, up_to=None):
+    """
+    {wallet_id: {bucket: sum}} of the entries after each wallet's latest snapshot, up to entry id `up_to`.
+    """
+    last_entry_id = WalletBalanceSnapshot.objects.filter(wallet=OuterRef('wallet')).order_by(
+        '-last_entry_id', '-id').values('last_entry_id')[:1]
+    entries = WalletLedgerEntry.objects.filter(wallet_id__in=wallet_ids).annotate(
+        snapshot_entry_id=Coalesce(Subquery(last_entry_id), Value(0))
+    ).filter(id__gt=F('snapshot_entry_id'))
+    if up_to is not None:
+        entries = entries.filter(id__lte=up_to)
+    tail = {}
+    for wallet_id, bucket, total in entries.values('wallet_id', 'bucket').annotate(
+            total=Sum('amount')).values_list('wallet_id', 'bucket', 'total'):
+        tail.setdefault(wallet_id, {})[bucket] = total
+    return tail
+
+
+def get_wallet_balances(wallet_ids):
+    """
+    Rebuild {wallet_id: {bucket: balance}} from the latest snapshot plus the ledger entries after it. Wallets with
+    neither start from zero.
+    """
+    wallet_ids = list(wallet_ids)
+    balances = {}
+    for index in range(0, len(wallet_ids), BATCH_SIZE):
+        batch = wallet_ids[index:index + BATCH_SIZE]
+        snapshots = _latest_snapshots(batch)
+        tail = _ledger_tail(batch)
+        for wallet_id in batch:
+            snapshot = snapshots.get(wallet_id)
+            balances[wallet_id] = {
+                bucket: (getattr(snapshot, bucket) if snapshot else Decimal('0')) +
+                        tail.get(wallet_id, {}).get(bucket, Decimal('0'))
+                for bucket in UserWallet.BALANCE_FIELDS
+            }
+    return balances
+
+
+def snapshot_wallet_balances(lag=SNAPSHOT_LAG):
+    """
+    Write a new snapshot for every wallet with ledger entries since its last one, covering entries older than
+    `lag` only. Returns the number of snapshots written.
+    """
+    up_to = WalletLedgerEntry.objects.filter(
+        date_created__lt=datetime.datetime.now() - lag).aggregate(last=Max('id'))['last']
+    if up_to is None:
+        return 0
+
+    covered = WalletBalanceSnapshot.objects.aggregate(last=Max('last_entry_id'))['last'] or 0
+    wallet_ids = list(WalletLedgerEntry.objects.filter(id__gt=covered, id__lte=up_to).values_list(
+        'wallet_id', flat=True).distinct().order_by('wallet_id'))
+    written = 0
+    for index in range(0, len(wallet_ids), BATCH_SIZE):
+        batch = wallet_ids[index:index + BATCH_SIZE]
+        tail = _ledger_tail(batch, up_to=up_to)
+        if not tail:
+            continue
+        snapshots = _latest_snapshots(tail.keys())
+        WalletBalanceSnapshot.objects.bulk_create([
+            WalletBalanceSnapshot(wallet_id=wallet_id, last_entry_id=up_to, **{
+                bucket: (getattr(snapshots[wallet_id], bucket) if wallet_id in snapshots else Decimal('0')) +
+                        buckets.get(bucket, Decimal('0'))
+                for bucket in UserWallet.BALANCE_FIELDS
+            })
+            for wallet_id, buckets in tail.items()
+        ])
+        written += len(tail)
+    return written
+
+
+def find_wallet_drift(wallet_ids=None):
+    """
+    Compare the rebuilt balances with the UserWallet columns, [(wallet_id, bucket, ledger, wallet)] for every
+    mismatch. Wallets posted to while the check runs can show a transient difference.
+    """
+    queryset = UserWallet.objects.order_by('id')
+    if wallet_ids is not None:
+        queryset = queryset.filter(id__in=wallet_ids)
+    wallets = list(queryset.values_list('id', *UserWallet.BALANCE_FIELDS))
+    drift = []
+    for index in range(0, len(wallets), BATCH_SIZE):
+        batch = wallets[index:index + BATCH_SIZE]
+        balances = get_wallet_balances([row[0] for row in batch])
+        for wallet_id, *columns in batch:
+            for bucket, actual in zip(UserWallet.BALANCE_FIELDS, columns):
+                if balances[wallet_id][bucket] != actual:
+                    drift.append((wallet_id, bucket, balances[wallet_id][bucket], actual))
+    return drift
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from payment_app.helpers import snapshot_wallet_balances, find_wallet_drift
+
+
+class Command(BaseCommand):
+    help = 'Fold the wallet ledger into balance snapshots and optionally check the wallets against it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Also rebuild every balance from the ledger and report mismatches.')
+
+    def handle(self, *args, **options):
+        written = snapshot_wallet_balances()
+        self.stdout.write(self.style.SUCCESS(f'{written} wallet balance snapshots written.'))
+        if not options['verify']:
+            return
+
+        drift = find_wallet_drift()
+        for wallet_id, bucket, ledger, wallet in drift:
+            self.stdout.write(f'Wallet {wallet_id} {bucket}: ledger {ledger}, wallet {wallet}')
+        style = self.style.WARNING if drift else self.style.SUCCESS
+        self.stdout.write(style(f'{len(drift)} wallet balances differ from the ledger.'))
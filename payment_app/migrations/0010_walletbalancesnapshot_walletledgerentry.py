@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment_app', '0009_tdssubmissionlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.PositiveBigIntegerField(default=0)),
+                ('main_wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('app_wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('p2pmb_royalty_income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('tds_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('admin_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='payment_app.userwallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'last_entry_id'], name='wallet_snapshot_latest_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('main_wallet_balance', 'Main Wallet'), ('app_wallet_balance', 'App Wallet'), ('p2pmb_royalty_income', 'P2PMB Royalty Income'), ('tds_amount', 'TDS Amount'), ('admin_amount', 'Admin Amount')], max_length=30)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('source_type', models.CharField(choices=[('investment', 'Investment'), ('deposit', 'Deposit'), ('deduct', 'Deduct'), ('withdraw', 'Withdraw'), ('send', 'Send'), ('receive', 'Receive'), ('transfer', 'Transfer'), ('reward', 'Reward'), ('commission', 'Commission'), ('refund', 'Refund'), ('rent', 'Rent'), ('interest', 'Interest'), ('property', 'Property Purchase'), ('package', 'Package Purchase'), ('tds', 'TDS Submission'), ('adjustment', 'Admin Adjustment')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('remarks', models.CharField(blank=True, max_length=255, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='payment_app.userwallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'id'], name='wallet_ledger_tail_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+BALANCE_FIELDS = ('main_wallet_balance', 'app_wallet_balance', 'p2pmb_royalty_income', 'tds_amount', 'admin_amount')
+
+
+def create_opening_snapshots(apps, schema_editor):
+    """
+    Record the balances held before the ledger existed as each wallet's first snapshot, at entry 0.
+    """
+    UserWallet = apps.get_model('payment_app', 'UserWallet')
+    WalletBalanceSnapshot = apps.get_model('payment_app', 'WalletBalanceSnapshot')
+    WalletBalanceSnapshot.objects.bulk_create(
+        (WalletBalanceSnapshot(wallet_id=row[0], last_entry_id=0, **dict(zip(BALANCE_FIELDS, row[1:])))
+         for row in UserWallet.objects.values_list('id', *BALANCE_FIELDS).iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment_app', '0010_walletbalancesnapshot_walletledgerentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_opening_snapshots, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,8 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 
-from payment_app.choices import TRANSACTION_TYPE_CHOICES, TRANSACTION_STATUS_CHOICES, PAYMENT_METHOD
+from payment_app.choices import TRANSACTION_TYPE_CHOICES, TRANSACTION_STATUS_CHOICES, PAYMENT_METHOD, \
+    WALLET_BUCKET_CHOICES, LEDGER_SOURCE_CHOICES
 from real_estate.model_mixin import ModelMixin
 
 
@@ -16,9 +17,47 @@ class UserWallet(ModelMixin):
     tds_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     admin_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    # Balances only change through payment_app.helpers.post_to_wallets, which records each change in the
+    # WalletLedgerEntry table. A plain save() never writes them back and refuses a changed one.
+    BALANCE_FIELDS = ('main_wallet_balance', 'app_wallet_balance', 'p2pmb_royalty_income', 'tds_amount', 'admin_amount')
+
     def __str__(self):
         return f"Wallet for {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        deferred = instance.get_deferred_fields()
+        instance._loaded_balances = {
+            field: getattr(instance, field) for field in cls.BALANCE_FIELDS if field not in deferred
+        }
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields') or self.BALANCE_FIELDS
+        deferred = self.get_deferred_fields()
+        self._loaded_balances = {
+            **getattr(self, '_loaded_balances', {}),
+            **{field: getattr(self, field) for field in fields if field in self.BALANCE_FIELDS and field not in deferred}
+        }
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            changed = [
+                field for field, value in getattr(self, '_loaded_balances', {}).items()
+                if getattr(self, field) != value
+            ]
+            if changed:
+                raise ValueError(
+                    f"UserWallet {', '.join(changed)} only change through payment_app.helpers.post_to_wallets, "
+                    f"which records them in the wallet ledger.")
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BALANCE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     # Method to deposit amount into the wallet
     def deposit(self, amount):
         self.balance += amount
@@ -48,18 +87,17 @@ class UserWallet(ModelMixin):
             return self.app_wallet_balance >= amount
         return False
 
-    def deduct_balance(self, amount, wallet_type):
-        if self.has_sufficient_balance(amount, wallet_type):
-            if wallet_type == 'main_wallet':
-                self.main_wallet_balance -= Decimal(str(amount))
-                self.save()
-                return True
-            elif wallet_type == 'app_wallet':
-                self.app_wallet_balance -= Decimal(str(amount))
-                self.save()
-                return True
+    def deduct_balance(self, amount, wallet_type, source_type='package'):
+        from payment_app.helpers import post_wallet, InsufficientBalance
+
+        bucket = {'main_wallet': 'main_wallet_balance', 'app_wallet': 'app_wallet_balance'}.get(wallet_type)
+        if not bucket:
             return False
-        return False
+        try:
+            post_wallet(self, {bucket: -Decimal(str(amount))}, source_type, check_funds=True)
+        except InsufficientBalance:
+            return False
+        return True
 
 
 class TDSSubmissionLog(ModelMixin):
@@ -97,6 +135,60 @@ class Transaction(ModelMixin):
     verified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
                                     related_name='verified_transactions')
     verified_on = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'idempotency_key'], name='unique_sender_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type} for {self.amount}"
+
+
+class WalletLedgerEntry(models.Model):
+    """
+    Append-only record of every change to a UserWallet balance bucket. A balance is the wallet's latest
+    WalletBalanceSnapshot plus the entries after it.
+    """
+    wallet = models.ForeignKey(UserWallet, on_delete=models.CASCADE, related_name='ledger_entries')
+    bucket = models.CharField(max_length=30, choices=WALLET_BUCKET_CHOICES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    source_type = models.CharField(max_length=20, choices=LEDGER_SOURCE_CHOICES)
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
+    remarks = models.CharField(max_length=255, null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['wallet', 'id'], name='wallet_ledger_tail_idx')]
+
+    def __str__(self):
+        return f"{self.bucket} {self.amount} on wallet {self.wallet_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Wallet ledger entries are append-only.')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Wallet ledger entries are append-only.')
+
+
+class WalletBalanceSnapshot(models.Model):
+    """
+    Balances of a wallet including every ledger entry up to last_entry_id.
+    """
+    wallet = models.ForeignKey(UserWallet, on_delete=models.CASCADE, related_name='balance_snapshots')
+    last_entry_id = models.PositiveBigIntegerField(default=0)
+    main_wallet_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    app_wallet_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    p2pmb_royalty_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    tds_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    admin_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['wallet', 'last_entry_id'], name='wallet_snapshot_latest_idx')]
 
     def __str__(self):
-        return f"{self.transaction_type} for {self.amount}"
\ No newline at end of file
+        return f"Wallet {self.wallet_id} at entry {self.last_entry_id}"
@@ -22,4 +22,13 @@ class TDSSubmissionLogResource(resources.ModelResource):
     class Meta:
         model = TDSSubmissionLog
         import_id_fields = ('created_by', 'updated_by', 'submitted_for', 'submitted_by')
-        exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
\ No newline at end of file
+        exclude = ('date_created', 'updated_by', 'date_updated', 'created_by')
+
+class WalletLedgerEntryResource(resources.ModelResource):
+    class Meta:
+        model = WalletLedgerEntry
+
+
+class WalletBalanceSnapshotResource(resources.ModelResource):
+    class Meta:
+        model = WalletBalanceSnapshot
@@ -1,3 +1,153 @@
-from django.test import TestCase
+import datetime
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+
+from payment_app.helpers import post_to_wallets, post_wallet, InsufficientBalance, snapshot_wallet_balances, \
+    get_wallet_balances, find_wallet_drift, transfer_funds
+from payment_app.models import UserWallet, WalletLedgerEntry, Transaction
+
+
+def run_in_threads(count, target):
+    errors = []
+
+    def worker(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class WalletSaveTest(TestCase):
+
+    def test_save_refuses_balance_writes(self):
+        wallet = UserWallet.objects.create(user=User.objects.create(username='save-user'))
+        post_wallet(wallet, {'app_wallet_balance': Decimal('100')}, 'deposit')
+        wallet.status = 'inactive'
+        wallet.save()
+        wallet.app_wallet_balance += Decimal('50')
+        with self.assertRaises(ValueError):
+            wallet.save()
+
+        wallet = UserWallet.objects.get(id=wallet.id)
+        self.assertEqual((wallet.status, wallet.app_wallet_balance), ('inactive', Decimal('100')))
+        self.assertFalse(find_wallet_drift())
+
+
+class WalletLedgerConcurrencyTest(TransactionTestCase):
+    THREADS = 8
+    POSTINGS = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Parallel writers need a database file or a server backed database.')
+        self.wallets = [
+            UserWallet.objects.create(user=User.objects.create(username=f'ledger-user-{index}'))
+            for index in range(2)
+        ]
+
+    def test_parallel_postings_lose_no_updates(self):
+        first, second = self.wallets
+
+        def post(index):
+            for _ in range(self.POSTINGS):
+                # Opposite wallet orders on alternating threads, the posting API must still lock them consistently.
+                pair = [(first.id, 'app_wallet_balance', Decimal('1.25')),
+                        (second.id, 'main_wallet_balance', Decimal('-0.50'))]
+                post_to_wallets(pair if index % 2 else pair[::-1], 'adjustment', remarks=f'thread {index}')
+
+        self.assertEqual(run_in_threads(self.THREADS, post), [])
+
+        total = self.THREADS * self.POSTINGS
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.app_wallet_balance, Decimal('1.25') * total)
+        self.assertEqual(second.main_wallet_balance, Decimal('-0.50') * total)
+        self.assertEqual(WalletLedgerEntry.objects.count(), total * 2)
+        self.assertEqual(find_wallet_drift(), [])
+
+    def test_checked_debits_never_overdraw(self):
+        wallet = self.wallets[0]
+        post_wallet(wallet, {'main_wallet_balance': Decimal('10.00')}, 'deposit')
+        paid = []
+
+        def debit(index):
+            try:
+                post_wallet(UserWallet.objects.get(id=wallet.id), {'main_wallet_balance': Decimal('-1.00')},
+                            'withdraw', check_funds=True)
+                paid.append(index)
+            except InsufficientBalance:
+                pass
+
+        self.assertEqual(run_in_threads(16, debit), [])
+
+        wallet.refresh_from_db()
+        self.assertEqual(len(paid), 10)
+        self.assertEqual(wallet.main_wallet_balance, Decimal('0.00'))
+        self.assertEqual(find_wallet_drift(), [])
+
+    def test_balance_rebuilds_from_snapshot_and_tail(self):
+        wallet = self.wallets[0]
+        post_wallet(wallet, {'app_wallet_balance': Decimal('100.00'), 'tds_amount': Decimal('5.00')}, 'commission')
+        self.assertEqual(snapshot_wallet_balances(lag=datetime.timedelta(seconds=-1)), 1)
+        post_wallet(wallet, {'app_wallet_balance': Decimal('-40.00')}, 'transfer')
+
+        balances = get_wallet_balances([wallet.id])[wallet.id]
+        self.assertEqual(balances['app_wallet_balance'], Decimal('60.00'))
+        self.assertEqual(balances['tds_amount'], Decimal('5.00'))
+        self.assertEqual(find_wallet_drift(), [])
+
+    def test_opposite_transfers_neither_deadlock_nor_overdraw(self):
+        first, second = self.wallets
+        post_to_wallets([(first.id, 'main_wallet_balance', 50), (second.id, 'main_wallet_balance', 50)], 'deposit')
+        refused = []
+
+        def send(index):
+            sender, receiver = (first, second) if index % 2 else (second, first)
+            for _ in range(self.POSTINGS):
+                try:
+                    transfer_funds([(sender.id, 'main_wallet_balance', Decimal('-7.00')),
+                                    (receiver.id, 'main_wallet_balance', Decimal('7.00'))],
+                                   {'sender': sender.user, 'receiver': receiver.user, 'amount': Decimal('7.00'),
+                                    'transaction_type': 'send', 'transaction_status': 'approved'})
+                except InsufficientBalance:
+                    refused.append(index)
+
+        self.assertEqual(run_in_threads(self.THREADS, send), [])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.main_wallet_balance + second.main_wallet_balance, Decimal('100.00'))
+        self.assertGreaterEqual(min(first.main_wallet_balance, second.main_wallet_balance), 0)
+        self.assertEqual(Transaction.objects.count(), self.THREADS * self.POSTINGS - len(refused))
+        self.assertEqual(find_wallet_drift(), [])
+
+    def test_repeated_idempotency_key_posts_once(self):
+        first, second = self.wallets
+        post_wallet(first, {'app_wallet_balance': 20}, 'deposit')
+        results = []
+
+        def send(index):
+            results.append(transfer_funds(
+                [(first.id, 'app_wallet_balance', -5), (second.id, 'app_wallet_balance', 5)],
+                {'sender': first.user, 'receiver': second.user, 'amount': 5, 'transaction_type': 'send'},
+                idempotency_key='retry-1'))
+
+        self.assertEqual(run_in_threads(6, send), [])
+
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertEqual({record.id for record, _ in results}, set(Transaction.objects.values_list('id', flat=True)))
+        first.refresh_from_db()
+        self.assertEqual(first.app_wallet_balance, Decimal('15.00'))
@@ -16,6 +16,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from agency.models import Investment, FundWithdrawal
+from payment_app.helpers import post_wallet, transfer_funds, idempotency_key_from, InsufficientBalance
 from payment_app.models import Transaction, UserWallet, TDSSubmissionLog
 from payment_app.serializers import WithdrawRequestSerializer, ApproveTransactionSerializer, PayUserSerializer, \
     UserWalletSerializer, TransactionSerializer, AddMoneyToWalletSerializer, ListTDSSubmissionLogSerializer, \
@@ -62,42 +63,34 @@ class UserWalletViewSet(viewsets.ModelViewSet):
 
         sender_wallet = UserWallet.objects.get(user=sender)
         recipient_wallet, _ = UserWallet.objects.get_or_create(user=recipient.user)
+        transaction_fields = {
+            'created_by': request.user,
+            'sender': sender,
+            'receiver': recipient.user,
+            'amount': amount,
+            'transaction_status': 'approved',
+            'transaction_type': 'send',
+            'status': 'active'
+        }
         if wallet_type == "app_wallet":
             taxable_amount = Decimal(amount) * Decimal('0.05')
             payable_amount = Decimal(amount) - taxable_amount
-            sender_wallet.app_wallet_balance -= payable_amount
-            sender_wallet.save()
-            recipient_wallet.app_wallet_balance += payable_amount
-            recipient_wallet.save()
-            Transaction.objects.create(
-                created_by=request.user,
-                sender=sender,
-                receiver=recipient.user,
-                amount=amount,
-                taxable_amount=taxable_amount,
-                transaction_status='approved',
-                transaction_type='send',
-                status='active'
-            )
+            transaction_fields['taxable_amount'] = taxable_amount
+            entries = [(sender_wallet.id, 'app_wallet_balance', -payable_amount),
+                       (recipient_wallet.id, 'app_wallet_balance', payable_amount)]
         elif wallet_type == "main_wallet":
-            sender_wallet.main_wallet_balance -= Decimal(amount)
-            sender_wallet.save()
-            recipient_wallet.main_wallet_balance += Decimal(amount)
-            recipient_wallet.save()
-            Transaction.objects.create(
-                created_by=request.user,
-                sender=sender,
-                receiver=recipient.user,
-                amount=amount,
-                transaction_status='approved',
-                transaction_type='send',
-                status='active'
-            )
+            entries = [(sender_wallet.id, 'main_wallet_balance', -Decimal(amount)),
+                       (recipient_wallet.id, 'main_wallet_balance', Decimal(amount))]
         else:
             return Response(
                 {"message": "Currently we are accepting in-app transfer and main wallet transfer."},
                 status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            transfer_funds(entries, transaction_fields, idempotency_key=idempotency_key_from(request))
+        except InsufficientBalance:
+            return Response({"error": "Insufficient balance in your wallet."}, status=status.HTTP_400_BAD_REQUEST)
+
         return Response({"message": "Payment successfully transferred."}, status=status.HTTP_200_OK)
 
     # @action(detail=False, methods=['post'], url_path='scan-and-pay')
@@ -182,24 +175,28 @@ class UserWalletViewSet(viewsets.ModelViewSet):
         amount_after_fee = transfer_amount - net_charge
 
         # Update wallet balances
-        user_wallet.app_wallet_balance -= transfer_amount
-        user_wallet.main_wallet_balance += amount_after_fee
-        user_wallet.tds_amount += charge if charge else 0
-        user_wallet.admin_amount += charge if charge else 0
-        user_wallet.save()
-
-        Transaction.objects.create(
-            created_by=request.user,
-            sender=request.user,
-            receiver=request.user,
-            amount=amount_after_fee,
-            transaction_status='approved',
-            transaction_type='transfer',
-            status='active',
-            tds_amount=charge if charge else 0,
-            taxable_amount=net_charge if net_charge else 0,
-            payment_method='wallet'
-        )
+        try:
+            transfer_funds([
+                (user_wallet.id, 'app_wallet_balance', -transfer_amount),
+                (user_wallet.id, 'main_wallet_balance', amount_after_fee),
+                (user_wallet.id, 'tds_amount', charge),
+                (user_wallet.id, 'admin_amount', charge),
+            ], {
+                'created_by': request.user,
+                'sender': request.user,
+                'receiver': request.user,
+                'amount': amount_after_fee,
+                'transaction_status': 'approved',
+                'transaction_type': 'transfer',
+                'status': 'active',
+                'tds_amount': charge if charge else 0,
+                'taxable_amount': net_charge if net_charge else 0,
+                'payment_method': 'wallet'
+            }, idempotency_key=idempotency_key_from(request))
+        except InsufficientBalance:
+            return Response(
+                {"error": "Insufficient balance in app wallet."}, status=status.HTTP_400_BAD_REQUEST)
+        user_wallet.refresh_from_db(fields=UserWallet.BALANCE_FIELDS)
 
         return Response(
             {"message": "Transfer successful.", "transfer_amount": f"{transfer_amount:.2f}",
@@ -226,17 +223,22 @@ class UserWalletViewSet(viewsets.ModelViewSet):
             return Response({"error": "You are not linked with wallet, please connect to admin."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        user_wallet.main_wallet_balance -= Decimal(str(amount))
-        user_wallet.admin_amount += taxable_amount
-        user_wallet.save()
+        def create_withdrawal(transaction_history):
+            FundWithdrawal.objects.create(user=request.user, withdrawal_amount=amount, transaction=transaction_history,
+                                          withdrawal_date=datetime.datetime.now(), taxable_amount=taxable_amount)
 
-        transaction_history = Transaction.objects.create(
-            created_by=request.user, sender=request.user,
-            receiver=request.user, amount=amount, taxable_amount=taxable_amount,
-            transaction_type='withdraw', transaction_status='pending', remarks=f'Your withdraw request of Rs. {amount}'
-        )
-        FundWithdrawal.objects.create(user=request.user, withdrawal_amount=amount, transaction=transaction_history,
-                                      withdrawal_date=datetime.datetime.now(), taxable_amount=taxable_amount)
+        try:
+            transfer_funds([
+                (user_wallet.id, 'main_wallet_balance', -Decimal(str(amount))),
+                (user_wallet.id, 'admin_amount', taxable_amount),
+            ], {
+                'created_by': request.user, 'sender': request.user,
+                'receiver': request.user, 'amount': amount, 'taxable_amount': taxable_amount,
+                'transaction_type': 'withdraw', 'transaction_status': 'pending',
+                'remarks': f'Your withdraw request of Rs. {amount}'
+            }, idempotency_key=idempotency_key_from(request), on_posted=create_withdrawal)
+        except InsufficientBalance:
+            return Response({"error": "Insufficient balance in main wallet."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": "Your withdrawal will be credited to your account within 48 hours. "
                                     "Thank you for your patience."}, status=status.HTTP_201_CREATED)
 
@@ -301,8 +303,7 @@ class ApproveTransactionView(APIView):
 
             elif transaction.transaction_type == 'deposit':
                 wallet = UserWallet.objects.filter(user=transaction.receiver).last()
-                wallet.main_wallet_balance += transaction.amount
-                wallet.save()
+                post_wallet(wallet, {'main_wallet_balance': transaction.amount}, 'deposit', source_id=transaction.id)
 
             transaction.status = 'approved'
 
@@ -387,8 +388,11 @@ class TDSSubmissionAPIView(APIView):
                 return Response({'message': f"You cannot submit more than the available TDS amount "
                                             f"({wallet.tds_amount})."}, status=status.HTTP_400_BAD_REQUEST)
 
-            wallet.tds_amount -= amount_decimal
-            wallet.save()
+            try:
+                post_wallet(wallet, {'tds_amount': -amount_decimal}, 'tds', check_funds=True)
+            except InsufficientBalance:
+                return Response({'message': f"You cannot submit more than the available TDS amount "
+                                            f"({wallet.tds_amount})."}, status=status.HTTP_400_BAD_REQUEST)
 
             TDSSubmissionLog.objects.create(
                 submitted_for=wallet.user, submitted_by=request.user,
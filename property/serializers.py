@@ -4,6 +4,7 @@ from decimal import Decimal
 from rest_framework import serializers
 
 from master.models import Country, State, City
+from payment_app.helpers import post_to_wallets, InsufficientBalance
 from payment_app.models import UserWallet
 from property.choices import MEDIA_TYPE_CHOICES, PROPERTY_TYPE, PROPERTY_STATUS
 from property.models import Property, Media, PropertyEnquiry, PropertyBooking, PropertyBookmark, NearbyFacility, \
@@ -358,11 +359,13 @@ class CreatePropertyBookingSerializer(serializers.ModelSerializer):
 
             if wallet.app_wallet_balance < property_price:
                 raise serializers.ValidationError("Insufficient balance in you app Wallet.")
-            wallet.app_wallet_balance -= property_price
-            wallet.save()
             taxable_amount = property_price * Decimal(0.05)
-            receiver_wallet.app_wallet_balance += property_price - taxable_amount
-            wallet.save()
+            try:
+                post_to_wallets([(wallet.id, 'app_wallet_balance', -property_price),
+                                 (receiver_wallet.id, 'app_wallet_balance', property_price - taxable_amount)],
+                                'property', check_funds=True)
+            except InsufficientBalance:
+                raise serializers.ValidationError("Insufficient balance in you app Wallet.")
 
         elif payment_mode == 'main_wallet':
             try:
@@ -373,11 +376,13 @@ class CreatePropertyBookingSerializer(serializers.ModelSerializer):
 
             if wallet.main_wallet_balance < property_price:
                 raise serializers.ValidationError("Insufficient balance in you main wallet.")
-            wallet.main_wallet_balance -= property_price
-            wallet.save()
             taxable_amount = property_price * Decimal(0.10)
-            receiver_wallet.app_wallet_balance += property_price - taxable_amount
-            wallet.save()
+            try:
+                post_to_wallets([(wallet.id, 'main_wallet_balance', -property_price),
+                                 (receiver_wallet.id, 'app_wallet_balance', property_price - taxable_amount)],
+                                'property', check_funds=True)
+            except InsufficientBalance:
+                raise serializers.ValidationError("Insufficient balance in you main wallet.")
         else:
             raise serializers.ValidationError("Currently we are accepting two types of payment only.")
         return data
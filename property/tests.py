@@ -1,3 +1,52 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Profile
+from master.models import Country, State, City
+from payment_app.models import UserWallet, WalletLedgerEntry
+from property.models import Property
+from property.serializers import CreatePropertyBookingSerializer
+
+
+class PropertyBookingPaymentTest(TestCase):
+
+    def setUp(self):
+        self.buyer = User.objects.create(username='buyer')
+        Profile.objects.create(user=self.buyer, is_kyc=True, is_kyc_verified=True)
+        self.seller = User.objects.create(username='seller')
+        self.buyer_wallet = UserWallet.objects.create(user=self.buyer, app_wallet_balance=Decimal('1500'),
+                                                      main_wallet_balance=Decimal('1500'))
+        self.seller_wallet = UserWallet.objects.create(user=self.seller)
+        city = City.objects.create(name='Pune', state=State.objects.create(
+            name='Maharashtra', country=Country.objects.create(name='India', code='IN')))
+        self.property = Property.objects.create(
+            user=self.seller, title='Plot', price=Decimal('1000'), area_size=100, property_status='sale',
+            owner_contact_number='9999999999', country=city.state.country, state=city.state, city=city,
+            postal_code='411001', street_address='Street')
+
+    def book(self, payment_status):
+        request = SimpleNamespace(user=self.buyer, data={'payment_status': payment_status})
+        serializer = CreatePropertyBookingSerializer(data={
+            'property_id': self.property.id, 'payment_status': payment_status, 'customer_name': 'Buyer',
+            'customer_email': 'buyer@example.com', 'customer_phone': '9876543210'}, context={'request': request})
+        return serializer.is_valid()
+
+    def test_seller_is_credited_through_the_ledger(self):
+        self.assertTrue(self.book('in_app'))
+        self.assertTrue(self.book('main_wallet'))
+        self.buyer_wallet.refresh_from_db()
+        self.seller_wallet.refresh_from_db()
+        self.assertEqual(self.buyer_wallet.app_wallet_balance, Decimal('500'))
+        self.assertEqual(self.buyer_wallet.main_wallet_balance, Decimal('500'))
+        self.assertEqual(self.seller_wallet.app_wallet_balance, Decimal('950') + Decimal('900'))
+        self.assertEqual(WalletLedgerEntry.objects.filter(wallet=self.seller_wallet).count(), 2)
+
+    def test_insufficient_balance_credits_nobody(self):
+        UserWallet.objects.filter(id=self.buyer_wallet.id).update(app_wallet_balance=Decimal('10'))
+        self.assertFalse(self.book('in_app'))
+        self.seller_wallet.refresh_from_db()
+        self.assertEqual(self.seller_wallet.app_wallet_balance, Decimal('0'))
+        self.assertFalse(WalletLedgerEntry.objects.exists())
@@ -47,4 +47,21 @@ royalty_levels = [
         "turnover": 10000000,
         "gift": 10000000,
     },
-]
\ No newline at end of file
+]
+
+# Monthly P2PMB royalty pool per club: the P2PMBRoyaltyMaster income field and distributed flag, eligibility
+# defaults (an active RoyaltyMaster of the same club overrides direct/level1/level2) and the earnings cap.
+ROYALTY_CLUB_DISTRIBUTION = [
+    {"club": "star", "label": "1 Star", "income": "star_income", "flag": "is_distributed",
+     "direct": 5, "level1": 0, "level2": 0, "cap": 200000},
+    {"club": "2_star", "label": "2 Star", "income": "two_star_income", "flag": "is_two_star_distributed",
+     "direct": 10, "level1": 0, "level2": 0, "cap": 500000},
+    {"club": "3_star", "label": "3 Star", "income": "three_star_income", "flag": "is_three_star_distributed",
+     "direct": 10, "level1": 25, "level2": 125, "cap": 5000000},
+    {"club": "5_star", "label": "5 Star", "income": "lifetime_income", "flag": "is_five_star_distributed",
+     "direct": 10, "level1": 100, "level2": 500, "cap": 10000000},
+]
+ROYALTY_DEFAULT_USER_ID = 33
+# ID value: the total return a member can earn, as a multiple of their P2PMB investment.
+ID_VALUE_MULTIPLIER = Decimal('2.1')
+WORKING_ID_VALUE_MULTIPLIER = Decimal('4.4')
\ No newline at end of file
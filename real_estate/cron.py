@@ -1,19 +1,80 @@
+import datetime
 import logging
+import time
 
 from agency.calculation import (distribute_monthly_rent_for_super_agency, distribute_monthly_rent_for_agency,
                                 process_monthly_rentals_for_ppd_interest, calculate_super_agency_rewards,
-                                calculate_agency_rewards, calculate_field_agent_rewards)
+                                calculate_agency_rewards, calculate_field_agent_rewards,
+                                get_super_agency_rent_user_ids, get_agency_rent_user_ids, get_reward_super_agencies,
+                                get_reward_agencies, get_reward_field_agents)
+from master.helpers import job_lease
+from master.pipeline import Step, run_pipeline, format_pipeline_report, PIPELINE_PROCESSES
+from p2pmb.calculation import ProcessMonthlyInterestP2PMB
+from web_admin.helpers import refresh_finance_facts
 
+MONTH_CLOSE_JOB = 'month_close'
 
-def monthly_task():
-    distribute_monthly_rent_for_super_agency()  # Office Setup and Rent For Super Agency
-    distribute_monthly_rent_for_agency()  # Office Setup and Rent For Agency
-    calculate_super_agency_rewards()  # Get Rewards as per agency and field agent turnover
-    calculate_agency_rewards()  # Get Rewards field agent turnover
-    calculate_field_agent_rewards()     # Get Rewards for own turnover
 
+def get_month_close_steps(period, today):
+    """
+    The month-end close of `period` as a DAG. Rent, rewards and interest pay different users from different
+    tables and run side by side; the finance facts are refreshed once all of them are paid. The p2pmb interest
+    waits for the period's interest day: a close run before it leaves the step pending, and a run on or after it
+    pays the month as of that day.
+    """
+    interest_day = ProcessMonthlyInterestP2PMB.get_interest_day(period)
 
+    def ids(queryset):
+        return lambda: queryset().values_list('id', flat=True)
+
+    return [
+        # Office Setup and Rent For Super Agency
+        Step('rent_super_agency', lambda user_ids: distribute_monthly_rent_for_super_agency(user_ids=user_ids),
+             ids=get_super_agency_rent_user_ids),
+        # Office Setup and Rent For Agency
+        Step('rent_agency', lambda user_ids: distribute_monthly_rent_for_agency(user_ids=user_ids),
+             ids=get_agency_rent_user_ids),
+        # Get Rewards as per agency and field agent turnover
+        Step('rewards_super_agency', lambda chunk: calculate_super_agency_rewards(super_agency_ids=chunk),
+             ids=ids(get_reward_super_agencies), chunk_size=100),
+        # Get Rewards field agent turnover
+        Step('rewards_agency', lambda chunk: calculate_agency_rewards(agency_ids=chunk),
+             ids=ids(get_reward_agencies), chunk_size=200),
+        # Get Rewards for own turnover
+        Step('rewards_field_agent', lambda chunk: calculate_field_agent_rewards(field_agent_ids=chunk),
+             ids=ids(get_reward_field_agents)),
+        Step('p2pmb_interest',
+             lambda chunk: ProcessMonthlyInterestP2PMB.generate_interest_for_chunk(chunk, interest_day),
+             ids=ids(ProcessMonthlyInterestP2PMB.get_interest_investments),
+             when=lambda: ProcessMonthlyInterestP2PMB.is_interest_due(period, today)),
+        Step('finance_facts', refresh_finance_facts,
+             depends=('rent_super_agency', 'rent_agency', 'rewards_super_agency', 'rewards_agency',
+                      'rewards_field_agent', 'p2pmb_interest')),
+    ]
+
+
+@job_lease(ttl=datetime.timedelta(hours=6))
+def monthly_task(processes=PIPELINE_PROCESSES, period=None):
+    """
+    Run the close of `period` ('YYYY-MM', this month by default). Every chunk is checkpointed, so running it again
+    after a failure only pays what is left; once every step is done a rerun does nothing.
+    """
+    today = datetime.datetime.now().date()
+    period = period or today.strftime('%Y-%m')
+    print(f"🚀 Month close {period} started")
+    started = time.perf_counter()
+    checkpoints = run_pipeline(MONTH_CLOSE_JOB, period, get_month_close_steps(period, today), processes=processes,
+                               factory=('real_estate.cron.get_month_close_steps', (period, today)))
+    print(format_pipeline_report(checkpoints, time.perf_counter() - started))
+    if all(checkpoint.state == 'done' for checkpoint in checkpoints):
+        print(f"✅ Month close {period} finished")
+    else:
+        print(f"🔴 Month close {period} is incomplete, run it again to resume")
+    return checkpoints
+
+
+@job_lease(ttl=datetime.timedelta(hours=2))
 def daily_task():
     process_monthly_rentals_for_ppd_interest()  # Run Daily for get interest once in a month
     # DistributeDirectCommission.cron_send_monthly_payment_direct_income() # For sending distribute schedule commission
-    # check_royalty_club_membership()         #todo: Need to test this
\ No newline at end of file
+    # check_royalty_club_membership()         #todo: Need to test this
@@ -262,10 +262,30 @@ CKEDITOR_5_CONFIGS = {
 # Cron Jobs
 
 CRONJOBS = [
-    ('*/5 * * * *', 'p2pmb.cron.distribute_direct_income'),
-    ('*/7 * * * *', 'p2pmb.cron.distribute_level_income'),
+    ('* * * * *', 'master.cron.dispatch_outbox_events'),
+    ('15 4 * * *', 'master.cron.prune_outbox_events'),
+    # Direct and level income are paid from the investment.approved outbox events, these nightly sweeps only pick
+    # up investments approved without one.
+    ('0 4 * * *', 'p2pmb.cron.distribute_direct_income'),
+    ('30 4 * * *', 'p2pmb.cron.distribute_level_income'),
     ('0 0 1 * *', 'p2pmb.cron.process_p2pmb_monthly_interest'),
-    ('0 0 * * *', 'p2pmb.cron.process_direct_monthly_interest')
+    ('0 0 * * *', 'p2pmb.cron.process_direct_monthly_interest'),
+    ('30 * * * *', 'p2pmb.cron.release_hold_level_income'),
+    ('30 1 * * *', 'p2pmb.cron.reconcile_mlm_turnover'),
+    ('0 2 * * *', 'p2pmb.cron.rebuild_earnings_summary'),
+    ('0 3 * * *', 'payment_app.cron.snapshot_wallet_balances'),
+    ('*/15 * * * *', 'web_admin.cron.refresh_daily_finance_facts'),
+    ('45 2 * * *', 'web_admin.cron.rebuild_daily_finance_facts')
+]
+
+# Entries run by `manage.py scheduler`, which replaces the installed crontab; a six field schedule starts with the
+# seconds. The outbox is dispatched every 2 seconds there, so income lands seconds after an approval.
+SUB_MINUTE_JOBS = [
+    ('*/2 * * * * *', 'master.cron.dispatch_outbox_events'),
+]
+
+SCHEDULER_JOBS = SUB_MINUTE_JOBS + [
+    job for job in CRONJOBS if job[1] not in {path for _, path in SUB_MINUTE_JOBS}
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import random
+import threading
+import time
+from decimal import Decimal
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'real_estate.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connections  # noqa: E402
+
+from payment_app.helpers import transfer_funds, post_to_wallets, find_wallet_drift, InsufficientBalance  # noqa: E402
+from payment_app.models import UserWallet, Transaction  # noqa: E402
+
+USERNAME_PREFIX = 'bench-transfer-'
+OPENING_BALANCE = Decimal('1000.00')
+
+
+def create_wallets(count):
+    wallets = []
+    for index in range(count):
+        user, _ = User.objects.get_or_create(username=f'{USERNAME_PREFIX}{index}')
+        wallets.append(UserWallet.objects.get_or_create(user=user)[0])
+    post_to_wallets([(wallet.id, 'main_wallet_balance', OPENING_BALANCE) for wallet in wallets], 'deposit')
+    return wallets
+
+
+def remove_wallets():
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    Transaction.objects.filter(sender__in=users).delete()
+    users.delete()
+
+
+def run(threads, transfers, wallet_count, hot):
+    wallets = create_wallets(wallet_count)
+    # With --hot every transfer touches the first two wallets, the worst case for lock contention.
+    pool = wallets[:2] if hot else wallets
+    latencies, refused, errors = [], [], []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(transfers):
+                sender, receiver = rng.sample(pool, 2)
+                amount = Decimal(rng.randint(1, 5000)) / 100
+                started = time.perf_counter()
+                try:
+                    transfer_funds([(sender.id, 'main_wallet_balance', -amount),
+                                    (receiver.id, 'main_wallet_balance', amount)],
+                                   {'sender': sender.user, 'receiver': receiver.user, 'amount': amount,
+                                    'transaction_type': 'send', 'transaction_status': 'approved',
+                                    'payment_method': 'wallet'})
+                except InsufficientBalance:
+                    refused.append(1)
+                latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = sum(UserWallet.objects.filter(id__in=[wallet.id for wallet in wallets]).values_list(
+        'main_wallet_balance', flat=True))
+    negative = UserWallet.objects.filter(id__in=[wallet.id for wallet in wallets], main_wallet_balance__lt=0).count()
+    drift = find_wallet_drift([wallet.id for wallet in wallets])
+
+    print(f"Transfers: {len(latencies)} in {elapsed:.2f}s, {len(latencies) / elapsed:.0f}/s with {threads} threads")
+    if latencies:
+        print(f"Latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms")
+    print(f"Refused for insufficient balance: {len(refused)}, errors: {len(errors)} {errors[:3]}")
+    print(f"Money conserved: {total == OPENING_BALANCE * wallet_count}, negative wallets: {negative}, "
+          f"ledger drift: {len(drift)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Throughput of parallel wallet to wallet transfers.')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--transfers', type=int, default=200, help='Transfers per thread.')
+    parser.add_argument('--wallets', type=int, default=50)
+    parser.add_argument('--hot', action='store_true', help='Transfer between two wallets only.')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark users and wallets.')
+    options = parser.parse_args()
+
+    remove_wallets()
+    try:
+        run(options.threads, options.transfers, options.wallets, options.hot)
+    finally:
+        if not options.keep:
+            remove_wallets()
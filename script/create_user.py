@@ -14,6 +14,7 @@ from django.contrib.auth.models import User
 from agency.models import Investment
 from accounts.helpers import generate_unique_referral_code
 from accounts.models import Profile
+from payment_app.helpers import post_wallet
 from payment_app.models import UserWallet
 
 
@@ -31,7 +32,8 @@ def create_users_with_profiles_and_wallets():
             user.save()
             referral_code = generate_unique_referral_code()
             Profile.objects.create(user=user, verified_by=user, referral_code=referral_code)
-            UserWallet.objects.create(user=user, main_wallet_balance=amount)
+            wallet = UserWallet.objects.create(user=user)
+            post_wallet(wallet, {'main_wallet_balance': amount}, 'deposit')
             investment = Investment.objects.create(user=user, investment_type='p2pmb', amount=amount, gst=0)
             investment.package.set([1])
             print(f"Created: {username} | Profile | Wallet")
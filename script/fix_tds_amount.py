@@ -10,6 +10,7 @@ from django.db.models import Sum, F
 
 django.setup()
 
+from payment_app.helpers import post_wallet
 from payment_app.models import Transaction, UserWallet
 
 
@@ -36,9 +37,10 @@ def update_wallet_tds_amount():
 
         try:
             wallet = UserWallet.objects.filter(user=sender_id).last()
-            wallet.tds_amount = total_tds
-            wallet.admin_amount = total_tds * 2
-            wallet.save(update_fields=['tds_amount', 'admin_amount'])
+            post_wallet(wallet, {
+                'tds_amount': total_tds - wallet.tds_amount,
+                'admin_amount': total_tds * 2 - wallet.admin_amount,
+            }, 'adjustment', remarks='Recomputed from approved transfers')
         except Exception as e:
             print(f"Wallet not found for sender {sender_id}, error is {e}")
 
@@ -9,6 +9,7 @@ import django
 django.setup()
 
 from p2pmb.models import Commission, ScheduledCommission, MLMTree
+from payment_app.helpers import post_wallet
 from payment_app.models import UserWallet
 
 # def create_users_with_profiles_and_wallets():
@@ -56,8 +57,8 @@ def revert_monthly_interest():
                 failure_count += 1
                 continue
 
-            wallet.app_wallet_balance -= amount
-            wallet.save()
+            post_wallet(wallet, {'app_wallet_balance': -amount}, 'adjustment', source_id=investment.id,
+                        remarks='Reverted direct commission')
             investment.delete()
             success_count += 1
 
@@ -27,7 +27,8 @@ def distribute_level_income():
         for investment_instance in investments:
             if investment_instance and investment_instance.user:
                 instance = MLMTree.objects.filter(status='active', child=investment_instance.user).last()
-                direct_count = MLMTree.objects.filter(status='active', referral_by=instance.referral_by).count()
+                direct_count = MLMTree.get_direct_referral_counts([instance.referral_by_id]).get(
+                    instance.referral_by_id, 0)
                 up_level, down_level = get_level_counts(direct_count)
                 if instance and up_level and down_level:
                     amount = investment_instance.amount if investment_instance.amount else 0
@@ -0,0 +1,57 @@
+"""
+Integer paise arithmetic shared by the monthly payout jobs (P2PMB interest, PPD rental, agency rent).
+
+Amounts are carried as whole paise and rates as basis points, so a payout is
+`paise * rate_bp * days / (10000 * month_days)` rounded half-even to the paisa, the same rounding
+`Decimal.quantize(Decimal('0.01'))` applies. The arithmetic is done on plain Python ints, which never overflow, and
+amounts go back to `Decimal` only at write time.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+PAISE_PER_RUPEE = 100
+BASIS_POINTS = 10000
+
+
+def to_paise(amount):
+    """ Rupee amount (Decimal, int, str or None) to whole paise, rounded half-even. """
+    return int((Decimal(str(amount or 0)) * PAISE_PER_RUPEE).to_integral_value(ROUND_HALF_EVEN))
+
+
+def to_basis_points(rate):
+    """ Fractional rate (Decimal('0.015')) to basis points (150), rounded half-even. """
+    return int((Decimal(str(rate or 0)) * BASIS_POINTS).to_integral_value(ROUND_HALF_EVEN))
+
+
+def percent_to_basis_points(percentage):
+    """ Percentage (Decimal('0.25') meaning 0.25%) to basis points (25). """
+    return int((Decimal(str(percentage or 0)) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+def to_rupees(paise):
+    """ Whole paise back to a two decimal place rupee Decimal. """
+    return Decimal(int(paise)).scaleb(-2)
+
+
+def paise_array(amounts):
+    return [to_paise(amount) for amount in amounts]
+
+
+def apply_rates(paise, rate_bp, days=None, month_days=None):
+    """
+    Payout per row: paise * rate_bp / 10000, prorated by days / month_days when given, rounded half-even to whole
+    paise. Negative rates are clamped to zero. Returns a list of ints.
+    """
+    size = len(paise)
+    days = [1] * size if days is None else days
+    month_days = [1] * size if month_days is None else month_days
+    return [
+        _round_half_even(int(amount) * max(int(rate), 0) * int(day), int(month_day) * BASIS_POINTS)
+        for amount, rate, day, month_day in zip(paise, rate_bp, days, month_days)
+    ]
+
+
+def _round_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2):
+        quotient += 1
+    return quotient
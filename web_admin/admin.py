@@ -3,10 +3,10 @@ from import_export.admin import ImportExportModelAdmin
 
 from accounts.admin import CustomModelAdminMixin
 from web_admin.models import ManualFund, FunctionalityAccessPermissions, UserFunctionalityAccessPermission, \
-    CompanyInvestment, ContactUsEnquiry, PropertyInterestEnquiry, ROIUpdateLog, TDSPercentage
+    CompanyInvestment, ContactUsEnquiry, PropertyInterestEnquiry, ROIUpdateLog, TDSPercentage, DailyFinanceFact
 from web_admin.resources import ManualFundResource, FunctionalityAccessPermissionsResource, \
     UserFunctionalityAccessPermissionResource, CompanyInvestmentResource, ContactUsEnquiryResource, \
-    PropertyInterestEnquiryResource, ROIUpdateLogResource, TDSPercentageResource
+    PropertyInterestEnquiryResource, ROIUpdateLogResource, TDSPercentageResource, DailyFinanceFactResource
 
 
 # Register your models here.
@@ -58,4 +58,11 @@ class ROIUpdateLogAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
 @admin.register(TDSPercentage)
 class TDSPercentageAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
     resource_class = TDSPercentageResource
-    raw_id_fields = ('created_by', 'updated_by')
\ No newline at end of file
+    raw_id_fields = ('created_by', 'updated_by')
+
+
+@admin.register(DailyFinanceFact)
+class DailyFinanceFactAdmin(CustomModelAdminMixin, ImportExportModelAdmin):
+    resource_class = DailyFinanceFactResource
+    raw_id_fields = ('user',)
+    list_filter = ('source', 'applicable_for')
@@ -49,4 +49,15 @@ CONTACT_US_ENQUIRY = [
 ROI_STATUS_CHOICE = [
     ('start', 'Start'),
     ('stop', 'Stop')
-]
\ No newline at end of file
+]
+
+FINANCE_FACT_SOURCE = [
+    ('fund', 'Fund Added'),
+    ('commission', 'Commission'),
+    ('reward', 'Reward'),
+    ('royalty', 'Royalty'),
+    ('core_income', 'Core Income'),
+    ('interest', 'Interest'),
+    ('company_investment', 'Company Investment'),
+    ('lapsed', 'Lapsed Amount'),
+]
@@ -0,0 +1,24 @@
+import datetime
+
+from master.helpers import job_lease
+from web_admin.helpers import refresh_finance_facts
+
+
+@job_lease(ttl=datetime.timedelta(hours=1))
+def refresh_daily_finance_facts():
+    """
+    Fold the rows created since the last run into the daily finance facts the fund reports read.
+    """
+    print("🚀 Starting Daily Finance Facts Refresh...")
+    written = refresh_finance_facts()
+    print(f"✅ Daily Finance Facts Refreshed, {written} rows written.")
+
+
+@job_lease(ttl=datetime.timedelta(hours=2))
+def rebuild_daily_finance_facts():
+    """
+    Rebuild the daily finance facts from scratch, picking up older rows that were edited or deleted.
+    """
+    print("🚀 Starting Daily Finance Facts Rebuild...")
+    written = refresh_finance_facts(full=True)
+    print(f"✅ Daily Finance Facts Rebuilt, {written} rows written.")
@@ -1,7 +1,21 @@
+import calendar
 import datetime
 import json
+from decimal import Decimal
+
 import requests
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Sum
+from django.db.models.functions import TruncDate
+
+from agency.models import Investment, InvestmentInterest, RewardEarned
+from p2pmb.models import Commission, CoreIncomeEarned, LapsedAmount, RoyaltyEarned
 from real_estate import settings
+from web_admin.models import CompanyInvestment, DailyFinanceFact, FinanceFactWatermark
+
+# Rows created this long before the watermark are rescanned, for transactions that committed late, and report
+# dates this many days back are always recomputed, for recent rows edited after they were folded in.
+FINANCE_FACT_LOOKBACK = datetime.timedelta(days=3)
 
 
 def add_cashfree_beneficiary(bank_detail):
@@ -96,4 +110,119 @@ def send_cashfree_payout(beneficiary_id, amount, withdraw_id, transfer_mode="ban
             "success": False,
             "data": {"error": str(e)},
             "transfer_id": transfer_id
-        }
\ No newline at end of file
+        }
+
+
+def _approved_fund_queryset():
+    # Exists instead of a join on package, so investments with several packages are counted once.
+    has_package = Investment.package.through.objects.filter(investment_id=OuterRef('pk'))
+    return Investment.objects.filter(Exists(has_package), is_approved=True, pay_method='main_wallet')
+
+
+# Per source: the rows, their report date, the summed amount and the fields the facts are keyed by. Sources
+# with a user field get per user facts next to the company wide ones.
+FINANCE_FACT_SOURCES = {
+    'fund': {'queryset': _approved_fund_queryset, 'date': 'date_created', 'amount': 'amount',
+             'applicable_for': 'investment_type', 'user': 'user'},
+    'commission': {'queryset': Commission.objects.all, 'date': 'date_created', 'amount': 'amount',
+                   'category': 'commission_type', 'user': 'commission_to'},
+    'reward': {'queryset': RewardEarned.objects.all, 'date': 'earned_at', 'amount': 'reward__gift_amount'},
+    'royalty': {'queryset': RoyaltyEarned.objects.all, 'date': 'earned_date', 'amount': 'earned_amount'},
+    'core_income': {'queryset': CoreIncomeEarned.objects.all, 'date': 'date_created', 'amount': 'income_earned'},
+    'interest': {'queryset': InvestmentInterest.objects.all, 'date': 'interest_send_date',
+                 'amount': 'interest_amount'},
+    'company_investment': {'queryset': CompanyInvestment.objects.all, 'date': 'initiated_date', 'amount': 'amount',
+                           'category': 'investment_type', 'applicable_for': 'applicable_for'},
+    'lapsed': {'queryset': lambda: LapsedAmount.objects.filter(status='active'), 'date': 'date_created',
+               'amount': 'amount', 'category': 'earned_type'},
+}
+
+
+def refresh_finance_facts(full=False, lookback=FINANCE_FACT_LOOKBACK):
+    """
+    Bring DailyFinanceFact up to date. Per source, the report dates of rows created since the watermark (less
+    `lookback`) and the last `lookback` days are recomputed from the source table and the watermark advanced;
+    `full` recomputes every date, which also picks up older rows that were edited or deleted. Returns the number
+    of fact rows written.
+    """
+    return sum(_refresh_finance_source(source, config, full, lookback)
+               for source, config in FINANCE_FACT_SOURCES.items())
+
+
+def _refresh_finance_source(source, config, full, lookback):
+    rows = config['queryset']()
+    date_field = config['date']
+    is_datetime = rows.model._meta.get_field(date_field).get_internal_type() == 'DateTimeField'
+
+    with transaction.atomic():
+        watermark, _ = FinanceFactWatermark.objects.select_for_update().get_or_create(source=source)
+        facts = DailyFinanceFact.objects.filter(source=source)
+
+        if full or not watermark.last_created:
+            high_water_mark = rows.aggregate(last=Max('date_created'))['last']
+        else:
+            new_rows = rows.filter(date_created__gt=watermark.last_created - lookback).aggregate(
+                created=Max('date_created'), first=Min(date_field), last=Max(date_field))
+            high_water_mark = new_rows['created']
+            today = datetime.date.today()
+            dates = [today - datetime.timedelta(days=lookback.days), today] + [
+                value.date() if is_datetime else value for value in (new_rows['first'], new_rows['last']) if value]
+            start, end = min(dates), max(dates)
+            facts = facts.filter(date__range=(start, end))
+            if is_datetime:
+                rows = rows.filter(**{f'{date_field}__gte': datetime.datetime.combine(start, datetime.time.min),
+                                      f'{date_field}__lt': datetime.datetime.combine(
+                                          end + datetime.timedelta(days=1), datetime.time.min)})
+            else:
+                rows = rows.filter(**{f'{date_field}__range': (start, end)})
+
+        facts.delete()
+        new_facts = _aggregate_finance_facts(source, config, rows, is_datetime)
+        DailyFinanceFact.objects.bulk_create(new_facts, batch_size=1000)
+        watermark.last_created = max(filter(None, (high_water_mark, watermark.last_created)), default=None)
+        watermark.save()
+    return len(new_facts)
+
+
+def _aggregate_finance_facts(source, config, rows, is_datetime):
+    group = {'day': TruncDate(config['date']) if is_datetime else F(config['date'])}
+    for key in ('category', 'applicable_for', 'user'):
+        if config.get(key):
+            group[f'fact_{key}'] = F(config[key])
+
+    company, facts = {}, []
+    for row in rows.values(**group).annotate(total=Sum(config['amount']), count=Count('id')):
+        if row['day'] is None:
+            continue
+        key = (row['day'], row.get('fact_category') or '', row.get('fact_applicable_for') or '')
+        amount, count = row['total'] or Decimal('0'), row['count']
+        if config.get('user'):
+            facts.append(DailyFinanceFact(date=key[0], source=source, category=key[1], applicable_for=key[2],
+                                          user_id=row['fact_user'], amount=amount, row_count=count))
+        totals = company.setdefault(key, [Decimal('0'), 0])
+        totals[0] += amount
+        totals[1] += count
+
+    facts.extend(
+        DailyFinanceFact(date=day, source=source, category=category, applicable_for=applicable_for,
+                         amount=amount, row_count=count)
+        for (day, category, applicable_for), (amount, count) in company.items()
+    )
+    return facts
+
+
+def get_finance_totals(source, month=None, year=None, group_by='category', user_id=None, **filters):
+    """
+    {value of `group_by`: amount} from the DailyFinanceFact rows of `source`, company wide or for `user_id`,
+    restricted to a month and/or year of the report date and to `filters` on the fact fields. `group_by` may be
+    any fact field or lookup such as 'date' or 'date__month'.
+    """
+    facts = DailyFinanceFact.objects.filter(source=source, **filters)
+    facts = facts.filter(user_id=user_id) if user_id else facts.filter(user__isnull=True)
+    if year:
+        first_month, last_month = (month, month) if month else (1, 12)
+        facts = facts.filter(date__range=(datetime.date(year, first_month, 1), datetime.date(
+            year, last_month, calendar.monthrange(year, last_month)[1])))
+    elif month:
+        facts = facts.filter(date__month=month)
+    return {row[group_by]: row['total'] for row in facts.values(group_by).annotate(total=Sum('amount'))}
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from web_admin.helpers import refresh_finance_facts
+
+
+class Command(BaseCommand):
+    help = 'Fold new commission, reward, interest, fund and company investment rows into DailyFinanceFact.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every date instead of the recent ones.')
+
+    def handle(self, *args, **options):
+        written = refresh_finance_facts(full=options['full'])
+        prefix = '[full] ' if options['full'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{written} daily finance fact rows written.'))
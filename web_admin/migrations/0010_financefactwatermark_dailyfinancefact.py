@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_admin', '0009_tdspercentage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinanceFactWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('fund', 'Fund Added'), ('commission', 'Commission'), ('reward', 'Reward'), ('royalty', 'Royalty'), ('core_income', 'Core Income'), ('interest', 'Interest'), ('company_investment', 'Company Investment'), ('lapsed', 'Lapsed Amount')], max_length=20, unique=True)),
+                ('last_created', models.DateTimeField(blank=True, null=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyFinanceFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('source', models.CharField(choices=[('fund', 'Fund Added'), ('commission', 'Commission'), ('reward', 'Reward'), ('royalty', 'Royalty'), ('core_income', 'Core Income'), ('interest', 'Interest'), ('company_investment', 'Company Investment'), ('lapsed', 'Lapsed Amount')], max_length=20)),
+                ('category', models.CharField(blank=True, default='', max_length=30)),
+                ('applicable_for', models.CharField(blank=True, default='', max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=25)),
+                ('row_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='finance_facts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'date'], name='finance_fact_source_date_idx'), models.Index(fields=['user', 'source'], name='finance_fact_user_idx')],
+            },
+        ),
+    ]
@@ -108,4 +108,40 @@ class TDSPercentage(ModelMixin):
     admin_percentage = models.FloatField(default=5.0)
 
     def __str__(self):
-        return str(self.id)
\ No newline at end of file
+        return str(self.id)
+
+
+class DailyFinanceFact(models.Model):
+    """
+    Daily rollup of the money flows the fund distribution reports add up: amount and row count per report date,
+    source, category (commission type, investment type, ...) and applicable_for. Company wide rows have no user;
+    funds and commissions also get per user rows. Maintained by web_admin.helpers.refresh_finance_facts.
+    """
+    date = models.DateField()
+    source = models.CharField(max_length=20, choices=FINANCE_FACT_SOURCE)
+    category = models.CharField(max_length=30, blank=True, default='')
+    applicable_for = models.CharField(max_length=20, blank=True, default='')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='finance_facts')
+    amount = models.DecimalField(max_digits=25, decimal_places=2, default=0)
+    row_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'date'], name='finance_fact_source_date_idx'),
+            models.Index(fields=['user', 'source'], name='finance_fact_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.category} on {self.date}: {self.amount}"
+
+
+class FinanceFactWatermark(models.Model):
+    """
+    Latest source row date_created folded into DailyFinanceFact, per source.
+    """
+    source = models.CharField(max_length=20, choices=FINANCE_FACT_SOURCE, unique=True)
+    last_created = models.DateTimeField(null=True, blank=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} up to {self.last_created}"
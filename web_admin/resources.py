@@ -1,7 +1,7 @@
 from import_export import resources
 from accounts.resources import EXCLUDE_FOR_API
 from web_admin.models import ManualFund, FunctionalityAccessPermissions, UserFunctionalityAccessPermission, \
-    CompanyInvestment, ContactUsEnquiry, PropertyInterestEnquiry, ROIUpdateLog, TDSPercentage
+    CompanyInvestment, ContactUsEnquiry, PropertyInterestEnquiry, ROIUpdateLog, TDSPercentage, DailyFinanceFact
 
 
 class ManualFundResource(resources.ModelResource):
@@ -57,4 +57,9 @@ class TDSPercentageResource(resources.ModelResource):
     class Meta:
         model = TDSPercentage
         import_id_fields = ('id',)
-        exclude = EXCLUDE_FOR_API
\ No newline at end of file
+        exclude = EXCLUDE_FOR_API
+
+
+class DailyFinanceFactResource(resources.ModelResource):
+    class Meta:
+        model = DailyFinanceFact
@@ -442,32 +442,7 @@ class UserWithWorkingIDSerializer(serializers.ModelSerializer):
         }
 
     def get_is_working_id(self, obj):
-        user = obj.child
-        if not user:
-            return False
-
-        if not hasattr(self, '_investment_map'):
-            self._load_investment_and_referral_data()
-
-        user_investment = self._investment_map.get(user.id, Decimal('0'))
-
-        if user_investment == 0:
-            return False
-
-        referrals = self._referral_map.get(user.id, [])
-        return len(referrals) >= 2
-
-    def _load_investment_and_referral_data(self):
-        investments = Investment.objects.filter(
-            status='active', investment_type='p2pmb', is_approved=True,
-            package__isnull=False, pay_method='main_wallet'
-        ).values('user_id').annotate(total_amount=Sum('amount'))
-
-        self._investment_map = {item['user_id']: item['total_amount'] for item in investments}
-        referrals = MLMTree.objects.values_list('referral_by_id', 'child_id')
-        self._referral_map = {}
-        for referral_by_id, child_id in referrals:
-            self._referral_map.setdefault(referral_by_id, []).append(child_id)
+        return obj.is_working_id
 
 
 class GetAllCommissionSerializer(serializers.ModelSerializer):
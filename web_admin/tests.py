@@ -1,3 +1,206 @@
+import datetime
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.db.models import Q, Sum
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from accounts.models import Profile
+from agency.models import Investment, InvestmentInterest, RewardEarned
+from master.models import RewardMaster
+from p2pmb.helpers import add_closure_for_node, record_earnings, rebuild_earnings_summaries
+from p2pmb.models import MLMTree, Commission, Package, RoyaltyEarned, UserEarningsSummary
+from payment_app.models import UserWallet
+from web_admin.helpers import refresh_finance_facts
+from web_admin.models import CompanyInvestment
+
+
+class AppDashboardAggregateTest(TestCase):
+
+    def setUp(self):
+        self.users = {}
+        for name, parent, position in (('root', None, 1), ('a', 'root', 1), ('b', 'root', 2), ('c', 'a', 1)):
+            user = User.objects.create(username=f'dash-{name}')
+            MLMTree.objects.create(parent=self.users.get(parent), child=user, position=position, level=1,
+                                   show_level=1, referral_by=self.users.get(parent))
+            add_closure_for_node(self.users.get(parent), user)
+            self.users[name] = user
+
+        package = Package.objects.create(name='p2pmb', amount=Decimal('1000'))
+        Investment.objects.create(user=self.users['root'], amount=Decimal('1000'), investment_type='p2pmb',
+                                  gst=Decimal('0'), status='active').package.add(package)
+        rebuild_earnings_summaries()
+        record_earnings([
+            Commission.objects.create(commission_by=self.users[by], commission_to=self.users['root'],
+                                      commission_type=commission_type, amount=Decimal(amount), status='active')
+            for by, commission_type, amount in (('a', 'direct', '50'), ('b', 'direct', '25.50'), ('c', 'level', '7'))
+        ])
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='dash-staff', is_staff=True))
+
+    def baseline(self, user):
+        """ The figures the view computed from the source tables before the earnings summary. """
+        referrals = MLMTree.objects.filter(is_show=True, referral_by=user).count()
+        invested = Investment.objects.filter(
+            status='active', package__isnull=False, investment_type='p2pmb', user=user
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        commissions = Commission.objects.filter(status='active', commission_to=user).aggregate(
+            level_total=Sum('amount', filter=Q(commission_type='level')),
+            direct_total=Sum('amount', filter=Q(commission_type='direct')))
+        return {
+            'total_direct_user_count': referrals,
+            'total_id_value': invested * Decimal('4.4' if referrals >= 2 else '2.1'),
+            'direct_income': commissions['direct_total'] or 0,
+            'level_income': commissions['level_total'] or 0,
+        }
+
+    def test_matches_the_source_tables(self):
+        for name, user in self.users.items():
+            response = self.client.get('/api/admin/get-user-app-dashboard', {'user_id': str(user.id)})
+            self.assertEqual(response.status_code, 200, name)
+            for field, value in self.baseline(user).items():
+                self.assertEqual(Decimal(str(response.data[field])), value, (name, field))
+        response = self.client.get('/api/admin/get-user-app-dashboard', {'user_id': str(self.users['root'].id)})
+        self.assertEqual(response.data['total_team_member'], 3)
+        self.assertEqual(response.data['total_earning'], Decimal('82.50'))
+
+    def test_unknown_user(self):
+        response = self.client.get('/api/admin/get-user-app-dashboard', {'user_id': '999999'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_migration_fills_the_summaries(self):
+        summaries = set(UserEarningsSummary.objects.values_list('user_id', *UserEarningsSummary.TOTAL_FIELDS,
+                                                                'id_value_cap'))
+        UserEarningsSummary.objects.all().delete()
+        import_module('p2pmb.migrations.0048_backfill_user_earnings_summary').backfill_earnings_summaries(
+            django_apps, None)
+        self.assertEqual(set(UserEarningsSummary.objects.values_list(
+            'user_id', *UserEarningsSummary.TOTAL_FIELDS, 'id_value_cap')), summaries)
+
+
+class InvestmentApprovalTest(TestCase):
+
+    def test_approval_adds_to_the_earnings_summary(self):
+        user = User.objects.create(username='approve-investor')
+        Profile.objects.create(user=user, is_kyc=True, is_kyc_verified=True)
+        MLMTree.objects.create(child=user, position=1, level=1, show_level=1)
+        investment = Investment.objects.create(user=user, amount=Decimal('1000'), investment_type='p2pmb',
+                                               gst=Decimal('0'), status='active', pay_method='main_wallet')
+        investment.package.add(Package.objects.create(name='p2pmb', amount=Decimal('1000')))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='approve-staff', is_staff=True))
+        response = client.post('/api/admin/investment/', {'investment_id': investment.id})
+        self.assertEqual(response.status_code, 200)
+
+        summary = UserEarningsSummary.objects.get(user=user)
+        self.assertEqual((summary.invested_amount, summary.top_up_count, summary.id_value_cap),
+                         (Decimal('1000'), 1, Decimal('2100')))
+        self.assertEqual(UserWallet.objects.get(user=user).main_wallet_balance, Decimal('1000'))
+
+
+class FinanceFactTest(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.last_year = datetime.date(self.today.year - 1, 3, 15)
+        self.user, self.other = User.objects.create(username='finance-a'), User.objects.create(username='finance-b')
+        packages = [Package.objects.create(name=f'p2pmb-{index}', amount=Decimal('1000')) for index in range(2)]
+        for day, amount, approved, package_count in ((self.today, '1000', True, 1), (self.today, '250.50', True, 2),
+                                                     (self.last_year, '4000', True, 1), (self.today, '75', False, 1)):
+            investment = self.create_on(day, Investment, user=self.user, amount=Decimal(amount),
+                                        investment_type='p2pmb', gst=Decimal('0'), is_approved=approved,
+                                        pay_method='main_wallet')
+            investment.package.add(*packages[:package_count])
+            InvestmentInterest.objects.create(investment=investment, interest_amount=Decimal(amount) / 100,
+                                              interest_send_date=day.replace(day=1))
+        for day, commission_type, amount in ((self.today, 'direct', '30'), (self.today, 'level', '12.25'),
+                                             (self.last_year, 'direct', '120'), (self.last_year, 'level', '7')):
+            self.create_on(day, Commission, commission_by=self.other, commission_to=self.user,
+                           commission_type=commission_type, amount=Decimal(amount))
+        reward = RewardMaster.objects.create(name='Trip', turnover_threshold=Decimal('1000'), reward_description='',
+                                             applicable_for='p2pmb', gift_amount=Decimal('500'), total_paid_month=1)
+        RewardEarned.objects.filter(id=RewardEarned.objects.create(
+            user=self.user, reward=reward, turnover_at_earning=Decimal('1000')).id).update(
+            earned_at=datetime.datetime.combine(self.last_year, datetime.time(12)))
+        RoyaltyEarned.objects.create(user=self.user, club_type='star', earned_date=self.today,
+                                     earned_amount=Decimal('40'))
+        for day, investment_type, amount in ((self.today, 'property', '300'), (self.last_year, 'company_expense', '60'),
+                                             (self.today, 'crypto', '90')):
+            CompanyInvestment.objects.create(applicable_for='p2pmb', investment_type=investment_type,
+                                             amount=Decimal(amount), initiated_date=day)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='finance-staff', is_staff=True))
+
+    def create_on(self, day, model, **fields):
+        row = model.objects.create(**fields)
+        model.objects.filter(id=row.id).update(date_created=datetime.datetime.combine(day, datetime.time(12)))
+        return row
+
+    def baseline_spend(self, month, year):
+        """ {name: total spent} of the fund distribution report summed from the source tables, as it used to be. """
+        def period(prefix):
+            return {**({f'{prefix}__month': month} if month else {}), **({f'{prefix}__year': year} if year else {})}
+
+        def total(rows, field):
+            return rows.aggregate(total=Sum(field))['total'] or Decimal(0)
+
+        def company(investment_type):
+            return total(CompanyInvestment.objects.filter(
+                applicable_for='p2pmb', investment_type=investment_type, **period('initiated_date')), 'amount')
+
+        # Every line also adds the company investments whose type equals its report key.
+        return {
+            'Direct Income': company('direct_income') + total(
+                Commission.objects.filter(commission_type='direct', **period('date_created')), 'amount'),
+            'Level Income': company('level') + total(
+                Commission.objects.filter(commission_type='level', **period('date_created')), 'amount'),
+            'Reward': company('reward') + total(RewardEarned.objects.filter(**period('earned_at')),
+                                                'reward__gift_amount'),
+            'Royalty': company('royalty') + total(RoyaltyEarned.objects.filter(**period('earned_date')),
+                                                  'earned_amount'),
+            'Company Extra Expenses': company('company_extra_expenses') + company('company_expense'),
+            'Interest': company('interest') + total(
+                InvestmentInterest.objects.filter(**period('interest_send_date')), 'interest_amount'),
+            'Property Investment': company('properties') + company('property'),
+            'Crypto': company('crypto') + company('crypto'),
+        }
+
+    def baseline_fund(self, month, year):
+        return Investment.objects.filter(
+            investment_type='p2pmb', package__isnull=False, is_approved=True, pay_method='main_wallet',
+            **({'date_created__month': month} if month else {}), **({'date_created__year': year} if year else {})
+        ).distinct().aggregate(total=Sum('amount'))['total'] or Decimal(0)
+
+    def assertMatchesBaseline(self, month, year):
+        params = {key: value for key, value in (('month', month), ('year', year)) if value}
+        response = self.client.get('/api/admin/fund-distribution-p2pmb/', params)
+        self.assertEqual(response.status_code, 200)
+        report = {row['name']: row for row in response.data}
+        fund = self.baseline_fund(month, year)
+        for name, spent in self.baseline_spend(month, year).items():
+            self.assertEqual(Decimal(str(report[name]['total_spend_amount'])), spent, (name, month, year))
+            self.assertEqual(Decimal(str(report[name]['expected_spending_amount'])),
+                             (fund * Decimal(str(report[name]['expected_spending_per'])) / 100).quantize(
+                                 Decimal('0.01')), (name, month, year))
+
+    def test_report_matches_the_source_tables(self):
+        refresh_finance_facts(full=True)
+        for month, year in ((None, None), (None, self.today.year), (self.today.month, self.today.year),
+                            (3, self.last_year.year), (3, None)):
+            self.assertMatchesBaseline(month, year)
 
-# Create your tests here.
+    def test_incremental_refresh_picks_up_new_rows(self):
+        refresh_finance_facts()
+        Commission.objects.create(commission_by=self.other, commission_to=self.user, commission_type='direct',
+                                  amount=Decimal('5.55'))
+        Investment.objects.create(user=self.other, amount=Decimal('800'), investment_type='p2pmb', gst=Decimal('0'),
+                                  is_approved=True, pay_method='main_wallet').package.add(Package.objects.first())
+        refresh_finance_facts()
+        for month, year in ((None, None), (self.today.month, self.today.year)):
+            self.assertMatchesBaseline(month, year)
@@ -1,11 +1,11 @@
 import datetime
-from collections import defaultdict
 from datetime import timedelta, date
 from decimal import Decimal
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
 from django.db.models import Count, Q, Sum
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, permissions, viewsets, generics
@@ -19,13 +19,15 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import Profile, BankDetails, UserPersonalDocument, ChangeRequest
+from master.helpers import publish_event
 from master.models import CoreGroupIncome, RewardMaster
 from notification.models import InAppNotification
-from p2pmb.helpers import get_downline_count
-from p2pmb.models import Commission, MLMTree, CoreIncomeEarned, RoyaltyEarned, ExtraRewardEarned, ExtraReward, Reward
+from p2pmb.helpers import get_downline_count, roll_up_investment_turnover, record_earnings, record_investment
+from p2pmb.models import Commission, MLMTree, CoreIncomeEarned, RoyaltyEarned, ExtraRewardEarned, ExtraReward, Reward, \
+    UserEarningsSummary
 from p2pmb.serializers import CoreIncomeEarnedSerializer
 from property.models import Property
-from web_admin.helpers import add_cashfree_beneficiary
+from web_admin.helpers import add_cashfree_beneficiary, get_finance_totals
 from web_admin.models import ManualFund, CompanyInvestment, ContactUsEnquiry, PropertyInterestEnquiry, \
     UserFunctionalityAccessPermission, ROIUpdateLog, TDSPercentage
 from web_admin.serializers import ProfileSerializer, InvestmentSerializer, ManualFundSerializer, BankDetailSerializer, \
@@ -37,6 +39,7 @@ from web_admin.serializers import ProfileSerializer, InvestmentSerializer, Manua
     GetAllMLMChildSerializer, RoyaltyEarnedAdminSerializer, ExtraRewardEarnedAdminSerializer, ROIEarnedAdminSerializer, \
     UserWalletSerializer, TDSPercentageSerializer, TDSPercentageListSerializer, ExtraRewardEarnedUserSerializer
 from agency.models import Investment, FundWithdrawal, SuperAgency, Agency, FieldAgent, InvestmentInterest, RewardEarned
+from payment_app.helpers import post_wallet
 from payment_app.models import UserWallet, Transaction
 from web_admin.choices import main_dashboard
 
@@ -193,19 +196,20 @@ class InvestmentAPIView(APIView):
 
     def update_user_commission_(self, user, sender, verify_by, remarks, commission_amount):
         wallet, _ = UserWallet.objects.get_or_create(user=user)
-        wallet.in_app_wallet += commission_amount
-        Transaction.objects.create(
-            created_by=user,
-            sender=sender,
-            amount=commission_amount,
-            transaction_type='commission',
-            transaction_status='approved',
-            verified_by=verify_by,
-            verified_on=datetime.datetime.now(),
-            remarks=remarks,
-            payment_method='wallet'
-        )
-        wallet.save()
+        with db_transaction.atomic():
+            commission_transaction = Transaction.objects.create(
+                created_by=user,
+                sender=sender,
+                amount=commission_amount,
+                transaction_type='commission',
+                transaction_status='approved',
+                verified_by=verify_by,
+                verified_on=datetime.datetime.now(),
+                remarks=remarks,
+                payment_method='wallet'
+            )
+            post_wallet(wallet, {'app_wallet_balance': commission_amount}, 'commission',
+                        source_id=commission_transaction.id, remarks=remarks)
 
     def get(self, request):
         investments = Investment.objects.filter(is_approved=False).order_by('-date_created')
@@ -227,14 +231,16 @@ class InvestmentAPIView(APIView):
         elif not investment.user.profile.is_kyc_verified:
             return Response({'error': 'Please first verify kyc.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        investment.is_approved = True
-        investment.approved_by = request.user
-        investment.approved_on = datetime.datetime.now()
-        investment.save()
-
-        wallet, _ = UserWallet.objects.get_or_create(user=investment.user)
-        wallet.main_wallet_balance += investment.amount
-        wallet.save()
+        with db_transaction.atomic():
+            investment.is_approved = True
+            investment.approved_by = request.user
+            investment.approved_on = datetime.datetime.now()
+            investment.save()
+            roll_up_investment_turnover(investment)
+            record_investment(investment)
+            publish_event('investment.approved', investment_id=investment.id)
+            wallet, _ = UserWallet.objects.get_or_create(user=investment.user)
+            post_wallet(wallet, {'main_wallet_balance': investment.amount}, 'deposit', source_id=investment.id)
         # if investment.user.profile.role == 'agency':
         #     agency = Agency.objects.filter(created_by=investment.user).last()
         #     if agency and agency.company:
@@ -283,37 +289,37 @@ class CreateManualInvestmentAPIView(APIView):
         if password and password != request.user.profile.payment_password:
             return Response({'error': 'Incorrect Password'}, status=status.HTTP_400_BAD_REQUEST)
 
-        wallet, _ = UserWallet.objects.get_or_create(user=user_profile.user)
-        wallet.main_wallet_balance += amount
-        wallet.save()
-
-        Transaction.objects.create(
-            created_by=user_profile.user,
-            sender=user_profile.user,
-            receiver=user_profile.user,
-            amount=amount,
-            transaction_type='deposit',
-            transaction_status='approved',
-            verified_by=request.user,
-            verified_on=datetime.datetime.now(),
-            payment_method='upi'
-        )
-        Investment.objects.create(
-            created_by=user_profile.user,
-            user=user_profile.user,
-            amount=amount,
-            investment_type='p2pmb',
-            pay_method='new',
-            gst=0,
-            is_approved=True,
-            approved_by=request.user,
-            approved_on=datetime.datetime.now(),
-        )
-        ManualFund.objects.create(
-            created_by=user_profile.user,
-            added_to=user_profile.user,
-            amount=amount
-        )
+        with db_transaction.atomic():
+            wallet, _ = UserWallet.objects.get_or_create(user=user_profile.user)
+            post_wallet(wallet, {'main_wallet_balance': amount}, 'deposit')
+
+            Transaction.objects.create(
+                created_by=user_profile.user,
+                sender=user_profile.user,
+                receiver=user_profile.user,
+                amount=amount,
+                transaction_type='deposit',
+                transaction_status='approved',
+                verified_by=request.user,
+                verified_on=datetime.datetime.now(),
+                payment_method='upi'
+            )
+            Investment.objects.create(
+                created_by=user_profile.user,
+                user=user_profile.user,
+                amount=amount,
+                investment_type='p2pmb',
+                pay_method='new',
+                gst=0,
+                is_approved=True,
+                approved_by=request.user,
+                approved_on=datetime.datetime.now(),
+            )
+            ManualFund.objects.create(
+                created_by=user_profile.user,
+                added_to=user_profile.user,
+                amount=amount
+            )
         return Response({'message': 'Fund Deduct successfully.'}, status=status.HTTP_200_OK)
 
 
@@ -332,27 +338,27 @@ class DeductManualInvestmentAPIView(APIView):
             return Response({'error': 'Invalid Payment Type, Please select main_wallet or app_wallet'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        wallet, _ = UserWallet.objects.get_or_create(user=user_profile.user)
-        if wallet_type == 'main_wallet':
-            wallet.main_wallet_balance -= amount
-        elif wallet_type == 'app_wallet':
-            wallet.main_wallet_balance -= amount
-        else:
-            return Response({'error': 'Invalid wallet Type, Please select main_wallet or app_wallet'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        wallet.save()
-
-        Transaction.objects.create(
-            created_by=user_profile.user,
-            sender=user_profile.user, receiver=user_profile.user,
-            amount=amount, transaction_type='deduct',
-            transaction_status='approved', verified_by=request.user,
-            verified_on=datetime.datetime.now(), payment_method='wallet', remarks='Amount Deducted by Admin.'
-        )
-        ManualFund.objects.create(
-            created_by=self.request.user, added_to=user_profile.user,
-            amount=amount, fund_type='deduct'
-        )
+        with db_transaction.atomic():
+            wallet, _ = UserWallet.objects.get_or_create(user=user_profile.user)
+            if wallet_type == 'main_wallet':
+                post_wallet(wallet, {'main_wallet_balance': -amount}, 'adjustment')
+            elif wallet_type == 'app_wallet':
+                post_wallet(wallet, {'main_wallet_balance': -amount}, 'adjustment')
+            else:
+                return Response({'error': 'Invalid wallet Type, Please select main_wallet or app_wallet'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            Transaction.objects.create(
+                created_by=user_profile.user,
+                sender=user_profile.user, receiver=user_profile.user,
+                amount=amount, transaction_type='deduct',
+                transaction_status='approved', verified_by=request.user,
+                verified_on=datetime.datetime.now(), payment_method='wallet', remarks='Amount Deducted by Admin.'
+            )
+            ManualFund.objects.create(
+                created_by=self.request.user, added_to=user_profile.user,
+                amount=amount, fund_type='deduct'
+            )
         return Response({'message': 'Fund Deduct successfully.'}, status=status.HTTP_200_OK)
 
 
@@ -624,21 +630,16 @@ class ManualFundGraphAPIView(APIView):
             start_date = date(current_year, month, 1)
             end_date = today if month == today.month else (start_date.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
             all_dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-            funds = Investment.objects.filter(date_created__date__range=[start_date, end_date],
-                                              investment_type='p2pmb', package__isnull=False,
-                                              is_approved=True, pay_method='main_wallet')
             # funds = ManualFund.objects.filter(date_created__date__range=[start_date, end_date])
-            funds_dict = {entry['date_created__date']: entry['total_amount'] for entry in funds.values('date_created__date').annotate(total_amount=Sum('amount'))}
+            funds_dict = get_finance_totals('fund', group_by='date', applicable_for='p2pmb',
+                                            date__range=[start_date, end_date])
             data = [{"date": date, "total_amount": funds_dict.get(date, 0)} for date in all_dates]
 
         elif filter_type == 'month_wise':
             months = range(1, 13)
             # funds = ManualFund.objects.filter(date_created__year=current_year).values('date_created__month').annotate(
             #     total_amount=Sum('amount'))
-            funds = Investment.objects.filter(date_created__year=current_year, investment_type='p2pmb',
-                                              package__isnull=False, is_approved=True, pay_method='main_wallet'
-                                              ).values('date_created__month').annotate(total_amount=Sum('amount'))
-            funds_dict = {entry['date_created__month']: entry['total_amount'] for entry in funds}
+            funds_dict = get_finance_totals('fund', year=current_year, group_by='date__month', applicable_for='p2pmb')
             data = [{"month": month, "total_amount": funds_dict.get(month, 0)} for month in months]
 
         elif filter_type == 'quarterly':
@@ -648,14 +649,12 @@ class ManualFundGraphAPIView(APIView):
                 'Q3 (Jul-Sep)': (7, 9),
                 'Q4 (Oct-Dec)': (10, 12)
             }
+            funds_dict = get_finance_totals('fund', year=current_year, group_by='date__month', applicable_for='p2pmb')
             for quarter, (start_month, end_month) in quarters.items():
                 # total = ManualFund.objects.filter(date_created__year=current_year,
                 #                                   date_created__month__gte=start_month,
                 #                                   date_created__month__lte=end_month).aggregate(Sum('amount'))['amount__sum'] or 0
-                total = Investment.objects.filter(date_created__year=current_year, date_created__month__gte=start_month,
-                                                  date_created__month__lte=end_month, investment_type='p2pmb',
-                                                  package__isnull=False, is_approved=True, pay_method='main_wallet'
-                                                  ).values('date_created__month').aggregate(Sum('amount'))['amount__sum'] or 0
+                total = sum(funds_dict.get(month, 0) for month in range(start_month, end_month + 1))
                 data.append({"quarter": quarter, "total_amount": total})
 
         elif filter_type == 'half_yearly':
@@ -663,22 +662,18 @@ class ManualFundGraphAPIView(APIView):
                 'H1 (Jan-Jun)': (1, 6),
                 'H2 (Jul-Dec)': (7, 12)
             }
+            funds_dict = get_finance_totals('fund', year=current_year, group_by='date__month', applicable_for='p2pmb')
             for half, (start_month, end_month) in halves.items():
                 # total = ManualFund.objects.filter(date_created__year=current_year,
                 #                                   date_created__month__gte=start_month,
                 #                                   date_created__month__lte=end_month).aggregate(Sum('amount'))['amount__sum'] or 0
-                total = Investment.objects.filter(date_created__year=current_year, date_created__month__gte=start_month,
-                                                  date_created__month__lte=end_month, investment_type='p2pmb',
-                                                  package__isnull=False, is_approved=True, pay_method='main_wallet'
-                                                  ).values('date_created__month').aggregate(Sum('amount'))['amount__sum'] or 0
+                total = sum(funds_dict.get(month, 0) for month in range(start_month, end_month + 1))
                 data.append({"half_year": half, "total_amount": total})
 
         elif filter_type == 'yearly':
             for year in range(current_year - 1, current_year + 1):
                 # total = ManualFund.objects.filter(date_created__year=year).aggregate(Sum('amount'))['amount__sum'] or 0
-                total = Investment.objects.filter(date_created__year=year, investment_type='p2pmb',
-                                                  package__isnull=False, is_approved=True, pay_method='main_wallet'
-                                                  ).values('date_created__month').aggregate(Sum('amount'))['amount__sum'] or 0
+                total = get_finance_totals('fund', year=year, group_by='applicable_for').get('p2pmb', 0)
                 data.append({"year": year, "total_amount": total})
 
         return Response({"filter_type": filter_type, "data": data})
@@ -694,139 +689,80 @@ class ManualFundDistributionAPIView(APIView):
         month = int(month) if month else None
         year = int(year) if year else None
 
-        filters = {}
-        investment_filter = {'applicable_for': 'p2pmb'}
-
-        if month:
-            filters['date_created__month'] = month
-            investment_filter['initiated_date__month'] = month
-        if year:
-            filters['date_created__year'] = year
-            investment_filter['initiated_date__year'] = year
+        total_fund = get_finance_totals('fund', month, year, group_by='applicable_for').get('p2pmb') or Decimal(0)
 
-        total_fund = Investment.objects.filter(
-            **filters, investment_type='p2pmb', package__isnull=False, is_approved=True, pay_method='main_wallet'
-        ).distinct().aggregate(total_amount=Sum('amount'))['total_amount'] or Decimal(0)
-
-        fund_initiated = CompanyInvestment.objects.filter(**investment_filter)
+        fund_initiated = get_finance_totals('company_investment', month, year, applicable_for='p2pmb')
+        income = {
+            source: get_finance_totals(source, month, year)
+            for source in ('commission', 'reward', 'royalty', 'core_income', 'interest', 'company_investment')
+        }
 
         distribution = {
             "direct_income": {
                 "name": "Direct Income",
                 "expected_spending": Decimal("4.5"),
-                "sum_field": "amount",
-                "model": Commission,
-                "filter": lambda m, y: {
-                    "commission_type": "direct",
-                    **({"date_created__month": m} if m else {}),
-                    **({"date_created__year": y} if y else {}),
-                },
+                "source": "commission",
+                "category": "direct",
             },
             "level": {
                 "name": "Level Income",
                 "expected_spending": Decimal("4.5"),
-                "model": Commission,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "commission_type": "level",
-                    **({"date_created__month": m} if m else {}),
-                    **({"date_created__year": y} if y else {}),
-                },
+                "source": "commission",
+                "category": "level",
             },
             "reward": {
                 "name": "Reward",
                 "expected_spending": Decimal("2"),
-                "model": RewardEarned,
-                "sum_field": "reward__gift_amount",
-                "filter": lambda m, y: {
-                    **({"earned_at__month": m} if m else {}),
-                    **({"earned_at__year": y} if y else {}),
-                },
+                "source": "reward",
+                "category": "",
             },
             "royalty": {
                 "name": "Royalty",
                 "expected_spending": Decimal("1"),
-                "model": RoyaltyEarned,
-                "sum_field": "earned_amount",
-                "filter": lambda m, y: {
-                    **({"earned_date__month": m} if m else {}),
-                    **({"earned_date__year": y} if y else {}),
-                },
+                "source": "royalty",
+                "category": "",
             },
             "core_team": {
                 "name": "Core Team",
                 "expected_spending": Decimal("1"),
-                "model": CoreIncomeEarned,
-                "sum_field": "income_earned",
-                "filter": lambda m, y: {
-                    **({"date_created__month": m} if m else {}),
-                    **({"date_created__year": y} if y else {}),
-                },
+                "source": "core_income",
+                "category": "",
             },
             "company_extra_expenses": {
                 "name": "Company Extra Expenses",
                 "expected_spending": Decimal("3"),
-                "model": CompanyInvestment,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "investment_type": "company_expense",
-                    **({"initiated_date__month": m} if m else {}),
-                    **({"initiated_date__year": y} if y else {}),
-                },
+                "source": "company_investment",
+                "category": "company_expense",
             },
             "diwali_gift": {
                 "name": "Diwali Gift",
                 "expected_spending": Decimal("3"),
-                "model": CompanyInvestment,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "investment_type": "diwali_gift",
-                    **({"initiated_date__month": m} if m else {}),
-                    **({"initiated_date__year": y} if y else {}),
-                },
+                "source": "company_investment",
+                "category": "diwali_gift",
             },
             "donate": {
                 "name": "Donation",
                 "expected_spending": Decimal("1"),
-                "model": CompanyInvestment,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "investment_type": "donate",
-                    **({"initiated_date__month": m} if m else {}),
-                    **({"initiated_date__year": y} if y else {}),
-                },
+                "source": "company_investment",
+                "category": "donate",
             },
             "interest": {
                 "name": "Interest",
                 "expected_spending": Decimal("20"),
-                "model": InvestmentInterest,
-                "sum_field": "interest_amount",
-                "filter": lambda m, y: {
-                    **({"interest_send_date__month": m} if m else {}),
-                    **({"interest_send_date__year": y} if y else {}),
-                },
+                "source": "interest",
+                "category": "",
             },
             "properties": {
                 "name": "Property Investment",
                 "expected_spending": Decimal("50"),
-                "model": CompanyInvestment,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "investment_type": "property",
-                    **({"initiated_date__month": m} if m else {}),
-                    **({"initiated_date__year": y} if y else {}),
-                },
+                "source": "company_investment",
+                "category": "property",
             },
             "crypto": {
                 "name": "Crypto",
                 "expected_spending": Decimal("10"),
-                "model": CompanyInvestment,
-                "sum_field": "amount",
-                "filter": lambda m, y: {
-                    "investment_type": "crypto",
-                    **({"initiated_date__month": m} if m else {}),
-                    **({"initiated_date__year": y} if y else {}),
-                },
+                "source": "company_investment",
+                "category": "crypto",
             },
         }
 
@@ -835,15 +771,9 @@ class ManualFundDistributionAPIView(APIView):
         for key, cfg in distribution.items():
             expected_spending = (total_fund * cfg["expected_spending"] / Decimal(100)).quantize(Decimal("0.01"))
 
-            investment_amount = fund_initiated.filter(investment_type=key
-                                                      ).aggregate(total=Sum('amount'))['total'] or Decimal(0)
+            investment_amount = fund_initiated.get(key) or Decimal(0)
 
-            income_model = cfg["model"]
-            model_filter = cfg["filter"](month, year)
-
-            commission_amount = income_model.objects.filter(**model_filter).aggregate(
-                total=Sum(cfg["sum_field"])
-            )['total'] or Decimal(0)
+            commission_amount = income[cfg["source"]].get(cfg["category"]) or Decimal(0)
 
             total_spend_amount = (investment_amount + commission_amount).quantize(Decimal("0.01"))
             total_spend_per = ((total_spend_amount / total_fund) * 100).quantize(Decimal("0.01")) if total_fund else Decimal("0.00")
@@ -872,41 +802,14 @@ class ManualFundDistributionAgencyAPIView(APIView):
         month = int(month) if month else None
         year = int(year) if year else None
 
-        filters = {}
-        if applicable_for == 'super_agency':
-            investment_filter = {'applicable_for': 'super_agency'}
-        elif applicable_for == 'agency':
-            investment_filter = {'applicable_for': 'agency'}
-        elif applicable_for == 'field_agent':
-            investment_filter = {'applicable_for': 'field_agent'}
-        else:
+        if applicable_for not in ('super_agency', 'agency', 'field_agent'):
             return Response({'message': 'Invalid Filter'}, status=status.HTTP_400_BAD_REQUEST)
-        commission_filter = {}
-
-        if month:
-            filters['date_created__month'] = month
-            investment_filter['initiated_date__month'] = month
-            commission_filter['date_created__month'] = month
-        if year:
-            filters['date_created__year'] = year
-            investment_filter['initiated_date__year'] = year
-            commission_filter['date_created__year'] = year
-
-        if applicable_for == 'super_agency':
-            total_fund = Investment.objects.filter(**filters, investment_type='super_agency', package__isnull=False,
-                                                   is_approved=True, pay_method='main_wallet').distinct().aggregate(
-                total_amount=Sum('amount'))['total_amount'] or Decimal(0)
-        elif applicable_for == 'agency':
-            total_fund = Investment.objects.filter(**filters, investment_type='agency', package__isnull=False,
-                                                   is_approved=True, pay_method='main_wallet').distinct().aggregate(
-                total_amount=Sum('amount'))['total_amount'] or Decimal(0)
-        elif applicable_for == 'field_agent':
-            total_fund = Investment.objects.filter(**filters, investment_type='field_agent', package__isnull=False,
-                                                   is_approved=True, pay_method='main_wallet').distinct().aggregate(
-                total_amount=Sum('amount'))['total_amount'] or Decimal(0)
-
-        fund_initiated = CompanyInvestment.objects.filter(**investment_filter)
-        commissions = Commission.objects.filter(**commission_filter)
+
+        total_fund = get_finance_totals('fund', month, year, group_by='applicable_for').get(
+            applicable_for) or Decimal(0)
+
+        fund_initiated = get_finance_totals('company_investment', month, year, applicable_for=applicable_for)
+        commissions = get_finance_totals('commission', month, year)
 
         key_to_investment_type = {
             "direct_income": "direct",
@@ -935,15 +838,11 @@ class ManualFundDistributionAgencyAPIView(APIView):
             investment_type = key_to_investment_type.get(key)
             expected_spending = (total_fund * config["expected_spending"] / Decimal(100)).quantize(Decimal("0.01"))
 
-            investment_amount = fund_initiated.filter(
-                investment_type=investment_type
-            ).aggregate(total=Sum('amount'))['total'] or Decimal(0)
+            investment_amount = fund_initiated.get(investment_type) or Decimal(0)
 
             commission_amount = Decimal(0)
             if key in ['direct_income', 'level', 'reward', 'royalty']:
-                commission_amount = commissions.filter(
-                    commission_type=investment_type
-                ).aggregate(total=Sum('amount'))['total'] or Decimal(0)
+                commission_amount = commissions.get(investment_type) or Decimal(0)
 
             total_spend_amount = (investment_amount + commission_amount).quantize(Decimal("0.01"))
             total_spend_per = ((total_spend_amount / total_fund) * 100).quantize(Decimal("0.01")) if (
@@ -1078,14 +977,9 @@ class UserWiseFundDistributionAPIView(APIView):
         if not user_account:
             return Response({'message': 'User not enrolled in P2PMB Model.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_fund = Investment.objects.filter(
-            user__id=id, investment_type='p2pmb', package__isnull=False,
-            is_approved=True, pay_method='main_wallet'
-        ).aggregate(total_amount=Sum('amount'))['total_amount'] or Decimal(0)
-
-        total_fund = Decimal(total_fund)
+        total_fund = get_finance_totals('fund', group_by='applicable_for', user_id=id).get('p2pmb') or Decimal(0)
 
-        commissions = Commission.objects.filter(commission_to__id=id)
+        commissions = get_finance_totals('commission', user_id=id)
 
         key_to_investment_type = {
             "direct_income": "direct",
@@ -1125,9 +1019,7 @@ class UserWiseFundDistributionAPIView(APIView):
 
             commission_amount = Decimal(0)
             if key in ['direct_income', 'level', 'reward', 'royalty']:
-                commission_amount = commissions.filter(
-                    commission_type=investment_type
-                ).aggregate(total=Sum('amount'))['total'] or Decimal(0)
+                commission_amount = commissions.get(investment_type) or Decimal(0)
 
             total_spend_amount = (investment_amount + commission_amount).quantize(Decimal("0.01"))
             total_spend_per = ((total_spend_amount / total_fund) * Decimal(100)).quantize(
@@ -1173,15 +1065,9 @@ class CompanyLiabilityStatsAPIView(APIView):
             for item in user_investments
         }
 
-        referrals = MLMTree.objects.filter(is_show=True).values_list('referral_by_id', 'child_id')
-        referral_map = defaultdict(list)
-        for referral_by_id, child_id in referrals:
-            referral_map[referral_by_id].append(child_id)
-
-        working_ids = {
-            user_id for user_id in investment_map
-            if len(referral_map.get(user_id, [])) >= 2
-        }
+        working_ids = set(
+            MLMTree.objects.filter(is_working_id=True).values_list('child_id', flat=True)
+        ) & investment_map.keys()
 
         if filter_type == 'working':
             filtered_user_ids = working_ids
@@ -1344,11 +1230,7 @@ class UserWithWorkingIDListView(ListAPIView):
             )
 
         if is_working_id in ['true', 'True', '1', 'false', 'False', '0']:
-            working_ids = self._get_working_ids()
-            if is_working_id.lower() in ['true', '1']:
-                queryset = queryset.filter(child_id__in=working_ids)
-            else:
-                queryset = queryset.exclude(child_id__in=working_ids)
+            queryset = queryset.filter(is_working_id=is_working_id.lower() in ['true', '1'])
 
         if sort_order == 'asc':
             queryset = queryset.order_by('id')
@@ -1356,29 +1238,6 @@ class UserWithWorkingIDListView(ListAPIView):
             queryset = queryset.order_by('-id')
         return queryset
 
-    def _get_working_ids(self):
-        investments = Investment.objects.filter(status='active', investment_type='p2pmb', is_approved=True,
-                                                package__isnull=False, pay_method='main_wallet'
-        ).select_related('user').values('user_id').annotate(total_amount=Sum('amount'))
-
-        investment_map = {item['user_id']: item['total_amount'] for item in investments}
-
-        referrals = MLMTree.objects.filter(is_show=True).select_related('referral_by', 'child').values_list(
-            'referral_by_id', 'child_id')
-        referral_map = {}
-        for referral_by_id, child_id in referrals:
-            referral_map.setdefault(referral_by_id, []).append(child_id)
-
-        working_ids = set()
-        for user_id, user_investment in investment_map.items():
-            if user_investment == 0:
-                continue
-            referral_ids = referral_map.get(user_id, [])
-            if len(referral_ids) >= 2:
-                working_ids.add(user_id)
-
-        return working_ids
-
 
 class WithdrawDashboard(APIView):
     permission_classes = [IsStaffUser]
@@ -1980,64 +1839,29 @@ class GetAppDashboardAggregate(APIView):
     permission_classes = [IsStaffUser]
 
     def get(self, request):
-        user = request.query_params.get("user_id", None)
-        if not user:
+        user_id = request.query_params.get("user_id", None)
+        if not user_id:
             return Response({'message': 'User ID is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        user = User.objects.filter(id=user_id).last()
+        if not user:
+            return Response({'message': 'User does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
 
         referrals = MLMTree.objects.filter(is_show=True, referral_by=user).count()
         total_team_count = get_downline_count(user)
-        investments = Investment.objects.filter(
-            status='active', package__isnull=False, investment_type='p2pmb', user=user
-        )
-        latest_investment = investments.aggregate(total=Sum('amount'))['total'] or Decimal(0)
-        latest_amount = latest_investment if latest_investment else Decimal('0.0')
-        total_return_amount = latest_amount * Decimal('4.4' if referrals >= 2 else '2.1')
-
-        commission_agg = Commission.objects.filter(status='active', commission_to=user).aggregate(
-            total=Sum('amount'),
-            level_total=Sum('amount', filter=Q(commission_type='level')),
-            direct_total=Sum('amount', filter=Q(commission_type='direct'))
-        )
-        commission_amount = commission_agg['total'] or 0
-        level_income = commission_agg['level_total'] or 0
-        direct_income = commission_agg['direct_total'] or 0
-
-        earned_reward = RewardEarned.objects.filter(
-            status='active', user=user, reward__applicable_for='p2pmb'
-        ).aggregate(total=Sum('reward__gift_amount'))['total'] or 0
-
-        roi_interest = InvestmentInterest.objects.filter(
-            status='active', investment__user=user
-        ).aggregate(total=Sum('interest_amount'))['total'] or 0
-
-        royalty_earned = RoyaltyEarned.objects.filter(
-            status='active', is_paid=True, user=user
-        ).aggregate(total=Sum('earned_amount'))['total'] or 0
-
-        core_group_income = CoreIncomeEarned.objects.filter(
-            status='active', user=user
-        ).aggregate(total=Sum('income_earned'))['total'] or 0
-
-        extra_income = ExtraRewardEarned.objects.filter(
-            status='active', user=user
-        ).aggregate(total=Sum('amount'))['total'] or 0
-
-        total_earning = (
-            commission_amount + earned_reward + roi_interest + royalty_earned + core_group_income + extra_income
-        )
+        summary = UserEarningsSummary.for_user(user.id)
 
         data = {
             'total_team_member': total_team_count,
-            'total_earning': total_earning,
-            'total_id_value': total_return_amount,
+            'total_earning': summary.total_earning,
+            'total_id_value': summary.id_value_cap,
             'total_direct_user_count': referrals,
-            'direct_income': direct_income,
-            'level_income': level_income,
-            'royalty_income': royalty_earned,
-            'reward_income': earned_reward,
-            'extra_reward_income': extra_income,
-            'core_group_income': core_group_income,
-            'total_top_up_count': investments.count(),
+            'direct_income': summary.direct_income,
+            'level_income': summary.level_income,
+            'royalty_income': summary.royalty_income,
+            'reward_income': summary.reward_income,
+            'extra_reward_income': summary.extra_reward_income,
+            'core_group_income': summary.core_group_income,
+            'total_top_up_count': summary.top_up_count,
         }
         return Response(data, status=status.HTTP_200_OK)
 
@@ -2243,11 +2067,13 @@ class SendExtraRewardAPIView(APIView):
         if is_already_earned:
             return Response({'message': 'User Already earned this extra reward.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        ExtraRewardEarned.objects.create(
-            created_by=self.request.user, extra_reward=get_extra_reward,
-            user=get_user, amount=amount,
-            description=description or f'Congratulation! You earned extra reward worth {amount}'
-        )
+        with db_transaction.atomic():
+            extra_reward_earned = ExtraRewardEarned.objects.create(
+                created_by=self.request.user, extra_reward=get_extra_reward,
+                user=get_user, amount=amount,
+                description=description or f'Congratulation! You earned extra reward worth {amount}'
+            )
+            record_earnings([extra_reward_earned])
 
         Transaction.objects.create(
             sender=get_user, receiver=get_user, amount=amount, transaction_type='reward',
@@ -2285,24 +2111,27 @@ class SendRewardAPIView(APIView):
         if is_already_earned:
             return Response({'message': 'User Already earned this reward.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        RewardEarned.objects.create(
-            created_by=self.request.user, reward=get_reward, user=get_user, turnover_at_earning=get_reward.gift_amount,
-            description=description or f'Congratulation! You earned reward worth {get_reward.gift_amount}',
-            earned_at=datetime.datetime.now().today().replace(day=1), is_paid=True, is_p2p=True,
-            total_month=get_reward.total_paid_month,
-            last_payment_send=datetime.datetime.now().today().replace(day=1), total_installment_paid=get_reward.total_paid_month-1
-        )
+        with db_transaction.atomic():
+            reward_earned = RewardEarned.objects.create(
+                created_by=self.request.user, reward=get_reward, user=get_user,
+                turnover_at_earning=get_reward.gift_amount,
+                description=description or f'Congratulation! You earned reward worth {get_reward.gift_amount}',
+                earned_at=datetime.datetime.now().today().replace(day=1), is_paid=True, is_p2p=True,
+                total_month=get_reward.total_paid_month,
+                last_payment_send=datetime.datetime.now().today().replace(day=1),
+                total_installment_paid=get_reward.total_paid_month-1
+            )
+            record_earnings([reward_earned])
 
-        wallet, _ = UserWallet.objects.get_or_create(user=get_user)
-        wallet.app_wallet_balance += get_reward.gift_amount
-        wallet.save()
+            wallet, _ = UserWallet.objects.get_or_create(user=get_user)
+            post_wallet(wallet, {'app_wallet_balance': get_reward.gift_amount}, 'reward', source_id=reward_earned.id)
 
-        Transaction.objects.create(
-            sender=get_user, receiver=get_user, amount=get_reward.gift_amount, transaction_type='reward',
-            transaction_status='approved',
-            payment_method='wallet', verified_by=self.request.user, verified_on=datetime.datetime.now(),
-            remarks=f'Congratulation! You earned reward worth {get_reward.gift_amount}'
-        )
+            Transaction.objects.create(
+                sender=get_user, receiver=get_user, amount=get_reward.gift_amount, transaction_type='reward',
+                transaction_status='approved',
+                payment_method='wallet', verified_by=self.request.user, verified_on=datetime.datetime.now(),
+                remarks=f'Congratulation! You earned reward worth {get_reward.gift_amount}'
+            )
 
         return Response({'message': 'Reward send successfully.'}, status=status.HTTP_200_OK)
 
@@ -2370,18 +2199,12 @@ class GetAllTopUpList(APIView):
         )
         extra_map = {e["user"]: e["total"] or Decimal(0) for e in extras}
 
-        working_ids = (
-            MLMTree.objects.values("referral_by").annotate(total=Count("id"))
-        )
-        working_map = {w["referral_by"]: w["total"] for w in working_ids}
-
         data = []
         for user in users:
             child_id = user.child.id
             total_invested_amount = investment_map.get(child_id, Decimal(0))
 
-            check_working_id = working_map.get(child_id, 0)
-            if check_working_id >= 2:
+            if user.is_working_id:
                 is_working_id = True
                 total_return_amount = total_invested_amount * Decimal("4.4")
             else: